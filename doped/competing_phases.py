@@ -1,20 +1,37 @@
 import contextlib
 import copy
+import functools
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path, PurePath
 import warnings
-from pymatgen.ext.matproj import MPRester
+from xml.etree import ElementTree as ET
+
+import numpy as np
+from scipy.optimize import linprog
+from monty.io import zopen
+from monty.serialization import dumpfn, loadfn
 from pymatgen.analysis.phase_diagram import PhaseDiagram, PDEntry
 from pymatgen.io.vasp.sets import DictSet, BadInputSetWarning
 from pymatgen.io.vasp.inputs import Kpoints, UnknownPotcarWarning
-from pymatgen.io.vasp.outputs import Vasprun
 from pymatgen.core import Structure, Composition, Element
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 import json
 import pandas as pd
 
+from doped.entry_providers import MPEntryProvider
+from doped.kpoints import get_kpoint_meshes
+from doped.stability_region import StabilityRegion
+
 warnings.filterwarnings("ignore", category=BadInputSetWarning)
 warnings.filterwarnings("ignore", message="You are using the legacy MPRester")
 
+# parsed vasprun.xml data, keyed by file content hash (most recently parsed last, and
+# limited to _VASPRUN_ENERGIES_CACHE_SIZE entries)
+_vasprun_energies_cache = {}
+_VASPRUN_ENERGIES_CACHE_SIZE = 1024
+
 
 class CompetingPhases:
     """
@@ -22,15 +39,36 @@ class CompetingPhases:
     molecules
     """
 
-    def __init__(self, system, e_above_hull=0.02, api_key=None):
+    def __init__(
+        self,
+        system,
+        e_above_hull=0.02,
+        api_key=None,
+        entry_provider=None,
+        processes=1,
+        molecule_box_size=30,
+        molecule_bond_lengths=None,
+    ):
         """
         Args:
             system (list): Chemical system under investigation, e.g. ['Mg', 'O']
             e_above_hull (float): Maximum considered energy above hull
             api_key (str): Materials Project Legacy API key
+            entry_provider: Source of the MP entries, with a get_entries_in_chemsys() method
+                (see doped.entry_providers). Set to a LocalEntryStore to run offline, or a
+                CachedEntryProvider to reuse queries. If None (default), the Materials
+                Project is queried with MPEntryProvider(api_key).
+            processes (int): Number of worker processes to symmetrise the MP structures with.
+                Default is 1 (serial). If more than 1, scripts must be guarded with
+                `if __name__ == "__main__":` on platforms which spawn worker processes (macOS
+                and Windows).
+            molecule_box_size (float): Box length (in Å) for the gaseous elements calculated
+                as molecules in a box (see molecules_in_a_box).
+            molecule_bond_lengths (dict): Bond lengths (in Å) of the molecules in a box, to
+                override the registry values, e.g. {"O2": 1.21}.
         """
         # create list of entries
-        molecules_in_a_box = ["H2", "O2", "N2", "F2", "Cl2"]
+        molecule_bond_lengths = molecule_bond_lengths or {}
         # all data collected from materials project
         self.data = [
             "pretty_formula",
@@ -54,28 +92,69 @@ class CompetingPhases:
         # is instead imported from mp_api.client (which will also need to be added as a doped
         # requirement) with a new API key, and 'e_above_hull' is now 'energy_above_hull`
 
-        if api_key:
-            m = MPRester(api_key=api_key)
-        else:
-            m = MPRester()
+        if entry_provider is None:
+            entry_provider = MPEntryProvider(api_key=api_key)
 
-        self.entries = m.get_entries_in_chemsys(
+        self.entries = entry_provider.get_entries_in_chemsys(
             self.system, inc_structure=stype, property_data=self.data
         )
         self.entries = [
             e for e in self.entries if e.data["e_above_hull"] <= e_above_hull
         ]
 
-        competing_phases = []
-        # check that none of the elemental ones aren't on the naughty list
+        # skip duplicate entries (same data and structure fingerprint) before any symmetry
+        # analysis
+        unique_entries = []
+        entry_fingerprints = set()
         for e in self.entries:
-            sym = SpacegroupAnalyzer(e.structure)
-            struc = sym.get_primitive_standard_structure()
+            if e.data["pretty_formula"] in molecules_in_a_box:
+                fingerprint = (e.data["pretty_formula"],)  # all replaced by the same molecule
+            else:
+                fingerprint = (
+                    e.data["pretty_formula"],
+                    e.data["formation_energy_per_atom"],
+                    e.data["nsites"],
+                    e.data["e_above_hull"],
+                    e.data["total_magnetization"],
+                    e.data["band_gap"],
+                    _get_structure_fingerprint(e.structure),
+                )
+            if fingerprint not in entry_fingerprints:
+                entry_fingerprints.add(fingerprint)
+                unique_entries.append(e)
+
+        # symmetrise (in parallel) the remaining non-molecule structures
+        structures_to_symmetrise = [
+            e.structure
+            for e in unique_entries
+            if e.data["pretty_formula"] not in molecules_in_a_box
+        ]
+        processes = min(processes or 1, len(structures_to_symmetrise))
+        if processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                symmetrised = list(
+                    executor.map(_get_primitive_standard_structure, structures_to_symmetrise)
+                )
+        else:
+            symmetrised = [
+                _get_primitive_standard_structure(structure)
+                for structure in structures_to_symmetrise
+            ]
+        symmetrised = iter(symmetrised)
+
+        # make sure it's only unique competing phases, by their fingerprints (formula,
+        # properties, space group and structure fingerprint of the symmetrised structure)
+        self.competing_phases = []
+        phase_fingerprints = set()
+        for e in unique_entries:
+            # check that none of the elemental ones aren't on the naughty list
             if e.data["pretty_formula"] in molecules_in_a_box:
                 struc, formula, magnetisation = make_molecule_in_a_box(
-                    e.data["pretty_formula"]
+                    e.data["pretty_formula"],
+                    box_size=molecule_box_size,
+                    bond_length=molecule_bond_lengths.get(e.data["pretty_formula"]),
                 )
-                competing_phases.append(
+                self.competing_phases.append(
                     {
                         "structure": struc,
                         "formula": formula,
@@ -88,26 +167,25 @@ class CompetingPhases:
                 )
 
             else:
-                competing_phases.append(
-                    {
-                        "structure": struc,
-                        "formula": e.data["pretty_formula"],
-                        "formation_energy": e.data["formation_energy_per_atom"],
-                        "nsites": e.data["nsites"],
-                        "ehull": e.data["e_above_hull"],
-                        "magnetisation": e.data["total_magnetization"],
-                        "molecule": False,
-                        "band_gap": e.data["band_gap"],
-                    }
+                struc, space_group_number = next(symmetrised)
+                competing_phase = {
+                    "structure": struc,
+                    "formula": e.data["pretty_formula"],
+                    "formation_energy": e.data["formation_energy_per_atom"],
+                    "nsites": e.data["nsites"],
+                    "ehull": e.data["e_above_hull"],
+                    "magnetisation": e.data["total_magnetization"],
+                    "molecule": False,
+                    "band_gap": e.data["band_gap"],
+                }
+                fingerprint = (
+                    space_group_number,
+                    *[v for k, v in competing_phase.items() if k != "structure"],
+                    _get_structure_fingerprint(struc),
                 )
-
-        # remove make sure it's only unique competing phases
-        self.competing_phases = []
-        [
-            self.competing_phases.append(x)
-            for x in competing_phases
-            if x not in self.competing_phases
-        ]
+                if fingerprint not in phase_fingerprints:
+                    phase_fingerprints.add(fingerprint)
+                    self.competing_phases.append(competing_phase)
 
     def convergence_setup(
         self,
@@ -116,9 +194,19 @@ class CompetingPhases:
         potcar_functional=None,
         user_potcar_settings=None,
         user_incar_settings=None,
+        batch_size=None,
+        energy_tol=1e-3,
+        state_file="competing_phases/kpoint_convergence.json",
+        threads=None,
+        manifest_file="competing_phases/manifest.json",
     ):
         """
-        Sets up input files for kpoints convergence testing
+        Sets up input files for kpoints convergence testing. Kpoint densities giving the same
+        mesh are only set up once (at the lowest density). If batch_size is set, only the first
+        batch_size meshes of each phase are written, and KpointConvergencePlanner.update()
+        (e.g. KpointConvergencePlanner.from_file(state_file).update()) can be run once these
+        have finished, to parse the energies and write the next batch of meshes for only the
+        phases which have not yet converged.
         Args:
             kpoints_metals (tuple): Kpoint density per inverse volume (Å-3) to be tested in
             (min, max, step) format for metals
@@ -129,16 +217,18 @@ class CompetingPhases:
             user_incar_settings (dict): Override the default INCAR settings e.g. {"EDIFF": 1e-5,
             "LDAU": False}. Note that any flags that aren't numbers or True/False need to be input
             as strings with quotation marks (e.g. `{"ALGO": "All"}`).
+            batch_size (int): Number of kpoint meshes to write for each phase at a time. Default
+            is to write all meshes.
+            energy_tol (float): Energy tolerance (in eV/atom) for convergence, i.e. a mesh is
+            converged when the energy of the next (denser) mesh differs by less than this.
+            state_file (str): File to save the convergence state to (to be resumed with
+            KpointConvergencePlanner.from_file()). Set to None to not save.
+            threads (int): Number of threads to write the input files with.
+            manifest_file (str): Json file to record the written calculations in (set to None
+            to not write a manifest).
         Returns:
-            writes input files
+            KpointConvergencePlanner (and writes input files)
         """
-        # by default uses pbesol, but easy to switch to pbe or
-        # pbe+u by using user_incar_settings
-        # user incar settings applies the same settings so both
-        file = str(Path(__file__).parent.joinpath("PBEsol_config.json"))
-        with open(file) as f:
-            cd = json.load(f)
-
         # kpoints should be set as (min, max, step)
         min_nm, max_nm, step_nm = kpoints_nonmetals
         min_m, max_m, step_m = kpoints_metals
@@ -157,61 +247,51 @@ class CompetingPhases:
                     f"{e['formula']} is a molecule in a box, does not need convergence testing"
                 )
 
-        for e in self.nonmetals:
+        # by default uses pbesol, but easy to switch to pbe or
+        # pbe+u by using user_incar_settings
+        # user incar settings applies the same settings so both
+        phases = {}
+        for e in self.nonmetals + self.metals:
             if user_incar_settings is not None:
                 uis = copy.deepcopy(user_incar_settings)
             else:
                 uis = {}
-            if e["magnetisation"] > 1:  # account for magnetic moment
-                if "ISPIN" not in uis:
-                    uis["ISPIN"] = 2
-
-            for kpoint in range(min_nm, max_nm, step_nm):
-                dis = DictSet(
-                    e["structure"],
-                    cd,
-                    user_potcar_functional=potcar_functional,
-                    user_potcar_settings=user_potcar_settings,
-                    user_kpoints_settings={"reciprocal_density": kpoint},
-                    user_incar_settings=uis,
-                    force_gamma=True,
-                )
-
-                kname = "k" + ",".join(str(k) for k in dis.kpoints.kpts[0])
-                fname = "competing_phases/{}_EaH_{}/kpoint_converge/{}".format(
-                    e["formula"], float(f"{e['ehull']:.4f}"), kname
-                )
-                dis.write_input(fname)
-
-        for e in self.metals:
-            if user_incar_settings is not None:
-                uis = copy.deepcopy(user_incar_settings)
+            if e in self.metals:
+                # change the ismear and sigma for metals
+                uis["ISMEAR"] = -5
+                uis["SIGMA"] = 0.2
+                kpoint_densities = range(min_m, max_m, step_m)
             else:
-                uis = {}
-            # change the ismear and sigma for metals
-            uis["ISMEAR"] = -5
-            uis["SIGMA"] = 0.2
-
+                kpoint_densities = range(min_nm, max_nm, step_nm)
             if e["magnetisation"] > 1:  # account for magnetic moment
                 if "ISPIN" not in uis:
                     uis["ISPIN"] = 2
 
-            for kpoint in range(min_m, max_m, step_m):
-                dis = DictSet(
-                    e["structure"],
-                    cd,
-                    user_potcar_functional=potcar_functional,
-                    user_potcar_settings=user_potcar_settings,
-                    user_kpoints_settings={"reciprocal_density": kpoint},
-                    user_incar_settings=uis,
-                    force_gamma=True,
-                )
+            path = "competing_phases/{}_EaH_{}/kpoint_converge".format(
+                e["formula"], float(f"{e['ehull']:.4f}")
+            )
+            phases[path] = {
+                "formula": e["formula"],
+                "structure": e["structure"],
+                "user_incar_settings": uis,
+                "rungs": _get_kpoint_ladder(e["structure"], kpoint_densities),
+                "converged_kpoints": None,
+            }
 
-                kname = "k" + ",".join(str(k) for k in dis.kpoints.kpts[0])
-                fname = "competing_phases/{}_EaH_{}/kpoint_converge/{}".format(
-                    e["formula"], float(f"{e['ehull']:.4f}"), kname
-                )
-                dis.write_input(fname)
+        planner = KpointConvergencePlanner(
+            phases,
+            potcar_functional=potcar_functional,
+            user_potcar_settings=user_potcar_settings,
+            batch_size=batch_size,
+            energy_tol=energy_tol,
+            state_file=state_file,
+            threads=threads,
+            manifest_file=manifest_file,
+        )
+        planner.write_next_rungs()
+        if state_file is not None:
+            planner.to_file()
+        return planner
 
     def vasp_std_setup(
         self,
@@ -220,9 +300,12 @@ class CompetingPhases:
         potcar_functional=None,
         user_potcar_settings=None,
         user_incar_settings=None,
+        threads=None,
+        manifest_file="competing_phases/manifest.json",
     ):
         """
-        Sets up input files for vasp_std relaxations
+        Sets up input files for vasp_std relaxations. POTCARs are only generated once for each
+        unique set of POTCAR symbols, and the files are written in parallel (with threads).
         Args:
             kpoints_metals (int): Kpoint density per inverse volume (Å-3) for metals
             kpoints_nonmetals (int): Kpoint density per inverse volume (Å-3) for nonmetals
@@ -231,12 +314,14 @@ class CompetingPhases:
             user_incar_settings (dict): Override the default INCAR settings e.g. {"EDIFF": 1e-5,
             "LDAU": False}. Note that any flags that aren't numbers or True/False need to be input
             as strings with quotation marks (e.g. `{"ALGO": "All"}`).
+            threads (int): Number of threads to write the input files with.
+            manifest_file (str): Json file to record the written calculations in (set to None
+            to not write a manifest).
         Returns:
-            saves to file
+            saves to file, and returns the manifest of written calculations
         """
-        file = str(Path(__file__).parent.joinpath("HSE06_config_relax.json"))
-        with open(file) as f:
-            cd = json.load(f)
+        cd = _load_config("HSE06_config_relax.json")
+        input_sets = []
 
         # separate metals, non-metals and molecules
         self.nonmetals = []
@@ -251,7 +336,15 @@ class CompetingPhases:
                 else:
                     self.metals.append(e)
 
-        for e in self.nonmetals:
+        # kpoint meshes of all (non-)metals at once
+        nonmetal_meshes = get_kpoint_meshes(
+            [e["structure"] for e in self.nonmetals], reciprocal_density=kpoints_nonmetals
+        )["meshes"]
+        metal_meshes = get_kpoint_meshes(
+            [e["structure"] for e in self.metals], reciprocal_density=kpoints_metals
+        )["meshes"]
+
+        for e, mesh in zip(self.nonmetals, nonmetal_meshes):
             if user_incar_settings is not None:
                 uis = copy.deepcopy(user_incar_settings)
             else:
@@ -264,7 +357,7 @@ class CompetingPhases:
                 e["structure"],
                 cd,
                 user_potcar_functional=potcar_functional,
-                user_kpoints_settings={"reciprocal_density": kpoints_nonmetals},
+                user_kpoints_settings=Kpoints.gamma_automatic(kpts=mesh.tolist()),
                 user_incar_settings=uis,
                 user_potcar_settings=user_potcar_settings,
                 force_gamma=True,
@@ -273,9 +366,9 @@ class CompetingPhases:
             fname = "competing_phases/{}_EaH_{}/vasp_std".format(
                 e["formula"], float(f"{e['ehull']:.4f}")
             )
-            dis.write_input(fname)
+            input_sets.append((dis, {fname: None}))
 
-        for e in self.metals:
+        for e, mesh in zip(self.metals, metal_meshes):
             if user_incar_settings is not None:
                 uis = copy.deepcopy(user_incar_settings)
             else:
@@ -292,7 +385,7 @@ class CompetingPhases:
                 e["structure"],
                 cd,
                 user_potcar_functional=potcar_functional,
-                user_kpoints_settings={"reciprocal_density": kpoints_metals},
+                user_kpoints_settings=Kpoints.gamma_automatic(kpts=mesh.tolist()),
                 user_incar_settings=uis,
                 user_potcar_settings=user_potcar_settings,
                 force_gamma=True,
@@ -300,7 +393,7 @@ class CompetingPhases:
             fname = "competing_phases/{}_EaH_{}/vasp_std".format(
                 e["formula"], float(f"{e['ehull']:.4f}")
             )
-            dis.write_input(fname)
+            input_sets.append((dis, {fname: None}))
 
         for e in self.molecules:
 
@@ -314,9 +407,8 @@ class CompetingPhases:
             if e["magnetisation"] > 1:  # account for magnetic moment
                 if "ISPIN" not in uis:
                     uis["ISPIN"] = 2
-                # the molecule set up to set this automatically?
-                if e["formula"] == "O2":
-                    uis["NUPDOWN"] = 2
+                if "NUPDOWN" not in uis:
+                    uis["NUPDOWN"] = e["magnetisation"]
 
             # set up for 2x2x2 kpoints automatically
             dis = DictSet(
@@ -331,7 +423,9 @@ class CompetingPhases:
             fname = "competing_phases/{}_EaH_{}/vasp_std".format(
                 e["formula"], float(f"{e['ehull']:.4f}")
             )
-            dis.write_input(fname)
+            input_sets.append((dis, {fname: None}))
+
+        return _write_vasp_inputs(input_sets, threads=threads, manifest_file=manifest_file)
 
 
 class AdditionalCompetingPhases(CompetingPhases):
@@ -340,21 +434,48 @@ class AdditionalCompetingPhases(CompetingPhases):
     this is the class for you. Will make sure you're only calculating the extra phases
     """
 
-    def __init__(self, system, extrinsic_species, e_above_hull=0.02, api_key=None):
+    def __init__(
+        self,
+        system,
+        extrinsic_species,
+        e_above_hull=0.02,
+        api_key=None,
+        entry_provider=None,
+        processes=1,
+        molecule_box_size=30,
+        molecule_bond_lengths=None,
+    ):
         """
         Args:
             system (list): Chemical system under investigation, e.g. ['Mg', 'O']
             extrinsic_species (str): Dopant species
             e_above_hull (float): Maximum considered energy above hull
             api_key (str): Materials Project Legacy API key
+            entry_provider: Source of the MP entries (see CompetingPhases). If None
+                (default), the Materials Project is queried with MPEntryProvider(api_key).
+            processes (int): Number of worker processes to symmetrise the MP structures with.
+                Default is 1 (serial). If more than 1, scripts must be guarded with
+                `if __name__ == "__main__":` on platforms which spawn worker processes (macOS
+                and Windows).
+            molecule_box_size (float): Box length (in Å) for molecules in a box.
+            molecule_bond_lengths (dict): Bond lengths (in Å) of the molecules in a box, to
+                override the registry values.
         """
+        molecule_kwargs = {
+            "molecule_box_size": molecule_box_size,
+            "molecule_bond_lengths": molecule_bond_lengths,
+        }
         # the competing phases & entries of the OG system
-        super().__init__(system, e_above_hull, api_key)
+        super().__init__(
+            system, e_above_hull, api_key, entry_provider, processes, **molecule_kwargs
+        )
         self.og_competing_phases = copy.deepcopy(self.competing_phases)
         # the competing phases & entries of the OG system + all the additional
         # stuff from the extrinsic species
         system.append(extrinsic_species)
-        super().__init__(system, e_above_hull, api_key)
+        super().__init__(
+            system, e_above_hull, api_key, entry_provider, processes, **molecule_kwargs
+        )
         self.ext_competing_phases = copy.deepcopy(self.competing_phases)
 
         # only keep the ones that are actually new
@@ -364,6 +485,228 @@ class AdditionalCompetingPhases(CompetingPhases):
                 self.competing_phases.append(ext)
 
 
+def _get_kpoint_ladder(structure, kpoint_densities):
+    """
+    Kpoint meshes (as generated by DictSet with force_gamma=True) for each of
+    kpoint_densities, skipping densities which give the same mesh as a lower density.
+    """
+    kpoint_densities = [int(kpoint) for kpoint in kpoint_densities]
+    meshes = get_kpoint_meshes(
+        [structure] * len(kpoint_densities), reciprocal_density=kpoint_densities
+    )["meshes"]
+    rungs = []
+    knames = set()
+    for kpoint, kpts in zip(kpoint_densities, meshes):
+        kname = "k" + ",".join(str(k) for k in kpts)
+        if kname not in knames:
+            knames.add(kname)
+            rungs.append(
+                {"kname": kname, "reciprocal_density": int(kpoint), "written": False,
+                 "energy_per_atom": None, "skipped": False}
+            )
+    return rungs
+
+
+class KpointConvergencePlanner:
+    """
+    Plans kpoint convergence tests for competing phases: the unique kpoint meshes ("rungs")
+    of each phase are written in batches, and the energies of finished rungs are parsed to
+    stop once the energy (per atom) has converged to within energy_tol, so only the meshes
+    needed are set up and calculated.
+
+    The state (phases, meshes, energies and settings) is saved to a json state file, so
+    convergence testing can be resumed in a later session with
+    KpointConvergencePlanner.from_file(state_file).update(). Meshes which have failed (or
+    otherwise won't finish) can be marked with skip_rung(), so they don't hold up the
+    next meshes of the phase.
+    """
+
+    def __init__(
+        self,
+        phases,
+        potcar_functional=None,
+        user_potcar_settings=None,
+        batch_size=None,
+        energy_tol=1e-3,
+        state_file=None,
+        threads=None,
+        manifest_file=None,
+    ):
+        """
+        Args:
+            phases (dict): Dictionary of {path: phase}, where path is the directory to write
+                the kpoint meshes of the phase to (as subdirectories named by mesh, e.g.
+                "k4,4,4") and phase is a dict with "formula", "structure",
+                "user_incar_settings", "rungs" (list of dicts with "kname",
+                "reciprocal_density", "written", "energy_per_atom" and "skipped", ordered by
+                density)
+                and "converged_kpoints" (kname of the converged mesh, or None) keys, as
+                generated by CompetingPhases.convergence_setup().
+            potcar_functional (str): POTCAR to use
+            user_potcar_settings (dict): Override the default POTCARs
+            batch_size (int): Number of kpoint meshes to write for each phase at a time. Default
+                is to write all meshes.
+            energy_tol (float): Energy tolerance (in eV/atom) for convergence.
+            state_file (str): File to save the state to.
+            threads (int): Number of threads to write the input files with.
+            manifest_file (str): Json file to record the written calculations in.
+        """
+        self.phases = phases
+        self.potcar_functional = potcar_functional
+        self.user_potcar_settings = user_potcar_settings
+        self.batch_size = batch_size
+        self.energy_tol = energy_tol
+        self.state_file = state_file
+        self.threads = threads
+        self.manifest_file = manifest_file
+
+    @property
+    def converged_kpoints(self):
+        """Dictionary of {path: kname of the converged mesh} for the converged phases."""
+        return {
+            path: phase["converged_kpoints"]
+            for path, phase in self.phases.items()
+            if phase["converged_kpoints"] is not None
+        }
+
+    @property
+    def unconverged_phases(self):
+        """Paths of the phases which have not yet converged."""
+        return [path for path, phase in self.phases.items() if phase["converged_kpoints"] is None]
+
+    def skip_rung(self, path, kname):
+        """
+        Mark the kpoint mesh kname of the phase at path as skipped (e.g. if its calculation
+        failed, or won't finish), so that it is ignored when checking for convergence and no
+        longer stops the next meshes of the phase from being written.
+        """
+        for rung in self.phases[path]["rungs"]:
+            if rung["kname"] == kname:
+                rung["skipped"] = True
+                return
+        raise ValueError(f"No kpoint mesh {kname} for the phase at {path}")
+
+    def write_next_rungs(self):
+        """
+        Write the next batch of kpoint meshes for each unconverged phase, if all of its
+        written meshes have finished or been skipped (or none have been written yet).
+
+        Returns:
+            List of the directories written.
+        """
+        cd = _load_config("PBEsol_config.json")
+        input_sets = []
+        written_rungs = []
+        for path, phase in self.phases.items():
+            if phase["converged_kpoints"] is not None or any(
+                rung["written"] and rung["energy_per_atom"] is None and not rung.get("skipped")
+                for rung in phase["rungs"]
+            ):
+                continue
+            next_rungs = [
+                rung for rung in phase["rungs"] if not (rung["written"] or rung.get("skipped"))
+            ]
+            if not next_rungs:
+                continue
+            next_rungs = next_rungs[: self.batch_size]
+            meshes = get_kpoint_meshes(
+                [phase["structure"]] * len(next_rungs),
+                reciprocal_density=[rung["reciprocal_density"] for rung in next_rungs],
+            )["meshes"]
+            for rung, mesh in zip(next_rungs, meshes):
+                # one DictSet per mesh, so INCAR settings which depend on the kpoints (e.g. the
+                # ISMEAR = -5 -> 0 fallback for fewer than 4 kpoints) are set for each rung
+                dis = DictSet(
+                    phase["structure"],
+                    cd,
+                    user_potcar_functional=self.potcar_functional,
+                    user_kpoints_settings=Kpoints.gamma_automatic(kpts=mesh.tolist()),
+                    user_potcar_settings=self.user_potcar_settings,
+                    user_incar_settings=phase["user_incar_settings"],
+                    force_gamma=True,
+                )
+                input_sets.append((dis, {f"{path}/{rung['kname']}": None}))
+                written_rungs.append(rung)
+
+        manifest = _write_vasp_inputs(
+            input_sets, threads=self.threads, manifest_file=self.manifest_file
+        )
+        for rung in written_rungs:
+            rung["written"] = True
+        return list(manifest)
+
+    def update(self):
+        """
+        Parse the energies of finished kpoint meshes (with a vasprun.xml(.gz) file), check
+        for convergence, write the next batch of meshes for the unconverged phases and save
+        the state file (if set).
+
+        Returns:
+            List of the directories written.
+        """
+        for path, phase in self.phases.items():
+            if phase["converged_kpoints"] is not None:
+                continue
+            rungs = [rung for rung in phase["rungs"] if not rung.get("skipped")]
+            for rung in rungs:
+                if not rung["written"] or rung["energy_per_atom"] is not None:
+                    continue
+                for vasprun_file in ["vasprun.xml", "vasprun.xml.gz"]:
+                    vasprun_path = os.path.join(path, rung["kname"], vasprun_file)
+                    if os.path.exists(vasprun_path):
+                        try:
+                            rung["energy_per_atom"] = _parse_vasprun_energies(vasprun_path)[
+                                "output"
+                            ]["final_energy_per_atom"]
+                        except (ET.ParseError, ValueError):  # calculation not finished
+                            pass
+                        break
+
+            # converged at the first mesh for which the next (not skipped) mesh has an energy
+            # within energy_tol (once all less dense meshes have finished)
+            for rung, next_rung in zip(rungs, rungs[1:]):
+                if rung["energy_per_atom"] is None or next_rung["energy_per_atom"] is None:
+                    break
+                if abs(next_rung["energy_per_atom"] - rung["energy_per_atom"]) < self.energy_tol:
+                    phase["converged_kpoints"] = rung["kname"]
+                    break
+
+            if phase["converged_kpoints"] is None and all(
+                rung["energy_per_atom"] is not None for rung in rungs
+            ):
+                warnings.warn(
+                    f"Kpoint convergence to within {self.energy_tol} eV/atom was not reached "
+                    f"for {phase['formula']} ({path}) with the densest mesh tested."
+                )
+
+        written = self.write_next_rungs()
+        if self.state_file is not None:
+            self.to_file()
+        return written
+
+    def to_file(self, filename=None):
+        """Save the convergence state to a json file (default: self.state_file)."""
+        filename = filename or self.state_file
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        dumpfn(
+            {
+                "phases": self.phases,
+                "potcar_functional": self.potcar_functional,
+                "user_potcar_settings": self.user_potcar_settings,
+                "batch_size": self.batch_size,
+                "energy_tol": self.energy_tol,
+                "threads": self.threads,
+                "manifest_file": self.manifest_file,
+            },
+            filename,
+        )
+
+    @classmethod
+    def from_file(cls, filename):
+        """Load the convergence state saved with to_file()."""
+        return cls(state_file=filename, **loadfn(filename))
+
+
 # separate class for read from file with this as base class? can still use different init?
 class CompetingPhasesAnalyzer:
     """
@@ -374,21 +717,32 @@ class CompetingPhasesAnalyzer:
         """
         Args:
             system (str): The  'reduced formula' of the bulk composition
-            extrinsic_species (str): Dopant species
+            extrinsic_species (str or list): Dopant species, or list of dopant species
         """
 
         self.bulk_composition = Composition(system)
         self.elemental = [str(c) for c in self.bulk_composition.elements]
         if extrinsic_species is not None:
-            self.elemental.append(extrinsic_species)
+            if isinstance(extrinsic_species, str):
+                self.elemental.append(extrinsic_species)
+            else:
+                self.elemental.extend(extrinsic_species)
             self.extrinsic_species = extrinsic_species
 
     def from_vaspruns(
-        self, path, folder="vasp_std", csv_fname="competing_phases_energies.csv"
+        self,
+        path,
+        folder="vasp_std",
+        csv_fname="competing_phases_energies.csv",
+        processes=1,
+        cache_file=None,
     ):
         """
         Reads in vaspruns, collates energies to csv. It isn't the best at removing higher energy
-        elemental phases (if multiple are present), so double check that
+        elemental phases (if multiple are present), so double check that.
+        Only the composition, final energy and k-point mesh are parsed from each vasprun.xml
+        (so self.vaspruns holds just these entries of the Vasprun.as_dict() output), in
+        parallel, with parsed data cached by file content hash.
         Args:
             path (list, str, pathlib Path): Either a list of strings or Paths to vasprun.xml(.gz)
             files, or a path to the base folder in which you have your
@@ -396,6 +750,13 @@ class CompetingPhasesAnalyzer:
             folder (str): The folder in which vasprun is, only use if you set base path
             (i.e. change to vasp_ncl, relax whatever youve called it)
             csv_fname (str): csv filename
+            processes (int): Number of worker processes to parse vaspruns with. Default is 1
+            (serial parsing). If more than 1, scripts must be guarded with
+            `if __name__ == "__main__":` on platforms which spawn worker processes (macOS and
+            Windows).
+            cache_file (str): json file to store parsed vasprun data in (keyed by file content
+            hash), so that unchanged vaspruns are not re-parsed in later sessions. Default is
+            None (in-memory cache only).
         Returns:
             saves csv with formation energies to file
         """
@@ -453,7 +814,9 @@ class CompetingPhasesAnalyzer:
 
         num = len(self.vasprun_paths)
         print(f"parsing {num} vaspruns, this may take a while")
-        self.vaspruns = [Vasprun(e).as_dict() for e in self.vasprun_paths]
+        self.vaspruns = _parse_vaspruns(
+            self.vasprun_paths, processes=processes, cache_file=cache_file
+        )
         self.elemental_vaspruns = []
         self.data = []
 
@@ -526,13 +889,65 @@ class CompetingPhasesAnalyzer:
                 "supplied csv does not contain the correct headers, cannot read in the data"
             )
 
-    def calculate_chempots(self, csv_fname="chempot_limits.csv"):
+    def _get_elemental_refs(self):
+        """Lowest energy per atom of the elemental phases in self.data, as {Element: energy}"""
+        elemental_refs = {}
+        for d in self.data:
+            comp = Composition(d["formula"])
+            if comp.is_element:
+                energy_per_atom = d["energy_per_fu"] / comp.num_atoms
+                el = comp.elements[0]
+                if el not in elemental_refs or energy_per_atom < elemental_refs[el]:
+                    elemental_refs[el] = energy_per_atom
+        return elemental_refs
+
+    def get_stability_region(self, include_extrinsic=True):
+        """
+        Get the chemical potential stability region of the bulk (see
+        doped.stability_region.StabilityRegion), from the competing phase energies. If
+        include_extrinsic is True, the extrinsic species are added as extra dimensions.
+        """
+        elemental_refs = self._get_elemental_refs()
+        formation_energies = {}
+        for d in self.data:
+            comp = Composition(d["formula"])
+            if not set(comp.elements).issubset(elemental_refs):
+                continue
+            formation_energy = d["energy_per_fu"] - sum(
+                n * elemental_refs[el] for el, n in comp.items()
+            )
+            formula = comp.formula.replace(" ", "")
+            if formula not in formation_energies or formation_energy < formation_energies[formula]:
+                formation_energies[formula] = formation_energy
+
+        elements = None
+        if include_extrinsic and hasattr(self, "extrinsic_species"):
+            elements = (
+                [self.extrinsic_species]
+                if isinstance(self.extrinsic_species, str)
+                else list(self.extrinsic_species)
+            )
+        return StabilityRegion(self.bulk_composition, formation_energies, elements=elements)
+
+    def calculate_chempots(
+        self, csv_fname="chempot_limits.csv", full_sub_approach=False, use_stability_region=True
+    ):
         """
         Calculates chemcial potential limits. For dopant species, it calculates the limiting
         potential based on the intrinsic chemical potentials (i.e. same as
-        `full_sub_approach=False` in pycdt)
+        `full_sub_approach=False` in pycdt), for each dopant separately from the competing
+        phases containing only that dopant (and host elements)
         Args:
             csv_fname (str): name of csv file to which chempot limits are saved
+            full_sub_approach (bool): If True and multiple dopants are set, the dopant
+            chemical potentials are instead coupled through the competing phases containing
+            multiple dopants, by maximising the sum of the dopant chemical potentials at each
+            intrinsic facet with linear programming. Default is False
+            use_stability_region (bool): If True, the intrinsic chemical potential limits are
+            calculated with half-space intersection (doped.stability_region) rather than the
+            convex hull of all intrinsic phases (pymatgen PhaseDiagram), which is faster for
+            high-component systems. Facet names are the host followed by the bounding phases
+            in alphabetical order. Default is True
         Retruns:
             pandas dataframe
         """
@@ -553,24 +968,37 @@ class CompetingPhasesAnalyzer:
                     {"formula": d["formula"], "formation_energy": d["formation_energy"]}
                 )
 
-        self.intrinsic_phase_diagram = PhaseDiagram(
-            pd_entries_intrinsic, map(Element, self.bulk_composition.elements)
-        )
+        if use_stability_region:
+            # raises ValueError if the bulk is not stable
+            self.stability_region = self.get_stability_region(include_extrinsic=False)
+            elemental_refs = {
+                el: energy
+                for el, energy in self._get_elemental_refs().items()
+                if el in self.bulk_composition.elements
+            }
+            chem_lims = self.stability_region.get_chempot_limits(elemental_refs)["facets"]
 
-        # check if it's stable and if not error out
-        if self.bulk_pde not in self.intrinsic_phase_diagram.stable_entries:
-            raise ValueError(
-                f"{self.bulk_composition.reduced_formula} is not stable with respect to "
-                f"competing phases"
+        else:
+            self.intrinsic_phase_diagram = PhaseDiagram(
+                pd_entries_intrinsic, map(Element, self.bulk_composition.elements)
             )
 
-        chem_lims = self.intrinsic_phase_diagram.get_all_chempots(self.bulk_composition)
-        self.intrinsic_chem_limits = {
-            "facets": chem_lims,
-            "elemental_refs": {
+            # check if it's stable and if not error out
+            if self.bulk_pde not in self.intrinsic_phase_diagram.stable_entries:
+                raise ValueError(
+                    f"{self.bulk_composition.reduced_formula} is not stable with respect to "
+                    f"competing phases"
+                )
+
+            chem_lims = self.intrinsic_phase_diagram.get_all_chempots(self.bulk_composition)
+            elemental_refs = {
                 elt: ent.energy_per_atom
                 for elt, ent in self.intrinsic_phase_diagram.el_refs.items()
-            },
+            }
+
+        self.intrinsic_chem_limits = {
+            "facets": chem_lims,
+            "elemental_refs": elemental_refs,
             "facets_wrt_el_refs": {},
         }
 
@@ -600,28 +1028,20 @@ class CompetingPhasesAnalyzer:
 
         if hasattr(self, "extrinsic_species"):
             print(f"Calculating chempots for {self.extrinsic_species}")
-            for e in extrinsic_formation_energies:
-                for el in self.elemental:
-                    e[el] = Composition(e["formula"]).as_dict()[el]
-
-            # gets the df into a slightly more convenient dict
-            cpd = df.to_dict(orient="records")
-            mins = []
-            mins_formulas = []
-            df3 = pd.DataFrame(extrinsic_formation_energies)
-            for i, c in enumerate(cpd):
-                name = f"mu_{self.extrinsic_species}_{i}"
-                df3[name] = df3["formation_energy"]
-                for k, v in c.items():
-                    df3[name] -= df3[k] * v
-                df3[name] /= df3[self.extrinsic_species]
-                # find min at that chempot
-                mins.append(df3[name].min())
-                mins_formulas.append(df3.iloc[df3[name].idxmin()]["formula"])
-
-            df[self.extrinsic_species] = mins
-            col_name = f"{self.extrinsic_species}_limiting_phase"
-            df[col_name] = mins_formulas
+            if isinstance(self.extrinsic_species, str):
+                extrinsic_species = [self.extrinsic_species]
+            else:
+                extrinsic_species = list(self.extrinsic_species)
+
+            mu_dopants, limiting_phases = _get_dopant_chempot_limits(
+                extrinsic_formation_energies,
+                df,
+                extrinsic_species,
+                full_sub_approach=full_sub_approach,
+            )
+            for j, dopant in enumerate(extrinsic_species):
+                df[dopant] = mu_dopants[:, j]
+                df[f"{dopant}_limiting_phase"] = limiting_phases[j]
 
             # 1. work out the formation energies of all dopant competing
             #    phases using the elemental energies
@@ -644,17 +1064,15 @@ class CompetingPhasesAnalyzer:
             }
 
             for i, d in enumerate(df4):
-                key = (
-                    list(self.intrinsic_chem_limits["facets_wrt_el_refs"].keys())[i]
-                    + "-"
-                    + d[col_name]
+                key = "-".join(
+                    [list(self.intrinsic_chem_limits["facets_wrt_el_refs"].keys())[i]]
+                    + [str(d[f"{dopant}_limiting_phase"]) for dopant in extrinsic_species]
                 )
                 new_vals = list(
                     self.intrinsic_chem_limits["facets_wrt_el_refs"].values()
                 )[i]
-                new_vals[Element(f"{self.extrinsic_species}")] = d[
-                    f"{self.extrinsic_species}"
-                ]
+                for dopant in extrinsic_species:
+                    new_vals[Element(dopant)] = d[dopant]
                 cl2["facets_wrt_el_refs"][key] = new_vals
 
             # do the shenanigan to relate the facets to the elemental
@@ -701,69 +1119,241 @@ class CompetingPhasesAnalyzer:
                         print(i["formation_energy"])
 
 
-def make_molecule_in_a_box(element):
+# registry of the gaseous elements which are calculated as diatomic molecules in a box, with
+# their bond lengths (in Å) and magnetisations
+# the bond distances are taken from various sources and *not* thoroughly vetted
+molecules_in_a_box = {
+    "O2": {"bond_length": 1.22, "magnetisation": 2},
+    "N2": {"bond_length": 1.09, "magnetisation": 0},
+    "H2": {"bond_length": 0.74, "magnetisation": 0},
+    "F2": {"bond_length": 1.44, "magnetisation": 0},
+    "Cl2": {"bond_length": 1.99, "magnetisation": 0},
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_molecule_in_a_box(formula, box_size, bond_length):
+    element = Composition(formula).elements[0]
+    centre = box_size / 2
+    return Structure(
+        lattice=[[box_size, 0, 0], [0, box_size, 0], [0, 0, box_size]],
+        species=[element, element],
+        coords=[[centre, centre, centre], [centre, centre, centre + bond_length]],
+        coords_are_cartesian=True,
+    )
+
+
+def make_molecule_in_a_box(element, box_size=30, bond_length=None):
+    """
+    Diatomic molecule of a gaseous element (from the molecules_in_a_box registry) in a cubic
+    box. Structures are cached, so repeated calls (e.g. when screening many chemical systems)
+    only copy them.
+
+    Args:
+        element (str): Formula of the molecule, e.g. "O2".
+        box_size (float): Box length (in Å).
+        bond_length (float): Bond length (in Å). Default is the registry value.
+
+    Returns:
+        structure, formula, magnetisation
+    """
     # (but do try to fix it so that the nupdown is the same as magnetisation
     # so that it makes that assignment easier later on when making files)
-    # the bond distances are taken from various sources and *not* thoroughly vetted
-    lattice = [[30, 0, 0], [0, 30, 0], [0, 0, 30]]
-    all_structures = {
-        "O2": {
-            "structure": Structure(
-                lattice=lattice,
-                species=["O", "O"],
-                coords=[[15, 15, 15], [15, 15, 16.22]],
-                coords_are_cartesian=True,
-            ),
-            "formula": "O2",
-            "magnetisation": 2,
-        },
-        "N2": {
-            "structure": Structure(
-                lattice=lattice,
-                species=["N", "N"],
-                coords=[[15, 15, 15], [15, 15, 16.09]],
-                coords_are_cartesian=True,
-            ),
-            "formula": "N2",
-            "magnetisation": 0,
-        },
-        "H2": {
-            "structure": Structure(
-                lattice=lattice,
-                species=["H", "H"],
-                coords=[[15, 15, 15], [15, 15, 15.74]],
-                coords_are_cartesian=True,
-            ),
-            "formula": "H2",
-            "magnetisation": 0,
-        },
-        "F2": {
-            "structure": Structure(
-                lattice=lattice,
-                species=["F", "F"],
-                coords=[[15, 15, 15], [15, 15, 16.44]],
-                coords_are_cartesian=True,
-            ),
-            "formula": "F2",
-            "magnetisation": 0,
-        },
-        "Cl2": {
-            "structure": Structure(
-                lattice=lattice,
-                species=["Cl", "Cl"],
-                coords=[[15, 15, 15], [15, 15, 16.99]],
-                coords_are_cartesian=True,
-            ),
-            "formula": "Cl2",
-            "magnetisation": 0,
-        },
-    }
-    if element in all_structures.keys():
-        structure = all_structures[element]["structure"]
-        formula = all_structures[element]["formula"]
-        magnetisation = all_structures[element]["magnetisation"]
+    if element not in molecules_in_a_box:
+        raise ValueError(
+            f"{element} is not in the molecule-in-a-box registry: {list(molecules_in_a_box)}"
+        )
+    molecule = molecules_in_a_box[element]
+    if bond_length is None:
+        bond_length = molecule["bond_length"]
+    structure = _get_molecule_in_a_box(element, box_size, bond_length).copy()
 
-    return structure, formula, magnetisation
+    return structure, element, molecule["magnetisation"]
+
+
+def _get_dopant_chempot_limits(
+    extrinsic_formation_energies, host_chempots, extrinsic_species, full_sub_approach=False
+):
+    """
+    Get the limiting chemical potentials of the extrinsic species at each of the intrinsic
+    facets.
+
+    Args:
+        extrinsic_formation_energies (list): list of dicts with "formula" and
+            "formation_energy" (per formula unit, relative to the elemental references) of the
+            competing phases containing extrinsic species
+        host_chempots (pd.DataFrame): intrinsic chemical potentials (relative to the elemental
+            references) with one row per facet and one column per host element
+        extrinsic_species (list): dopant species
+        full_sub_approach (bool): If False, each dopant chemical potential is limited by the
+            competing phases containing only that dopant (and host elements). If True, all
+            extrinsic competing phases are used, with the dopant chemical potentials coupled
+            by phases containing multiple dopants, and their sum maximised by linear
+            programming at each facet.
+
+    Returns:
+        (n_facets, n_dopants) array of dopant chemical potentials, and a list (per dopant) of
+        the limiting phase at each facet.
+    """
+    compositions = [Composition(e["formula"]) for e in extrinsic_formation_energies]
+    formulas = [e["formula"] for e in extrinsic_formation_energies]
+    formation_energies = np.array([e["formation_energy"] for e in extrinsic_formation_energies])
+    host_stoichiometry = np.array(
+        [[comp[el] for el in host_chempots.columns] for comp in compositions]
+    ).reshape(len(compositions), -1)
+    dopant_stoichiometry = np.array(
+        [[comp[el] for el in extrinsic_species] for comp in compositions]
+    ).reshape(len(compositions), -1)
+
+    # formation energy remaining for the dopant content of each phase, at each facet
+    residual_energies = (
+        formation_energies[:, None] - host_stoichiometry @ host_chempots.to_numpy().T
+    )
+    n_facets = residual_energies.shape[1]
+
+    mu_dopants = np.zeros((n_facets, len(extrinsic_species)))
+    limiting_phases = []
+    if not full_sub_approach:
+        n_dopants_in_phase = (dopant_stoichiometry > 0).sum(axis=1)
+        for j, dopant in enumerate(extrinsic_species):
+            phase_idx = np.where((dopant_stoichiometry[:, j] > 0) & (n_dopants_in_phase == 1))[0]
+            if len(phase_idx) == 0:
+                raise ValueError(f"No competing phases found for extrinsic species {dopant}")
+            mu_dopant = residual_energies[phase_idx] / dopant_stoichiometry[phase_idx, j][:, None]
+            min_idx = mu_dopant.argmin(axis=0)
+            mu_dopants[:, j] = mu_dopant[min_idx, np.arange(n_facets)]
+            limiting_phases.append([formulas[i] for i in phase_idx[min_idx]])
+
+        return mu_dopants, limiting_phases
+
+    limiting_phases = [[] for _ in extrinsic_species]
+    for i in range(n_facets):
+        result = linprog(
+            -np.ones(len(extrinsic_species)),
+            A_ub=dopant_stoichiometry,
+            b_ub=residual_energies[:, i],
+            bounds=[(None, 0)] * len(extrinsic_species),
+        )
+        if not result.success:
+            raise ValueError(
+                f"Could not determine the extrinsic chemical potential limits at facet {i}: "
+                f"{result.message}"
+            )
+        mu_dopants[i] = result.x
+        binding = np.isclose(dopant_stoichiometry @ result.x, residual_energies[:, i], atol=1e-6)
+        for j in range(len(extrinsic_species)):
+            binding_idx = np.where(binding & (dopant_stoichiometry[:, j] > 0))[0]
+            limiting_phases[j].append(formulas[binding_idx[0]] if len(binding_idx) else None)
+
+    return mu_dopants, limiting_phases
+
+
+@functools.lru_cache(maxsize=None)
+def _load_config(filename):
+    """Load a VASP input set config json file from the doped directory (cached; DictSet
+    copies the config dict, so it is not modified)."""
+    with open(Path(__file__).parent.joinpath(filename)) as f:
+        return json.load(f)
+
+
+def _write_vasp_inputs(input_sets, threads=None, manifest_file=None, potcar_spec=False):
+    """
+    Write the VASP input files for a batch of calculations. The POTCAR of each unique set of
+    POTCAR symbols (and functional) is only generated once, the INCAR and POSCAR of each input
+    set are only rendered once (even if written to multiple directories, e.g. with different
+    kpoint meshes), and the files are written with a thread pool.
+
+    Args:
+        input_sets (list): List of (DictSet, {output directory: Kpoints}) pairs. Each DictSet
+            is written to each of its output directories, with the given Kpoints (or the
+            DictSet kpoints if None).
+        threads (int): Number of threads to write files with. Default is the ThreadPoolExecutor
+            default.
+        manifest_file (str): Json file to record the written calculations in (merged with any
+            existing manifest), as {output directory: {"formula", "files",
+            "potcar_symbols", "potcar_functional", "kpoints"}}.
+        potcar_spec (bool): Write "POTCAR.spec" files (with the POTCAR symbols) instead of
+            POTCARs.
+
+    Returns:
+        The manifest entries of the written directories.
+    """
+    potcar_strings = {}
+    files_to_write = {}
+    manifest = {}
+    for dis, output_dirs in input_sets:
+        potcar_key = (dis.potcar_functional, tuple(dis.potcar_symbols))
+        if potcar_key not in potcar_strings:
+            potcar_strings[potcar_key] = (
+                "\n".join(dis.potcar_symbols) if potcar_spec else str(dis.potcar)
+            )
+        common_files = {
+            "INCAR": str(dis.incar),
+            "POSCAR": str(dis.poscar),
+            "POTCAR.spec" if potcar_spec else "POTCAR": potcar_strings[potcar_key],
+        }
+        for output_dir, kpoints in output_dirs.items():
+            kpoints = kpoints if kpoints is not None else dis.kpoints
+            files = dict(common_files)
+            if kpoints is not None:
+                files["KPOINTS"] = str(kpoints)
+            files_to_write[output_dir] = files
+            manifest[output_dir] = {
+                "formula": dis.structure.composition.reduced_formula,
+                "files": sorted(files),
+                "potcar_symbols": list(dis.potcar_symbols),
+                "potcar_functional": dis.potcar_functional,
+                "kpoints": [list(kpts) for kpts in kpoints.kpts] if kpoints is not None else None,
+            }
+
+    def _write_files(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        for filename, contents in files_to_write[output_dir].items():
+            with open(os.path.join(output_dir, filename), "w") as f:
+                f.write(contents)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(_write_files, files_to_write))
+
+    if manifest_file is not None:
+        full_manifest = loadfn(manifest_file) if os.path.exists(manifest_file) else {}
+        full_manifest.update(manifest)
+        manifest_dir = os.path.dirname(manifest_file)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        dumpfn(full_manifest, manifest_file, indent=2)
+
+    return manifest
+
+
+def _get_structure_fingerprint(structure, decimals=3):
+    """
+    Canonical hash of structure, independent of the order of its sites and the choice of
+    origin, from its Niggli-reduced lattice parameters and the sorted species and fractional
+    coordinates (rounded to decimals, and relative to each site of the least common species in
+    turn, taking the lexicographically smallest). Structures related by other (non-Niggli)
+    choices of cell, e.g. supercells, have different fingerprints, so should be compared
+    after symmetrisation to a standard cell.
+    """
+    structure = structure.get_reduced_structure(reduction_algo="niggli")
+    species = np.array([site.species_string for site in structure])
+    frac_coords = np.mod(structure.frac_coords, 1)
+    unique_species, counts = np.unique(species, return_counts=True)
+    origin_species = unique_species[np.argmin(counts)]
+
+    def _get_sites(origin):
+        coords = np.mod(np.round(np.mod(frac_coords - origin, 1), decimals), 1) + 0.0
+        return sorted(zip(species.tolist(), map(tuple, coords.tolist())))
+
+    sites = min(_get_sites(origin) for origin in frac_coords[species == origin_species])
+    lattice_parameters = (np.round(structure.lattice.parameters, decimals) + 0.0).tolist()
+    return hashlib.sha256(repr((lattice_parameters, sites)).encode()).hexdigest()
+
+
+def _get_primitive_standard_structure(structure):
+    """Primitive standard structure and space group number of structure."""
+    sym = SpacegroupAnalyzer(structure)
+    return sym.get_primitive_standard_structure(), sym.get_space_group_number()
 
 
 def _calculate_formation_energies(data, elemental):
@@ -779,3 +1369,139 @@ def _calculate_formation_energies(data, elemental):
 
     df["formation_energy"] = df2["formation_energy"]
     return df
+
+
+def _get_file_hash(filename):
+    """sha256 hash of the file contents, used as the key for cached vasprun data."""
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _parse_vasprun_energies(vasprun_path):
+    """
+    Minimal vasprun.xml(.gz) parser, extracting only the composition, final energy and k-point
+    mesh (skipping the DOS, eigenvalues etc. which are parsed by Vasprun), returned in the same
+    format as the corresponding entries of Vasprun.as_dict().
+    """
+    atomic_symbols, kpoints, calculation = [], None, None
+    with zopen(vasprun_path, "rt") as f:
+        for _, elem in ET.iterparse(f):
+            tag = elem.tag
+            if tag == "atominfo":
+                atomic_symbols = [
+                    # vasprun.xml uses X for Xe and r for Zr, as in Vasprun._parse_atominfo
+                    {"X": "Xe", "r": "Zr"}.get(symbol, symbol)
+                    for symbol in (
+                        rc.find("c").text.strip()
+                        for rc in elem.find("array[@name='atoms']/set").findall("rc")
+                    )
+                ]
+                elem.clear()
+            elif tag == "kpoints" and kpoints is None:
+                generation = elem.find("generation")
+                if generation is not None and generation.find("v[@name='divisions']") is not None:
+                    kpoints = [
+                        [int(i) for i in generation.find("v[@name='divisions']").text.split()]
+                    ]
+                else:  # explicit k-points, Vasprun.as_dict() gives the full list
+                    kpoints = [
+                        [float(i) for i in v.text.split()]
+                        for v in elem.find("varray[@name='kpointlist']").findall("v")
+                    ]
+                elem.clear()
+            elif tag == "calculation":
+                calculation = {
+                    i.attrib["name"]: float(i.text) for i in elem.find("energy").findall("i")
+                }
+                escf = elem.findall("scstep")
+                if escf:
+                    calculation["electronic_steps"] = [
+                        {
+                            i.attrib["name"]: float(i.text)
+                            for i in escf[-1].find("energy").findall("i")
+                        }
+                    ]
+                elem.clear()
+            elif tag in {"dos", "eigenvalues", "projected", "dielectricfunction"}:
+                elem.clear()
+
+    if calculation is None:
+        raise ValueError(f"No completed ionic steps found in {vasprun_path}")
+
+    final_energy = calculation["e_0_energy"]
+    if calculation.get("electronic_steps"):
+        # as in Vasprun.final_energy; addresses a bug in the vasprun.xml energies, see
+        # https://www.vasp.at/forum/viewtopic.php?f=3&t=16942
+        final_estep = calculation["electronic_steps"][-1]
+        final_energy_bugfix = np.round(
+            final_estep["e_0_energy"] - final_estep["e_fr_energy"] + calculation["e_fr_energy"],
+            8,
+        )
+        if np.abs(final_energy - final_energy_bugfix) > 1e-7:
+            final_energy = final_energy_bugfix
+
+    unit_cell_formula = {}
+    for symbol in atomic_symbols:
+        unit_cell_formula[symbol] = unit_cell_formula.get(symbol, 0) + 1
+    comp = Composition(unit_cell_formula)
+
+    return {
+        "unit_cell_formula": comp.as_dict(),
+        "reduced_cell_formula": Composition(comp.reduced_formula).as_dict(),
+        "pretty_formula": comp.reduced_formula,
+        "elements": sorted(set(atomic_symbols)),
+        "input": {"kpoints": {"kpoints": kpoints}},
+        "output": {
+            "final_energy": float(final_energy),
+            "final_energy_per_atom": float(final_energy) / len(atomic_symbols),
+        },
+    }
+
+
+def _parse_vaspruns(vasprun_paths, processes=1, cache_file=None):
+    """
+    Parse the composition, final energy and k-point mesh from a list of vasprun.xml(.gz)
+    files, serially or (if processes > 1) with a pool of worker processes (in which case
+    scripts must be guarded with `if __name__ == "__main__":` on platforms which spawn
+    worker processes, i.e. macOS and Windows). Results are cached by file content hash (in
+    memory, for the most recently parsed files, and in the json file cache_file if set), so
+    unchanged calculations are only parsed once. cache_file only stores the results of the
+    calculations parsed with it (along with its existing entries).
+    """
+    file_cache = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        file_cache = loadfn(cache_file)
+
+    hashes = [_get_file_hash(vasprun_path) for vasprun_path in vasprun_paths]
+    to_parse = {
+        file_hash: vasprun_path
+        for file_hash, vasprun_path in zip(hashes, vasprun_paths)
+        if file_hash not in file_cache and file_hash not in _vasprun_energies_cache
+    }
+
+    if to_parse:
+        processes = min(processes or 1, len(to_parse))
+        if processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                parsed = list(executor.map(_parse_vasprun_energies, to_parse.values()))
+        else:
+            parsed = [_parse_vasprun_energies(vasprun_path) for vasprun_path in to_parse.values()]
+        _vasprun_energies_cache.update(zip(to_parse.keys(), parsed))
+
+    results = {
+        file_hash: file_cache[file_hash]
+        if file_hash in file_cache
+        else _vasprun_energies_cache[file_hash]
+        for file_hash in hashes
+    }
+    while len(_vasprun_energies_cache) > _VASPRUN_ENERGIES_CACHE_SIZE:  # drop the oldest
+        del _vasprun_energies_cache[next(iter(_vasprun_energies_cache))]
+
+    if cache_file is not None and any(file_hash not in file_cache for file_hash in results):
+        file_cache.update(results)
+        dumpfn(file_cache, cache_file)
+
+    return [copy.deepcopy(results[file_hash]) for file_hash in hashes]
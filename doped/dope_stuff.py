@@ -9,7 +9,10 @@ with publication-quality outputs
 """
 
 from operator import itemgetter
+import hashlib
+import os
 import pickle
+import re
 from typing import Any
 import warnings
 import numpy as np
@@ -21,8 +24,14 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 from matplotlib import rc
 
+from monty.serialization import dumpfn, loadfn
+from scipy.spatial import HalfspaceIntersection
+from scipy.special import logsumexp
 from tabulate import tabulate
+from pymatgen.analysis.defects.core import DefectEntry, PointDefectComparator
 from pymatgen.analysis.defects.thermodynamics import DefectPhaseDiagram
+from pymatgen.core.units import kb
+from pymatgen.electronic_structure.dos import FermiDos
 from pymatgen.util.string import latexify, unicodeify
 from doped import aide_murphy_correction
 
@@ -67,6 +76,17 @@ def dpd_from_parsed_defect_dict(parsed_defect_dict: dict) -> DefectPhaseDiagram:
     Returns:
         pymatgen DefectPhaseDiagram object (DefectPhaseDiagram)
     """
+    vbm, bandgap = _get_vbm_and_bandgap(parsed_defect_dict)
+    dpd = DefectPhaseDiagram(
+        list(parsed_defect_dict.values()), vbm, bandgap, filter_compatible=False
+    )
+
+    return dpd
+
+
+def _get_vbm_and_bandgap(parsed_defect_dict: dict):
+    """Get the VBM and bandgap of the parsed defect calculations, checking that they are the
+    same for all defects in the dictionary."""
     vbm_vals = []
     bandgap_vals = []
     for defect in parsed_defect_dict.values():
@@ -86,13 +106,813 @@ def dpd_from_parsed_defect_dict(parsed_defect_dict: dict) -> DefectPhaseDiagram:
             f"Are you sure the correct/same bulk files were used with "
             f"SingleDefectParser and/or get_bulk_gap_data()?"
         )
-    vbm = vbm_vals[0]
-    bandgap = bandgap_vals[0]
-    dpd = DefectPhaseDiagram(
-        list(parsed_defect_dict.values()), vbm, bandgap, filter_compatible=False
+    return vbm_vals[0], bandgap_vals[0]
+
+
+def _find_stable_charges_of_defect(defects: list, vbm: float, band_gap: float):
+    """Find the stable charge states and transition levels of a single defect (i.e. a group of
+    DefectEntry objects for the same defect in different charge states), using the same
+    halfspace intersection approach as DefectPhaseDiagram.find_stable_charges().
+
+    Args:
+        defects (list): List of DefectEntry objects for the same defect.
+        vbm (float): VBM energy.
+        band_gap (float): Band gap.
+
+    Returns:
+        Tuple of the transition level map ({transition level: [charges]}), the list of stable
+        entries and the list of finished charges, for this defect.
+    """
+    # The formation energy bounds only need to enclose the lower envelope of this defect's
+    # formation energy lines, so they are taken from this defect alone rather than all defects
+    all_eform = [one_def.formation_energy(fermi_level=band_gap / 2.0) for one_def in defects]
+    limits = [[-1, band_gap + 1], [min(all_eform) - 30, max(all_eform) + 30]]
+
+    # [-Q, 1, -1*(E_form+Q*VBM)] -> -Q*E_fermi+E+-1*(E_form+Q*VBM) <= 0
+    hyperplanes = np.array(
+        [[-1.0 * entry.charge, 1, -1.0 * (entry.energy + entry.charge * vbm)] for entry in defects]
+    )
+    border_hyperplanes = [
+        [-1, 0, limits[0][0]],
+        [1, 0, -1 * limits[0][1]],
+        [0, -1, limits[1][0]],
+        [0, 1, -1 * limits[1][1]],
+    ]
+    hs_hyperplanes = np.vstack([hyperplanes, border_hyperplanes])
+    interior_point = np.array([band_gap / 2, min(all_eform) - 1.0])
+    hs_ints = HalfspaceIntersection(hs_hyperplanes, interior_point)
+
+    # Only include the facets corresponding to entries, not the boundaries, sorted by level
+    ints_and_facets = sorted(
+        (
+            (intersection, facet)
+            for intersection, facet in zip(hs_ints.intersections, hs_ints.dual_facets)
+            if all(np.array(facet) < len(defects))
+        ),
+        key=lambda int_and_facet: int_and_facet[0][0],
     )
 
-    return dpd
+    if ints_and_facets:
+        transition_level_map = {
+            intersection[0]: [defects[i].charge for i in facet]
+            for intersection, facet in ints_and_facets
+        }
+        stable_indices = sorted({i for _, facet in ints_and_facets for i in facet})
+        return (
+            transition_level_map,
+            [defects[i] for i in stable_indices],
+            [defect.charge for defect in defects],
+        )
+
+    if len(defects) == 1:
+        return {}, [defects[0]], [defects[0].charge]
+
+    # only one stable charge state out of several; check it is the lowest energy one at both
+    # ends of the Fermi level range
+    name_set = [one_def.name + "_chg" + str(one_def.charge) for one_def in defects]
+    vb_list = [one_def.formation_energy(fermi_level=limits[0][0]) for one_def in defects]
+    cb_list = [one_def.formation_energy(fermi_level=limits[0][1]) for one_def in defects]
+    vbm_def_index = vb_list.index(min(vb_list))
+    cbm_def_index = cb_list.index(min(cb_list))
+    if name_set[vbm_def_index] != name_set[cbm_def_index]:
+        raise ValueError(
+            f"HalfSpace identified only one stable charge out of list: {name_set}\n"
+            f"But {name_set[vbm_def_index]} is stable below vbm and {name_set[cbm_def_index]} is "
+            f"stable above cbm.\nList of VBM formation energies: {vb_list}\n"
+            f"List of CBM formation energies: {cb_list}"
+        )
+    return {}, [defects[vbm_def_index]], [one_def.charge for one_def in defects]
+
+
+class IncrementalDefectPhaseDiagram(DefectPhaseDiagram):
+    """
+    DefectPhaseDiagram which can be updated in place as new defect calculations are parsed.
+
+    Entries are stored by name (as in the parsed defect dictionary, format: {"defect_name":
+    defect_entry}) and can be added, removed or replaced one at a time. Each update only
+    recomputes the stable charge states and transition levels of the defect that changed,
+    and returns a list of change events (as dicts) describing how they changed:
+
+        {"event": "new_transition_level" / "removed_transition_level" /
+         "shifted_transition_level" / "new_stable_charge" / "removed_stable_charge",
+         "defect": defect name, "track_name": DefectPhaseDiagram defect type name,
+         "charges": (q1, q2) for transition levels or q for stable charges,
+         "level": transition level in eV above the VBM (for transition level events)}
+
+    All standard DefectPhaseDiagram attributes (entries, transition_level_map, stable_entries
+    etc.) are kept up to date, so it can be used with all the dope_stuff analysis and plotting
+    functions. Track names are set when each defect group is first created (matching those of
+    DefectPhaseDiagram for the initial entries), and do not change as entries are added or
+    removed.
+    """
+
+    def __init__(self, entries, vbm, band_gap, filter_compatible=True, metadata=None, keys=None):
+        """
+        Args:
+            entries ([DefectEntry] or dict): A list of DefectEntry objects, or a dictionary of
+                parsed defect calculations (format: {"defect_name": defect_entry}).
+            vbm (float): Valence Band energy to use for all defect entries.
+            band_gap (float): Band gap to use for all defect entries.
+            filter_compatible (bool): Whether to omit entries which have "is_compatible"=False
+                in DefectEntry's parameters. (default: True)
+            metadata (dict): Dictionary of metadata to store with the DefectPhaseDiagram.
+            keys (list): Names to store the entries under, if entries is a list. If not set,
+                the entry names (with charges) are used.
+        """
+        if isinstance(entries, dict):
+            keys = list(entries.keys())
+            entries = list(entries.values())
+        elif keys is None:
+            keys = [f"{entry.name}_{entry.charge}" for entry in entries]
+        self._keys = []
+        self._serials = []  # insertion number of each entry, never reused
+        self._next_serial = 0
+        self._groups = []  # list of lists of indices into self.entries
+        self._group_ids = []  # track name suffixes, fixed when each group is created
+        self._group_results = []
+        self._pdc = PointDefectComparator(
+            check_charge=False, check_primitive_cell=True, check_lattice_scale=False
+        )
+        super().__init__([], vbm, band_gap, filter_compatible=filter_compatible, metadata=metadata)
+        for key, entry in zip(keys, entries):
+            if filter_compatible and not entry.parameters.get("is_compatible", True):
+                continue
+            self._insert_entry(key, entry)
+        # same track names as DefectPhaseDiagram for the initial entries
+        self._group_ids = [
+            "-".join(str(self._serials[i]) for i in sorted(group)) for group in self._groups
+        ]
+        for group_index in range(len(self._groups)):
+            self._update_group(group_index)
+        self._collect_results()
+
+    @classmethod
+    def from_parsed_defect_dict(cls, parsed_defect_dict: dict):
+        """Generates an IncrementalDefectPhaseDiagram from a dictionary of parsed defect
+        calculations (format: {"defect_name": defect_entry}), with the same checks as
+        dpd_from_parsed_defect_dict()."""
+        vbm, bandgap = _get_vbm_and_bandgap(parsed_defect_dict)
+        return cls(parsed_defect_dict, vbm, bandgap, filter_compatible=False)
+
+    def as_dict(self):
+        """
+        Returns:
+            JSON-serializable dict representation of IncrementalDefectPhaseDiagram
+        """
+        d = super().as_dict()
+        d["keys"] = list(self._keys)
+        d["group_ids"] = {
+            self._keys[i]: group_id
+            for group_id, group in zip(self._group_ids, self._groups)
+            for i in group
+        }
+        d["next_serial"] = self._next_serial
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        """Reconstitute an IncrementalDefectPhaseDiagram from a dict created with as_dict()."""
+        entries = [DefectEntry.from_dict(entry_dict) for entry_dict in d.get("entries")]
+        dpd = cls(
+            entries,
+            d["vbm"],
+            d["band_gap"],
+            filter_compatible=d.get("filter_compatible", True),
+            metadata=d.get("metadata", {}),
+            keys=d.get("keys"),
+        )
+        if "group_ids" in d:  # restore the track names
+            dpd._group_ids = [d["group_ids"][dpd._keys[group[0]]] for group in dpd._groups]
+            dpd._next_serial = max(dpd._next_serial, d.get("next_serial", 0))
+            dpd._collect_results()
+        return dpd
+
+    def find_stable_charges(self):
+        """Recompute the stable charges and transition levels of all defects."""
+        for group_index in range(len(self._groups)):
+            self._update_group(group_index)
+        self._collect_results()
+
+    def add_entry(self, key: str, entry) -> list:
+        """Add a new DefectEntry (or replace the entry stored under key), and update the stable
+        charges and transition levels of that defect.
+
+        Args:
+            key (str): Name of the entry (e.g. the folder name of the defect calculation).
+            entry (DefectEntry): Parsed defect calculation.
+
+        Returns:
+            List of change events (dicts).
+        """
+        if key in self._keys:
+            return self.replace_entry(key, entry)
+        if self.filter_compatible and not entry.parameters.get("is_compatible", True):
+            return []
+        group_index = self._insert_entry(key, entry)
+        events = self._update_group(group_index)
+        self._collect_results()
+        return events
+
+    def remove_entry(self, key: str) -> list:
+        """Remove the DefectEntry stored under key, and update the stable charges and
+        transition levels of that defect.
+
+        Returns:
+            List of change events (dicts).
+        """
+        entry_index = self._keys.index(key)
+        group_index = next(g for g, group in enumerate(self._groups) if entry_index in group)
+        old_track_name = self._track_name(group_index)
+        del self._keys[entry_index]
+        del self._serials[entry_index]
+        del self.entries[entry_index]
+        for group in self._groups:
+            group[:] = [i - 1 if i > entry_index else i for i in group if i != entry_index]
+
+        if self._groups[group_index]:
+            events = self._update_group(group_index)
+        else:  # last charge state of this defect removed
+            old_results = self._group_results[group_index]
+            events = self._get_events(old_results, ({}, [], []), old_results[3], old_track_name)
+            del self._groups[group_index]
+            del self._group_ids[group_index]
+            del self._group_results[group_index]
+        self._collect_results()
+        return events
+
+    def replace_entry(self, key: str, entry) -> list:
+        """Replace the DefectEntry stored under key (e.g. with a re-parsed or re-corrected
+        calculation), and update the stable charges and transition levels of that defect.
+
+        Returns:
+            List of change events (dicts).
+        """
+        entry_index = self._keys.index(key)
+        old_group = next(g for g, group in enumerate(self._groups) if entry_index in group)
+        if not self._pdc.are_equal(entry.defect, self.entries[self._groups[old_group][0]].defect):
+            # different defect; remove and re-add
+            return self.remove_entry(key) + self.add_entry(key, entry)
+        self.entries[entry_index] = self._with_vbm(entry)
+        events = self._update_group(old_group)
+        self._collect_results()
+        return events
+
+    def _with_vbm(self, entry):
+        if "vbm" not in entry.parameters.keys() or entry.parameters["vbm"] != self.vbm:
+            entry = entry.copy()
+            entry.parameters["vbm"] = self.vbm
+        return entry
+
+    def _insert_entry(self, key, entry) -> int:
+        """Store an entry and assign it to its defect group, returning the group index."""
+        self._keys.append(key)
+        self._serials.append(self._next_serial)
+        self._next_serial += 1
+        self.entries.append(self._with_vbm(entry))
+        entry_index = len(self.entries) - 1
+        for group_index, group in enumerate(self._groups):
+            if self._pdc.are_equal(entry.defect, self.entries[group[0]].defect):
+                group.append(entry_index)
+                return group_index
+        self._groups.append([entry_index])
+        self._group_ids.append(str(self._serials[entry_index]))
+        self._group_results.append(None)
+        return len(self._groups) - 1
+
+    def _track_name(self, group_index):
+        return self.entries[self._groups[group_index][0]].name + "@" + self._group_ids[group_index]
+
+    def _update_group(self, group_index) -> list:
+        """Recompute the stable charges and transition levels of one defect group, returning
+        the resulting change events."""
+        defects = [self.entries[i] for i in self._groups[group_index]]
+        new_results = _find_stable_charges_of_defect(defects, self.vbm, self.band_gap)
+        old_results = self._group_results[group_index] or ({}, [], [], None)
+        self._group_results[group_index] = (*new_results, defects[0].name)
+        return self._get_events(
+            old_results, new_results, defects[0].name, self._track_name(group_index)
+        )
+
+    @staticmethod
+    def _get_events(old_results, new_results, defect_name, track_name) -> list:
+        def levels_by_charges(tl_map):
+            return {tuple(sorted(charges, reverse=True)): level for level, charges in tl_map.items()}
+
+        old_levels = levels_by_charges(old_results[0])
+        new_levels = levels_by_charges(new_results[0])
+        old_charges = {entry.charge for entry in old_results[1]}
+        new_charges = {entry.charge for entry in new_results[1]}
+        base = {"defect": defect_name, "track_name": track_name}
+
+        events = []
+        for charges, level in new_levels.items():
+            if charges not in old_levels:
+                events.append({"event": "new_transition_level", **base, "charges": charges,
+                               "level": level})
+            elif not np.isclose(level, old_levels[charges]):
+                events.append({"event": "shifted_transition_level", **base, "charges": charges,
+                               "level": level})
+        for charges, level in old_levels.items():
+            if charges not in new_levels:
+                events.append({"event": "removed_transition_level", **base, "charges": charges,
+                               "level": level})
+        for charge in sorted(new_charges - old_charges, reverse=True):
+            events.append({"event": "new_stable_charge", **base, "charges": charge})
+        for charge in sorted(old_charges - new_charges, reverse=True):
+            events.append({"event": "removed_stable_charge", **base, "charges": charge})
+        return events
+
+    def _collect_results(self):
+        """Rebuild the DefectPhaseDiagram attributes from the per-defect results."""
+        self.transition_level_map = {}
+        self.stable_entries = {}
+        self.finished_charges = {}
+        for group_index, (tl_map, stable_entries, finished_charges, _) in enumerate(
+            self._group_results
+        ):
+            track_name = self._track_name(group_index)
+            self.transition_level_map[track_name] = tl_map
+            self.stable_entries[track_name] = stable_entries
+            self.finished_charges[track_name] = finished_charges
+        self.transition_levels = {
+            defect_name: list(defect_tls.keys())
+            for defect_name, defect_tls in self.transition_level_map.items()
+        }
+        self.stable_charges = {
+            defect_name: [entry.charge for entry in entries]
+            for defect_name, entries in self.stable_entries.items()
+        }
+
+
+class DefectTable:
+    """
+    Compact, structure-of-arrays table of parsed defect calculations.
+
+    Holds one row per defect entry (key, defect name, charge, uncorrected energy, each energy
+    correction, multiplicity, composition difference to the bulk (n_bulk - n_defect for each
+    element), VBM, bandgap and bulk volume) as numpy arrays, which is all that is needed for
+    formation energy and concentration analysis. The full DefectEntry objects (with structures,
+    eigenvalues, planar averages etc.) are only held by reference, and are loaded lazily with
+    get_entry() when needed.
+
+    Tables can be saved to / loaded from a columnar file (".npz", or ".parquet" if pyarrow
+    or fastparquet is installed) with to_file() and from_file(). If a blob_dir is given to
+    to_file(), the full DefectEntry objects are written there (as compressed json files, one
+    per entry) and the table file stores the paths to these (relative to the table file, so
+    the folder can be moved).
+    """
+
+    def __init__(
+        self,
+        keys,
+        defect_names,
+        charges,
+        uncorrected_energies,
+        corrections,
+        multiplicities,
+        elements,
+        composition_deltas,
+        vbm,
+        gap,
+        bulk_volumes,
+        defect_paths=None,
+        entry_refs=None,
+    ):
+        """
+        Args:
+            keys (list): Names of the entries (e.g. keys of the parsed defect dictionary).
+            defect_names (list): Defect names (DefectEntry.name).
+            charges (array): Defect charges.
+            uncorrected_energies (array): Uncorrected defect energies (E_defect - E_bulk).
+            corrections (dict): Dictionary of {correction name: array of correction energies}.
+            multiplicities (array): Defect site multiplicities (NaN if not known).
+            elements (list): Element symbols for the columns of composition_deltas.
+            composition_deltas (array): n_entries x n_elements array of the number of atoms of
+                each element in the bulk minus that in the defect supercell.
+            vbm (array): VBM energies (NaN if not set, in which case Fermi levels are absolute).
+            gap (array): Bandgaps.
+            bulk_volumes (array): Volumes of the bulk supercells (in Å^3).
+            defect_paths (list): Paths to the defect calculations (optional).
+            entry_refs (list): References to the full DefectEntry objects, either the objects
+                themselves or paths to json files they were saved to (optional).
+        """
+        self.keys = list(keys)
+        self.defect_names = np.asarray(defect_names, dtype=str)
+        self.charges = np.asarray(charges, dtype=float)
+        self.uncorrected_energies = np.asarray(uncorrected_energies, dtype=float)
+        self.corrections = {
+            name: np.asarray(values, dtype=float) for name, values in corrections.items()
+        }
+        self.multiplicities = np.asarray(multiplicities, dtype=float)
+        self.elements = [str(element) for element in elements]
+        self.composition_deltas = np.asarray(composition_deltas, dtype=float).reshape(
+            len(self.keys), len(self.elements)
+        )
+        self.vbm = np.asarray(vbm, dtype=float)
+        self.gap = np.asarray(gap, dtype=float)
+        self.bulk_volumes = np.asarray(bulk_volumes, dtype=float)
+        self.defect_paths = list(defect_paths) if defect_paths is not None else [""] * len(self)
+        self._entry_refs = list(entry_refs) if entry_refs is not None else [None] * len(self)
+        self._entry_cache = [None] * len(self)  # entries loaded from the paths in _entry_refs
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_parsed_defect_dict(cls, parsed_defect_dict: dict):
+        """Generates a DefectTable from a dictionary of parsed defect calculations (format:
+        {"defect_name": defect_entry}), likely created using SingleDefectParser from
+        doped.pycdt.utils.parse_calculations). The DefectEntry objects themselves are kept by
+        reference (not copied).
+        """
+        entries = list(parsed_defect_dict.values())
+        bulk_compositions = {}  # bulk structure is shared between entries, so only parse once
+        defect_compositions = []
+        for entry in entries:
+            bulk_id = id(entry.defect.bulk_structure)
+            if bulk_id not in bulk_compositions:
+                bulk_compositions[bulk_id] = entry.defect.bulk_structure.composition
+            defect_compositions.append((bulk_compositions[bulk_id], entry.defect.defect_composition))
+
+        elements = sorted(
+            {str(el) for comps in defect_compositions for comp in comps for el in comp.elements}
+        )
+        composition_deltas = np.array(
+            [[bulk_comp[el] - defect_comp[el] for el in elements]
+             for bulk_comp, defect_comp in defect_compositions]
+        ).reshape(len(entries), len(elements))
+
+        correction_names = sorted({name for entry in entries for name in entry.corrections})
+        return cls(
+            keys=list(parsed_defect_dict.keys()),
+            defect_names=[entry.name for entry in entries],
+            charges=[entry.charge for entry in entries],
+            uncorrected_energies=[entry.uncorrected_energy for entry in entries],
+            corrections={
+                name: [entry.corrections.get(name, 0.0) for entry in entries]
+                for name in correction_names
+            },
+            multiplicities=[
+                np.nan if entry.multiplicity is None else entry.multiplicity for entry in entries
+            ],
+            elements=elements,
+            composition_deltas=composition_deltas,
+            vbm=[entry.parameters.get("vbm", np.nan) for entry in entries],
+            gap=[entry.parameters.get("gap", np.nan) for entry in entries],
+            bulk_volumes=[entry.defect.bulk_structure.volume for entry in entries],
+            defect_paths=[entry.parameters.get("defect_path", "") for entry in entries],
+            entry_refs=entries,
+        )
+
+    @property
+    def energies(self):
+        """Corrected defect energies (uncorrected energy + all corrections)."""
+        return self.uncorrected_energies + sum(
+            self.corrections.values(), np.zeros(len(self))
+        )
+
+    def _chempot_vector(self, chemical_potentials):
+        """Chemical potentials as an array ordered as self.elements, with shape (n_elements,)
+        or, if arrays of chemical potentials are given, (n_samples, n_elements)."""
+        if not chemical_potentials:
+            return np.zeros(len(self.elements))
+        chempots = {str(el): mu for el, mu in chemical_potentials.items()}
+        return np.stack(
+            np.broadcast_arrays(
+                *[np.asarray(chempots.get(el, 0.0), dtype=float) for el in self.elements]
+            ),
+            axis=-1,
+        )
+
+    def formation_energies(self, chemical_potentials=None, fermi_level=0.0):
+        """
+        Defect formation energies of all entries, matching DefectEntry.formation_energy().
+
+        Args:
+            chemical_potentials (dict): Dictionary of {Element: chemical potential}. The
+                chemical potentials can also be arrays (of the same length, e.g. sampled
+                over the stability region with StabilityRegion.sample()), in which case the
+                formation energies are returned for each sample (with shape
+                (n_samples, n_entries)). (default: None, all chemical potentials set to zero)
+            fermi_level (float or array): Fermi level(s) relative to the VBM. If an array is
+                given, the formation energies are returned for each Fermi level (with shape
+                (len(fermi_level), n_entries)), or for each sample if arrays of chemical
+                potentials of the same length are given.
+
+        Returns:
+            Array of formation energies.
+        """
+        mu = self._chempot_vector(chemical_potentials)
+        fermi_level = np.asarray(fermi_level, dtype=float)[..., np.newaxis]
+        vbm = np.where(np.isnan(self.vbm), 0.0, self.vbm)
+        return (
+            self.energies + mu @ self.composition_deltas.T + self.charges * (vbm + fermi_level)
+        )
+
+    def defect_concentrations(self, chemical_potentials=None, temperature=300, fermi_level=0.0):
+        """
+        Defect concentrations (in cm^-3) of all entries, matching
+        DefectEntry.defect_concentration().
+        """
+        n = self.multiplicities * 1e24 / self.bulk_volumes
+        return n * np.exp(
+            -self.formation_energies(chemical_potentials, fermi_level) / (kb * temperature)
+        )
+
+    def solve_for_fermi_energies(
+        self,
+        temperature,
+        chemical_potentials,
+        bulk_dos,
+        band_gap: float = None,
+        energy_step: float = 0.005,
+    ):
+        """
+        Solve for the self-consistent Fermi level (relative to the VBM, from charge neutrality
+        between the defects and the free carriers), as in
+        DefectPhaseDiagram.solve_for_fermi_energy(), but vectorised over arrays of chemical
+        potentials (e.g. sampled over the stability region with StabilityRegion.sample()).
+
+        All entries in the table contribute to the defect charge (i.e. the concentrations of
+        all charge states are included, rather than only the lowest energy charge state of
+        each defect). The free carrier concentrations are calculated from the bulk DOS (as
+        with FermiDos.get_doping()) on an energy grid, and interpolated in log space, and the
+        Fermi levels are obtained by bisection (in the range -1 eV to band_gap + 1 eV, as
+        in DefectPhaseDiagram.solve_for_fermi_energy()) for all samples simultaneously.
+
+        Args:
+            temperature (float): Temperature (in K).
+            chemical_potentials (dict): Dictionary of {Element: chemical potential}, where the
+                chemical potentials can be floats or arrays of the same length.
+            bulk_dos (Dos or FermiDos): Bulk density of states (with a structure, as for
+                FermiDos).
+            band_gap (float): Bandgap, to which the bulk DOS is scissored. Default is the
+                bandgap of the entries in the table.
+            energy_step (float): Spacing (in eV) of the energy grid for the free carrier
+                concentrations.
+
+        Returns:
+            Fermi level(s) relative to the VBM (float, or array with one value per sample).
+        """
+        if band_gap is None:
+            band_gap = self.gap[0] if len(self) else np.nan
+            if np.isnan(band_gap):
+                raise ValueError(
+                    "No bandgap is set for the entries in this DefectTable, so band_gap must "
+                    "be given."
+                )
+        if np.any(np.isnan(self.multiplicities)):
+            raise ValueError(
+                "Defect multiplicities are required to calculate defect concentrations, but "
+                "are not set for all entries in this DefectTable."
+            )
+        kt = kb * temperature
+
+        fermi_grid = np.linspace(
+            -1.0, band_gap + 1.0, int(np.ceil((band_gap + 2.0) / energy_step)) + 1
+        )
+        log_holes, log_electrons = _get_log_carrier_concentrations(
+            bulk_dos, band_gap, temperature, fermi_grid
+        )
+
+        # defect concentrations at E_F = 0, summed (in log space) over entries of each charge,
+        # so the defect charge at each Fermi level is sum_q q * exp(log_conc_q - q * E_F / kT)
+        formation_energies = np.atleast_2d(self.formation_energies(chemical_potentials))
+        log_concentrations = (
+            np.log(self.multiplicities * 1e24 / self.bulk_volumes) - formation_energies / kt
+        )
+        charges = np.unique(self.charges[self.charges != 0])
+        log_charge_concentrations = np.array(
+            [
+                logsumexp(log_concentrations[:, self.charges == charge], axis=1)
+                for charge in charges
+            ]
+        ).T.reshape(len(formation_energies), len(charges))
+        log_charge_concentrations += np.log(np.abs(charges))
+
+        def _log_positive_minus_negative_charge(fermi_levels):
+            log_terms = log_charge_concentrations - charges * fermi_levels[:, np.newaxis] / kt
+            log_positive = logsumexp(
+                np.hstack(
+                    [
+                        log_terms[:, charges > 0],
+                        np.interp(fermi_levels, fermi_grid, log_holes)[:, np.newaxis],
+                    ]
+                ),
+                axis=1,
+            )
+            log_negative = logsumexp(
+                np.hstack(
+                    [
+                        log_terms[:, charges < 0],
+                        np.interp(fermi_levels, fermi_grid, log_electrons)[:, np.newaxis],
+                    ]
+                ),
+                axis=1,
+            )
+            return log_positive - log_negative
+
+        # net charge decreases monotonically with the Fermi level
+        lower = np.full(len(formation_energies), -1.0)
+        upper = np.full(len(formation_energies), band_gap + 1.0)
+        while np.max(upper - lower) > 1e-8:
+            mid = (lower + upper) / 2
+            positive = _log_positive_minus_negative_charge(mid) > 0
+            lower = np.where(positive, mid, lower)
+            upper = np.where(positive, upper, mid)
+
+        fermi_levels = (lower + upper) / 2
+        if np.ndim(self._chempot_vector(chemical_potentials)) < 2:
+            return float(fermi_levels[0])
+        return fermi_levels
+
+    def get_entry(self, key):
+        """Get the full DefectEntry for the entry named key, loading it from file if it is
+        stored by path (and caching it, while the table keeps referring to it by path)."""
+        index = self.keys.index(key)
+        entry_ref = self._entry_refs[index]
+        if entry_ref is None:
+            raise ValueError(f"No DefectEntry is stored for {key} in this DefectTable.")
+        if not isinstance(entry_ref, str):
+            return entry_ref
+        if self._entry_cache[index] is None:
+            self._entry_cache[index] = loadfn(entry_ref)
+        return self._entry_cache[index]
+
+    def to_parsed_defect_dict(self) -> dict:
+        """Load all the full DefectEntry objects, as a parsed defect dictionary (format:
+        {"defect_name": defect_entry})."""
+        return {key: self.get_entry(key) for key in self.keys}
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the table as a pandas DataFrame (one row per entry)."""
+        columns = {
+            "key": self.keys,
+            "defect_name": self.defect_names,
+            "charge": self.charges,
+            "uncorrected_energy": self.uncorrected_energies,
+            **{f"correction:{name}": values for name, values in self.corrections.items()},
+            "multiplicity": self.multiplicities,
+            **{
+                f"delta_n:{el}": self.composition_deltas[:, i]
+                for i, el in enumerate(self.elements)
+            },
+            "vbm": self.vbm,
+            "gap": self.gap,
+            "bulk_volume": self.bulk_volumes,
+            "defect_path": self.defect_paths,
+            "entry_ref": [ref if isinstance(ref, str) else "" for ref in self._entry_refs],
+        }
+        return pd.DataFrame(columns)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame):
+        """Generates a DefectTable from a DataFrame created with to_dataframe()."""
+        corrections = {
+            col.split(":", 1)[1]: df[col].to_numpy()
+            for col in df.columns if col.startswith("correction:")
+        }
+        delta_cols = [col for col in df.columns if col.startswith("delta_n:")]
+        return cls(
+            keys=df["key"].tolist(),
+            defect_names=df["defect_name"].to_numpy(),
+            charges=df["charge"].to_numpy(),
+            uncorrected_energies=df["uncorrected_energy"].to_numpy(),
+            corrections=corrections,
+            multiplicities=df["multiplicity"].to_numpy(),
+            elements=[col.split(":", 1)[1] for col in delta_cols],
+            composition_deltas=df[delta_cols].to_numpy(),
+            vbm=df["vbm"].to_numpy(),
+            gap=df["gap"].to_numpy(),
+            bulk_volumes=df["bulk_volume"].to_numpy(),
+            defect_paths=df["defect_path"].tolist(),
+            entry_refs=[ref or None for ref in df["entry_ref"]],
+        )
+
+    def to_file(self, filename: str, blob_dir: str = None) -> None:
+        """
+        Save the table to a columnar ".npz" or ".parquet" file.
+
+        Args:
+            filename (str): Output file name, ending in ".npz" or ".parquet".
+            blob_dir (str): Directory in which to save the full DefectEntry objects (as
+                "{key}.json.gz" files, with characters other than letters, digits, "_", "-"
+                and "." in the key replaced), which the saved table then refers to by path
+                (relative to the table file). If not set, only entries which were already
+                loaded from file are referenced.
+        """
+        if not filename.endswith((".npz", ".parquet")):
+            raise ValueError(f"DefectTable files must end in '.npz' or '.parquet', got {filename}")
+
+        table_dir = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(table_dir, exist_ok=True)
+        entry_refs = []
+        for key, entry_ref in zip(self.keys, self._entry_refs):
+            if entry_ref is not None and not isinstance(entry_ref, str) and blob_dir is not None:
+                os.makedirs(blob_dir, exist_ok=True)
+                blob_path = os.path.join(blob_dir, _get_blob_filename(key))
+                dumpfn(entry_ref, blob_path)
+                entry_ref = blob_path
+            entry_refs.append(
+                os.path.relpath(os.path.abspath(entry_ref), table_dir)
+                if isinstance(entry_ref, str)
+                else ""
+            )
+
+        if filename.endswith(".parquet"):
+            df = self.to_dataframe()
+            df["entry_ref"] = entry_refs
+            df.to_parquet(filename, index=False)
+            return
+
+        correction_names = list(self.corrections)
+        np.savez(
+            filename,
+            keys=np.asarray(self.keys, dtype=str),
+            defect_names=self.defect_names,
+            charges=self.charges,
+            uncorrected_energies=self.uncorrected_energies,
+            correction_names=np.asarray(correction_names, dtype=str),
+            corrections=np.array(
+                [self.corrections[name] for name in correction_names]
+            ).reshape(len(correction_names), len(self)),
+            multiplicities=self.multiplicities,
+            elements=np.asarray(self.elements, dtype=str),
+            composition_deltas=self.composition_deltas,
+            vbm=self.vbm,
+            gap=self.gap,
+            bulk_volumes=self.bulk_volumes,
+            defect_paths=np.asarray(self.defect_paths, dtype=str),
+            entry_refs=np.asarray(entry_refs, dtype=str),
+        )
+
+    @classmethod
+    def from_file(cls, filename: str):
+        """Load a DefectTable saved with to_file(). The full DefectEntry objects are not loaded
+        until requested with get_entry()."""
+        if filename.endswith(".parquet"):
+            table = cls.from_dataframe(pd.read_parquet(filename))
+        else:
+            with np.load(filename, allow_pickle=False) as data:
+                table = cls(
+                    keys=data["keys"].tolist(),
+                    defect_names=data["defect_names"],
+                    charges=data["charges"],
+                    uncorrected_energies=data["uncorrected_energies"],
+                    corrections=dict(zip(data["correction_names"].tolist(), data["corrections"])),
+                    multiplicities=data["multiplicities"],
+                    elements=data["elements"].tolist(),
+                    composition_deltas=data["composition_deltas"],
+                    vbm=data["vbm"],
+                    gap=data["gap"],
+                    bulk_volumes=data["bulk_volumes"],
+                    defect_paths=data["defect_paths"].tolist(),
+                    entry_refs=[ref or None for ref in data["entry_refs"].tolist()],
+                )
+
+        # entry paths are stored relative to the table file
+        table_dir = os.path.dirname(os.path.abspath(filename))
+        table._entry_refs = [
+            os.path.join(table_dir, ref) if isinstance(ref, str) else ref
+            for ref in table._entry_refs
+        ]
+        return table
+
+
+def _get_blob_filename(key: str) -> str:
+    """File name for the saved DefectEntry of the table entry named key, with any characters
+    other than letters, digits, "_", "-" and "." replaced (and a hash of the key appended if
+    so, to keep the names unique)."""
+    filename = re.sub(r"[^\w.-]", "_", key)
+    if filename != key or filename.startswith("."):
+        filename += "_" + hashlib.sha256(key.encode()).hexdigest()[:8]
+    return f"{filename}.json.gz"
+
+
+def _get_log_carrier_concentrations(bulk_dos, band_gap, temperature, fermi_levels):
+    """
+    Natural logs of the free hole and electron concentrations (in cm^-3) at each of
+    fermi_levels (relative to the VBM), calculated as in FermiDos.get_doping().
+    """
+    fdos = bulk_dos if isinstance(bulk_dos, FermiDos) else FermiDos(bulk_dos, bandgap=band_gap)
+    _, fdos_vbm = fdos.get_cbm_vbm()
+    kt = kb * temperature
+    with np.errstate(divide="ignore"):
+        log_states = np.log(np.clip(fdos.tdos * fdos.de, 0, None))
+    log_volume = np.log(fdos.volume * fdos.A_to_cm**3)
+    fermi_levels = np.asarray(fermi_levels)[:, np.newaxis] + fdos_vbm
+
+    vb_energies = fdos.energies[: fdos.idx_vbm + 1]
+    log_holes = logsumexp(
+        log_states[: fdos.idx_vbm + 1] - np.logaddexp(0, (fermi_levels - vb_energies) / kt),
+        axis=1,
+    )
+    cb_energies = fdos.energies[fdos.idx_cbm :]
+    log_electrons = logsumexp(
+        log_states[fdos.idx_cbm :] - np.logaddexp(0, (cb_energies - fermi_levels) / kt),
+        axis=1,
+    )
+    return log_holes - log_volume, log_electrons - log_volume
 
 
 def dpd_transition_levels(defect_phase_diagram: DefectPhaseDiagram):
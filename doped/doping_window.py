@@ -0,0 +1,318 @@
+"""
+Code to optimise the chemical potentials (growth conditions) for doping, over the chemical
+potential stability region of a host.
+
+The stability region is the convex hull of its vertices ("facets" in the chemical potential
+limits dicts from CompetingPhasesAnalyzer, UserChemPotAnalyzer or StabilityRegion), so any
+chemical potentials in the region can be written as a convex combination (weights lambda >= 0,
+summing to 1) of the vertices. At a fixed Fermi level, defect formation energies are linear in
+the chemical potentials (and so in lambda), so the chemical potentials giving the lowest/highest
+formation energy of a defect, or the largest formation energy gap between a dopant and its
+compensating defects (the doping window), are found with a small linear program over lambda.
+"""
+
+import re
+
+import numpy as np
+from pymatgen.core.periodic_table import Element
+from scipy.optimize import linprog
+
+from doped.dope_stuff import DefectTable, _get_log_carrier_concentrations
+from doped.stability_region import StabilityRegion, _get_simplices, _sample_simplices
+
+
+class DopingWindowOptimizer:
+    """
+    Optimise defect formation energies and carrier concentrations over the chemical potential
+    stability region of a host.
+
+    All optimisation methods return a dict of the optimal absolute chemical potentials
+    ("chempots", {Element: mu}), the optimal value of the objective ("objective"), the
+    weights of the vertices (facets) of the stability region giving the optimum
+    ("facet_weights", {facet name: weight}) and the phases in equilibrium with the host at
+    the optimum ("limiting_phases": the host, and each phase bounding a face of the stability
+    region that the optimum lies on). Optima which are combinations of several facets can
+    still lie on a face, e.g. if all of those facets share a limiting phase.
+    """
+
+    def __init__(self, defect_table, chempot_limits, elemental_refs=None):
+        """
+        Args:
+            defect_table (DefectTable or dict): DefectTable, or dictionary of parsed defect
+                calculations (format: {"defect_name": defect_entry}), likely created using
+                SingleDefectParser from doped.pycdt.utils.parse_calculations.
+            chempot_limits (dict or StabilityRegion): Chemical potential limits dict with the
+                absolute chemical potentials of the vertices of the stability region under the
+                "facets" key, as from CompetingPhasesAnalyzer.chem_limits,
+                UserChemPotAnalyzer.read_phase_diagram_and_chempots() or
+                StabilityRegion.get_chempot_limits(elemental_refs). Alternatively, the
+                StabilityRegion itself, in which case the limiting phases are taken from the
+                constraints of the region which are active at the optimum (rather than from the
+                phases in the facet names).
+            elemental_refs (dict): Energies per atom of the elemental reference phases, as
+                {element: energy}, to give absolute chemical potentials if chempot_limits is a
+                StabilityRegion (see StabilityRegion.get_chempot_limits()).
+        """
+        if not isinstance(defect_table, DefectTable):
+            defect_table = DefectTable.from_parsed_defect_dict(defect_table)
+        self.defect_table = defect_table
+        self.stability_region = None
+        if isinstance(chempot_limits, StabilityRegion):
+            self.stability_region = chempot_limits
+            chempot_limits = chempot_limits.get_chempot_limits(elemental_refs)
+        self._elemental_refs = {
+            str(el): energy for el, energy in chempot_limits.get("elemental_refs", {}).items()
+        }
+        self.facets = list(chempot_limits["facets"])
+        facet_chempots = [
+            {str(el): mu for el, mu in chempots.items()}
+            for chempots in chempot_limits["facets"].values()
+        ]
+        self.elements = sorted({el for chempots in facet_chempots for el in chempots})
+        missing_elements = set(self.defect_table.elements) - set(self.elements)
+        if missing_elements:
+            raise ValueError(
+                f"No chemical potentials are given for {sorted(missing_elements)}, which are "
+                f"in the defect entries."
+            )
+        self.vertices = np.array(
+            [[chempots[el] for el in self.elements] for chempots in facet_chempots]
+        )
+        self._vertex_chempots = {
+            Element(el): self.vertices[:, i] for i, el in enumerate(self.elements)
+        }
+        # phases at each facet, from the facet names (without any "_i" suffixes added to
+        # make duplicate names unique)
+        self._facet_phases = [
+            {re.sub(r"_\d+$", "", phase) for phase in facet.split("-")} for facet in self.facets
+        ]
+
+    def _get_defect_indices(self, defect):
+        if defect in self.defect_table.keys:
+            return np.array([self.defect_table.keys.index(defect)])
+        indices = np.flatnonzero(self.defect_table.defect_names == defect)
+        if len(indices) == 0:
+            raise ValueError(
+                f"{defect} is not an entry key or defect name in the defect table. Defect names "
+                f"are: {sorted(set(self.defect_table.defect_names))}"
+            )
+        return indices
+
+    def formation_energies_at_facets(self, defect, fermi_level):
+        """
+        Formation energies of defect (an entry key, or a defect name, in which case the
+        lowest energy charge state at fermi_level is used) at fermi_level (relative to the
+        VBM), at each facet (vertex) of the stability region.
+        """
+        indices = self._get_defect_indices(defect)
+        formation_energies = self.defect_table.formation_energies(
+            self._vertex_chempots, fermi_level=fermi_level
+        )[:, indices]
+        # charge states of a defect have the same composition, so the lowest energy charge
+        # state at a fixed Fermi level is the same throughout the stability region
+        return formation_energies[:, np.argmin(formation_energies[0])]
+
+    def _get_limiting_phases(self, chempots):
+        """
+        Phases in equilibrium with the host at the (absolute) chemical potentials chempots
+        (ordered as self.elements). With a StabilityRegion, these are the host and the
+        constraints which are active at chempots. Otherwise, a phase is limiting if chempots is
+        a convex combination of the facets which have the phase in their name (i.e. is on the
+        face of the stability region bounded by the phase). The host alone is only returned for
+        points which are not on any face; note that if all facets share a phase (e.g. when the
+        facets only span part of an unbounded region), every point reports that phase.
+        """
+        if self.stability_region is not None:
+            region = self.stability_region
+            delta_mu = [
+                chempots[self.elements.index(el)] - self._elemental_refs.get(el, 0.0)
+                for el in region.elements
+            ]
+            return sorted(
+                {region.host_composition.reduced_formula}
+                | set(region.get_limiting_phases([delta_mu])[0])
+            )
+
+        limiting_phases = []
+        for phase in sorted(set.union(*self._facet_phases)):
+            face_vertices = self.vertices[[phase in phases for phases in self._facet_phases]]
+            result = linprog(
+                np.zeros(len(face_vertices)),
+                A_eq=np.vstack([face_vertices.T, np.ones(len(face_vertices))]),
+                b_eq=np.append(chempots, 1.0),
+                bounds=[(0, None)] * len(face_vertices),
+            )
+            if result.success:
+                limiting_phases.append(phase)
+        return limiting_phases
+
+    def _get_result(self, weights, objective):
+        weights = np.clip(weights, 0, None)
+        weights /= weights.sum()
+        chempots = weights @ self.vertices
+        return {
+            "chempots": {Element(el): mu for el, mu in zip(self.elements, chempots)},
+            "objective": objective,
+            "facet_weights": {
+                facet: weight for facet, weight in zip(self.facets, weights) if weight > 1e-8
+            },
+            "limiting_phases": self._get_limiting_phases(chempots),
+        }
+
+    def _solve_lp(self, c, A_ub=None, b_ub=None, n_extra=0):
+        """Minimise c @ x over x = (vertex weights, n_extra unbounded variables)."""
+        n_vertices = len(self.vertices)
+        result = linprog(
+            c,
+            A_ub=A_ub,
+            b_ub=b_ub,
+            A_eq=np.concatenate([np.ones(n_vertices), np.zeros(n_extra)])[np.newaxis, :],
+            b_eq=[1.0],
+            bounds=[(0, None)] * n_vertices + [(None, None)] * n_extra,
+        )
+        if not result.success:
+            raise ValueError(f"Chemical potential optimisation failed: {result.message}")
+        return result.x
+
+    def minimize_formation_energy(self, defect, fermi_level):
+        """
+        Chemical potentials giving the lowest formation energy of defect (e.g. a dopant, to
+        maximise its solubility) at fermi_level (relative to the VBM).
+
+        Args:
+            defect (str): Entry key, or defect name (in which case the lowest energy charge
+                state at fermi_level is used).
+            fermi_level (float): Fermi level relative to the VBM.
+        """
+        formation_energies = self.formation_energies_at_facets(defect, fermi_level)
+        weights = self._solve_lp(formation_energies)
+        return self._get_result(weights, weights @ formation_energies)
+
+    def maximize_formation_energy(self, defect, fermi_level):
+        """
+        Chemical potentials giving the highest formation energy of defect (e.g. a compensating
+        or killer defect, to minimise its concentration) at fermi_level (relative to the VBM).
+
+        Args:
+            defect (str): Entry key, or defect name (in which case the lowest energy charge
+                state at fermi_level is used).
+            fermi_level (float): Fermi level relative to the VBM.
+        """
+        formation_energies = self.formation_energies_at_facets(defect, fermi_level)
+        weights = self._solve_lp(-formation_energies)
+        return self._get_result(weights, weights @ formation_energies)
+
+    def maximize_doping_window(self, dopant, compensating_defects, fermi_level):
+        """
+        Chemical potentials giving the largest doping window at fermi_level (relative to the
+        VBM), i.e. maximising the smallest formation energy difference between the
+        compensating defects and the dopant:
+        max min_k (E_f(compensating defect k) - E_f(dopant)).
+
+        Args:
+            dopant (str): Entry key, or defect name (in which case the lowest energy charge
+                state at fermi_level is used) of the dopant.
+            compensating_defects (list): Entry keys or defect names of the compensating
+                defects.
+            fermi_level (float): Fermi level relative to the VBM (e.g. the targeted Fermi
+                level, near the relevant band edge).
+        """
+        dopant_formation_energies = self.formation_energies_at_facets(dopant, fermi_level)
+        windows = np.array(
+            [
+                self.formation_energies_at_facets(defect, fermi_level)
+                - dopant_formation_energies
+                for defect in compensating_defects
+            ]
+        )
+        # maximise t, subject to t <= window_k for each compensating defect k
+        c = np.zeros(len(self.vertices) + 1)
+        c[-1] = -1.0
+        A_ub = np.hstack([-windows, np.ones((len(windows), 1))])
+        x = self._solve_lp(c, A_ub=A_ub, b_ub=np.zeros(len(windows)), n_extra=1)
+        return self._get_result(x[:-1], x[-1])
+
+    def _sample_vertex_weights(self, n_samples, seed=None):
+        """
+        Weights of the vertices (facets) for n_samples points distributed uniformly over
+        their convex hull (n_samples x n_vertices). The vertices lie in a lower-dimensional
+        subspace of the chemical potentials (from the host stability condition), so are first
+        projected onto it.
+        """
+        centred_vertices = self.vertices - self.vertices.mean(axis=0)
+        _u, singular_values, v_t = np.linalg.svd(centred_vertices, full_matrices=False)
+        rank = int(np.sum(singular_values > 1e-6 * max(singular_values.max(), 1.0)))
+        weights = np.zeros((n_samples, len(self.vertices)))
+        if rank == 0:  # single point
+            weights[:, 0] = 1.0
+            return weights
+
+        simplices, volumes = _get_simplices(centred_vertices @ v_t[:rank].T)
+        simplex_idx, simplex_weights = _sample_simplices(
+            simplices, volumes, n_samples, rng=np.random.default_rng(seed)
+        )
+        np.add.at(
+            weights,
+            (np.arange(n_samples)[:, None], simplices[simplex_idx]),
+            simplex_weights,
+        )
+        return weights
+
+    def maximize_carrier_concentration(
+        self,
+        temperature,
+        bulk_dos,
+        carrier_type="n",
+        n_samples=10000,
+        seed=None,
+        band_gap=None,
+    ):
+        """
+        Chemical potentials giving the highest net carrier concentration (n - p for n-type,
+        p - n for p-type, in cm^-3) at the self-consistent Fermi level. This is not a linear
+        objective, so it is evaluated (with DefectTable.solve_for_fermi_energies()) at the
+        facets and at n_samples points sampled uniformly over the stability region (the convex
+        hull of the facets, split into volume-weighted simplices as in
+        StabilityRegion.sample()), and the best point is returned (with the self-consistent
+        Fermi level under the "fermi_level" key).
+
+        Args:
+            temperature (float): Temperature (in K).
+            bulk_dos (Dos or FermiDos): Bulk density of states.
+            carrier_type (str): "n" (maximise n - p) or "p" (maximise p - n).
+            n_samples (int): Number of random points in the stability region.
+            seed (int): Random seed.
+            band_gap (float): Bandgap. Default is the bandgap of the defect entries.
+        """
+        if carrier_type not in ["n", "p"]:
+            raise ValueError(f"carrier_type must be 'n' or 'p', got {carrier_type}")
+        if band_gap is None:
+            band_gap = self.defect_table.gap[0]
+        if not np.isfinite(band_gap):
+            raise ValueError(
+                "The defect entries don't have a bandgap ('gap' in defect_entry.parameters), "
+                "so band_gap must be given."
+            )
+        weights = np.vstack(
+            [np.eye(len(self.vertices)), self._sample_vertex_weights(n_samples, seed)]
+        )
+        chempots = weights @ self.vertices
+        fermi_levels = self.defect_table.solve_for_fermi_energies(
+            temperature,
+            {Element(el): chempots[:, i] for i, el in enumerate(self.elements)},
+            bulk_dos,
+            band_gap=band_gap,
+        )
+
+        fermi_grid = np.linspace(-1.0, band_gap + 1.0, int(np.ceil((band_gap + 2.0) / 0.005)) + 1)
+        log_holes, log_electrons = _get_log_carrier_concentrations(
+            bulk_dos, band_gap, temperature, fermi_grid
+        )
+        holes = np.exp(np.interp(fermi_levels, fermi_grid, log_holes))
+        electrons = np.exp(np.interp(fermi_levels, fermi_grid, log_electrons))
+        net_carriers = electrons - holes if carrier_type == "n" else holes - electrons
+
+        best = np.argmax(net_carriers)
+        result = self._get_result(weights[best], net_carriers[best])
+        result["fermi_level"] = fermi_levels[best]
+        return result
@@ -0,0 +1,249 @@
+"""
+Providers of Materials Project (MP) computed entries, used to set up and analyse competing
+phase / chemical potential calculations.
+
+MPEntryProvider queries the MP database live (as done previously throughout doped),
+LocalEntryStore serves entries from a local on-disk store (keyed by chemical system, and
+which can be populated from an MP provider or a json dump of entries) to allow the chemical
+potential workflow to run offline, and CachedEntryProvider adds an in-memory LRU cache in
+front of either, so repeated queries for the same chemical system are only made once.
+"""
+
+import copy
+import itertools
+import json
+import os
+from collections import OrderedDict
+
+from monty.json import MontyDecoder
+from monty.serialization import dumpfn, loadfn
+from pymatgen.ext.matproj import MPRester
+
+
+def _chemsys(elements) -> str:
+    """Chemical system string (alphabetically sorted elements joined with '-'), as used by
+    the Materials Project."""
+    return "-".join(sorted({str(el) for el in elements}))
+
+
+class MPEntryProvider:
+    """
+    Live Materials Project entry provider, querying the database with MPRester.
+    """
+
+    def __init__(self, api_key=None):
+        """
+        Args:
+            api_key (str): Materials Project (Legacy) API key. If not set, is taken from
+                ~/.pmgrc.yaml by MPRester.
+        """
+        self.api_key = api_key
+
+    def get_entries_in_chemsys(self, elements, inc_structure=None, property_data=None):
+        """Get all entries in the chemical system of elements (including all sub-systems)."""
+        with MPRester(api_key=self.api_key) as mp:
+            return mp.get_entries_in_chemsys(
+                elements, inc_structure=inc_structure, property_data=property_data
+            )
+
+    def get_entry_by_material_id(self, material_id):
+        """Get the ComputedEntry for an MP material id."""
+        with MPRester(api_key=self.api_key) as mp:
+            return mp.get_entry_by_material_id(material_id)
+
+    def get_structure_by_material_id(self, material_id):
+        """Get the Structure for an MP material id."""
+        with MPRester(api_key=self.api_key) as mp:
+            return mp.get_structure_by_material_id(material_id)
+
+    def get_bandstructure_by_material_id(self, material_id):
+        """Get the band structure for an MP material id."""
+        with MPRester(api_key=self.api_key) as mp:
+            return mp.get_bandstructure_by_material_id(material_id)
+
+
+class LocalEntryStore:
+    """
+    Local on-disk store of Materials Project entries, which can be used in place of
+    MPEntryProvider (i.e. without network access).
+
+    Entries are stored in one compressed json file per chemical system
+    ("{store_dir}/{chemsys}.json.gz", e.g. "Mg-O.json.gz" holds the entries containing
+    exactly Mg and O), with an index of material ids. The store can be populated from
+    another provider with populate(), or from a json dump (optionally compressed) of a list
+    of entries with add_dump().
+
+    Note that entries are returned as stored, so the store should be populated with the same
+    inc_structure and property_data settings as it is queried with.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): Directory of the entry store. Created if it doesn't exist.
+        """
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._index_file = os.path.join(self.store_dir, "material_ids.json")
+        if os.path.exists(self._index_file):
+            with open(self._index_file) as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+
+    def _chemsys_file(self, chemsys):
+        return os.path.join(self.store_dir, f"{chemsys}.json.gz")
+
+    def _load_chemsys(self, chemsys) -> list:
+        filename = self._chemsys_file(chemsys)
+        return loadfn(filename) if os.path.exists(filename) else []
+
+    def add_entries(self, entries) -> None:
+        """Add entries to the store, replacing any stored entries with the same entry_id."""
+        entries_by_chemsys = {}
+        for entry in entries:
+            entries_by_chemsys.setdefault(_chemsys(entry.composition.elements), []).append(entry)
+
+        for chemsys, new_entries in entries_by_chemsys.items():
+            new_ids = {entry.entry_id for entry in new_entries}
+            stored_entries = [
+                entry for entry in self._load_chemsys(chemsys) if entry.entry_id not in new_ids
+            ]
+            dumpfn(stored_entries + new_entries, self._chemsys_file(chemsys))
+            for entry in new_entries:
+                self._index[str(entry.entry_id)] = chemsys
+
+        with open(self._index_file, "w") as f:
+            json.dump(self._index, f)
+
+    def add_dump(self, filename) -> None:
+        """Add entries from a json dump (can be compressed, e.g. ".json.gz"/".json.bz2") of a
+        list of entries (as written by monty.serialization.dumpfn)."""
+        entries = loadfn(filename)
+        if entries and isinstance(entries[0], dict):
+            entries = [MontyDecoder().process_decoded(entry) for entry in entries]
+        self.add_entries(entries)
+
+    def populate(self, provider, elements, inc_structure="initial", property_data=None) -> None:
+        """Populate the store with all entries in the chemical system of elements from another
+        provider (e.g. MPEntryProvider)."""
+        self.add_entries(
+            provider.get_entries_in_chemsys(
+                elements, inc_structure=inc_structure, property_data=property_data
+            )
+        )
+
+    def get_entries_in_chemsys(self, elements, inc_structure=None, property_data=None):
+        """Get all stored entries in the chemical system of elements (including all
+        sub-systems, as with MPRester.get_entries_in_chemsys())."""
+        elements = sorted({str(el) for el in elements})
+        entries = []
+        for n_elements in range(1, len(elements) + 1):
+            for sub_elements in itertools.combinations(elements, n_elements):
+                entries.extend(self._load_chemsys(_chemsys(sub_elements)))
+        return entries
+
+    def get_entry_by_material_id(self, material_id):
+        """Get the stored entry for an MP material id."""
+        if material_id not in self._index:
+            raise KeyError(f"{material_id} is not in the local entry store at {self.store_dir}")
+        chemsys = self._index[material_id]
+        for entry in self._load_chemsys(chemsys):
+            if entry.entry_id == material_id:
+                return entry
+        raise KeyError(
+            f"{material_id} is in the index of the local entry store at {self.store_dir}, but "
+            f"not in {self._chemsys_file(chemsys)} (the store is inconsistent; re-add the entry "
+            f"to fix it)"
+        )
+
+    def get_structure_by_material_id(self, material_id):
+        """Get the stored structure for an MP material id (requires entries to have been
+        stored with structures)."""
+        entry = self.get_entry_by_material_id(material_id)
+        if not hasattr(entry, "structure"):
+            raise ValueError(
+                f"The stored entry for {material_id} has no structure. Populate the local "
+                f"entry store with inc_structure set to store structures."
+            )
+        return entry.structure
+
+    def get_bandstructure_by_material_id(self, material_id):
+        """Band structures are not stored locally."""
+        raise ValueError(
+            f"Band structures are not available from the local entry store, so cannot get the "
+            f"band structure for {material_id}."
+        )
+
+
+class CachedEntryProvider:
+    """
+    In-memory least-recently-used (LRU) cache in front of another entry provider (e.g.
+    MPEntryProvider or LocalEntryStore). Entry lists are shallow-copied on return, so the
+    entries themselves are shared between calls.
+    """
+
+    def __init__(self, provider, maxsize=128):
+        """
+        Args:
+            provider: Entry provider to cache (MPEntryProvider or LocalEntryStore).
+            maxsize (int): Maximum number of queries to cache.
+        """
+        self.provider = provider
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def _cached(self, key, func, *args, **kwargs):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        else:
+            self._cache[key] = func(*args, **kwargs)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return self._cache[key]
+
+    def clear(self) -> None:
+        """Empty the cache."""
+        self._cache.clear()
+
+    def get_entries_in_chemsys(self, elements, inc_structure=None, property_data=None):
+        """Get all entries in the chemical system of elements (including all sub-systems)."""
+        key = (
+            "entries",
+            _chemsys(elements),
+            inc_structure,
+            tuple(property_data) if property_data else None,
+        )
+        return list(
+            self._cached(
+                key,
+                self.provider.get_entries_in_chemsys,
+                elements,
+                inc_structure=inc_structure,
+                property_data=property_data,
+            )
+        )
+
+    def get_entry_by_material_id(self, material_id):
+        """Get the ComputedEntry for an MP material id."""
+        return self._cached(
+            ("entry", material_id), self.provider.get_entry_by_material_id, material_id
+        )
+
+    def get_structure_by_material_id(self, material_id):
+        """Get the Structure for an MP material id (copied, as structures are mutable)."""
+        return copy.deepcopy(
+            self._cached(
+                ("structure", material_id),
+                self.provider.get_structure_by_material_id,
+                material_id,
+            )
+        )
+
+    def get_bandstructure_by_material_id(self, material_id):
+        """Get the band structure for an MP material id."""
+        return self._cached(
+            ("bandstructure", material_id),
+            self.provider.get_bandstructure_by_material_id,
+            material_id,
+        )
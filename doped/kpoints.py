@@ -0,0 +1,91 @@
+"""
+Code to generate (Gamma-centred) kpoint meshes for many structures at once.
+
+The meshes are calculated directly from the lattice matrices, for a whole batch of
+structures in one go, rather than building a pymatgen Kpoints (or input set) object for
+each structure and density. Meshes from a reciprocal density (kpoints per inverse Å^3, as
+used for pymatgen's DictSet "reciprocal_density" setting) match
+Kpoints.automatic_density_by_vol(structure, reciprocal_density, force_gamma=True), and
+meshes from a kpoint spacing (in Å^-1, including the 2π factor) match VASP's KSPACING.
+"""
+
+import numpy as np
+
+# kpoint meshes, keyed by (setting, rounded lattice matrix, number of sites, value)
+_kpoint_mesh_cache = {}
+
+
+def is_nkred_eligible(mesh):
+    """
+    Whether NKRED = 2 (or EVENONLY = True) can be used with the kpoint mesh, i.e. all of
+    its divisions are even and at least 4. This is only known beforehand for calculations
+    without symmetry (ISYM = 0, e.g. vasp_ncl), as otherwise the kpoints in the irreducible
+    Brillouin zone are not known before running.
+    """
+    mesh = np.asarray(mesh)
+    return np.all((mesh % 2 == 0) & (mesh >= 4), axis=-1)
+
+
+def get_kpoint_meshes(structures, reciprocal_density=None, kspacing=None):
+    """
+    Get Gamma-centred kpoint meshes for a batch of structures at once, from a reciprocal
+    density or a kpoint spacing. Meshes are cached by lattice (and number of sites), so
+    repeated structures and settings are only calculated once.
+
+    Args:
+        structures (list): Structures or Lattices (or 3x3 lattice matrices) to get kpoint
+            meshes for. For Lattices and matrices, the number of sites is taken to be 1
+            (which only matters for reciprocal densities, where pymatgen nudges kpoint
+            densities which are a cube number per atom).
+        reciprocal_density (float or array): Number of kpoints per inverse Å^3, for all
+            structures or for each structure.
+        kspacing (float or array): Maximum spacing between kpoints (Å^-1, as VASP KSPACING),
+            for all structures or for each structure.
+
+    Returns:
+        Dictionary with "meshes" (array of the kpoint mesh of each structure, shape (n, 3))
+        and "nkred_eligible" (boolean array, see is_nkred_eligible()).
+    """
+    if (reciprocal_density is None) == (kspacing is None):
+        raise ValueError("Exactly one of reciprocal_density and kspacing must be given")
+    setting = "reciprocal_density" if kspacing is None else "kspacing"
+
+    lattices = [getattr(structure, "lattice", structure) for structure in structures]
+    matrices = np.array(
+        [getattr(lattice, "matrix", lattice) for lattice in lattices], dtype=float
+    ).reshape(-1, 3, 3)
+    num_sites = np.array(
+        [len(structure) if hasattr(structure, "lattice") else 1 for structure in structures],
+        dtype=int,
+    )
+    values = np.broadcast_to(
+        np.asarray(kspacing if setting == "kspacing" else reciprocal_density, dtype=float),
+        (len(matrices),),
+    )
+
+    keys = [
+        (setting, np.round(matrix, 6).tobytes(), int(n_sites), float(value))
+        for matrix, n_sites, value in zip(matrices, num_sites, values)
+    ]
+    uncached = [i for i, key in enumerate(keys) if key not in _kpoint_mesh_cache]
+    if uncached:
+        matrices_to_do = matrices[uncached]
+        recip_matrices = 2 * np.pi * np.linalg.inv(matrices_to_do).transpose(0, 2, 1)
+        if setting == "kspacing":
+            recip_lengths = np.sqrt(np.sum(recip_matrices**2, axis=2))
+            meshes = np.maximum(np.ceil(recip_lengths / values[uncached, None]), 1)
+        else:  # as in Kpoints.automatic_density_by_vol and Kpoints.automatic_density
+            recip_volumes = np.abs(np.linalg.det(recip_matrices))
+            kppa = values[uncached] * recip_volumes * num_sites[uncached]
+            kppa = np.where(
+                np.abs(np.floor(kppa ** (1 / 3) + 0.5) ** 3 - kppa) < 1, kppa + kppa * 0.01, kppa
+            )
+            lengths = np.sqrt(np.sum(matrices_to_do**2, axis=2))
+            ngrid = kppa / num_sites[uncached]
+            mult = (ngrid * lengths[:, 0] * lengths[:, 1] * lengths[:, 2]) ** (1 / 3)
+            meshes = np.floor(np.maximum(mult[:, None] / lengths, 1))
+        for i, mesh in zip(uncached, meshes.astype(int)):
+            _kpoint_mesh_cache[keys[i]] = tuple(int(k) for k in mesh)
+
+    meshes = np.array([_kpoint_mesh_cache[key] for key in keys], dtype=int).reshape(-1, 3)
+    return {"meshes": meshes, "nkred_eligible": is_nkred_eligible(meshes)}
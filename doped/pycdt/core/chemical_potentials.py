@@ -12,7 +12,9 @@ import os
 from pymatgen.analysis.phase_diagram import PhaseDiagram, PDEntry
 from pymatgen.core.structure import Structure, Element
 from pymatgen.entries.computed_entries import ComputedStructureEntry
-from pymatgen.ext.matproj import MPRester
+
+from doped.entry_providers import MPEntryProvider
+from doped.stability_region import StabilityRegion
 
 
 def get_mp_chempots_from_dpd(dpd):
@@ -120,6 +122,71 @@ class ChemPotAnalyzer:
         subnom = "-".join(sub_spcs)
         return blk, blknom, subnom
 
+    def get_elemental_refs(self, entries):
+        """
+        Lowest energy per atom of the elemental entries in entries, as {Element: energy}
+        """
+        elemental_refs = {}
+        for entry in entries:
+            if entry.composition.is_element:
+                elt = entry.composition.elements[0]
+                if elt not in elemental_refs or entry.energy_per_atom < elemental_refs[elt]:
+                    elemental_refs[elt] = entry.energy_per_atom
+        return elemental_refs
+
+    def get_sub_chempots_from_region(self, pd, sub_entries):
+        """
+        Get the chemical potentials of each substitutional species at the facets of the bulk
+        phase diagram, by adding the species to the bulk stability region one at a time
+        (doped.stability_region.StabilityRegion.add_species), rather than building a phase
+        diagram of the bulk and substitutional entries for each species.
+
+        Args:
+            pd: PhaseDiagram of the bulk-derived entries
+            sub_entries (dict): {sub_el: list of entries containing sub_el}
+
+        Returns:
+            {sub_el: list of (blk, blknom, subnom, chempots)} for each vertex of the bulk
+            stability region extended with sub_el, where blk, blknom and subnom are the
+            bulk-derived and substitutional phases in equilibrium there (as from
+            diff_bulk_sub_phases) and chempots the chemical potentials ({Element: mu}). The
+            lists are empty if the bulk is not stable with respect to the entries.
+        """
+        logger = logging.getLogger(__name__)
+        all_sub_entries = [entry for entries in sub_entries.values() for entry in entries]
+        elemental_refs = self.get_elemental_refs(pd.all_entries + all_sub_entries)
+        formation_energies = {}
+        for entry in pd.all_entries + all_sub_entries + [self.bulk_ce]:
+            if not set(entry.composition.elements).issubset(elemental_refs):
+                continue
+            formula = entry.composition.formula.replace(" ", "")
+            formation_energy = entry.energy - sum(
+                n * elemental_refs[elt] for elt, n in entry.composition.items()
+            )
+            if formula not in formation_energies or formation_energy < formation_energies[formula]:
+                formation_energies[formula] = formation_energy
+
+        sub_chempots = {sub_el: [] for sub_el in sub_entries}
+        try:
+            region = StabilityRegion(self.bulk_ce.composition, formation_energies)
+        except ValueError as exc:
+            logger.warning("Cannot add substitutional species to the bulk facets: {}".format(exc))
+            return sub_chempots
+
+        host_formula = region.host_composition.reduced_formula
+        for sub_el in sub_entries:
+            sub_region = region.add_species(sub_el)
+            for vertex, phases in zip(sub_region.vertices, sub_region.limiting_phases):
+                blk, blknom, subnom = self.diff_bulk_sub_phases(
+                    [host_formula] + list(phases), sub_el=str(sub_el)
+                )
+                chempots = {
+                    Element(el): mu + elemental_refs[Element(el)]
+                    for el, mu in zip(sub_region.elements, vertex)
+                }
+                sub_chempots[sub_el].append((blk, blknom, subnom, chempots))
+        return sub_chempots
+
 
 class MPChemPotAnalyzer(ChemPotAnalyzer):
     """
@@ -151,12 +218,17 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
                 format "mp-X", where X is an integer;
             mapi_key (str): Materials API key to access database
                 (if not in ~/.pmgrc.yaml already)
+            entry_provider: Source of the MP entries (see doped.entry_providers), e.g. a
+                LocalEntryStore to run offline. Defaults to MPEntryProvider(mapi_key).
         """
         super(self.__class__, self).__init__(**kwargs)
         self.sub_species = kwargs.get("sub_species", set())
         self.entries = kwargs.get("entries", {})
         self.mpid = kwargs.get("mpid", None)
         self.mapi_key = kwargs.get("mapi_key", None)
+        self.entry_provider = kwargs.get("entry_provider", None) or MPEntryProvider(
+            api_key=self.mapi_key
+        )
 
     def analyze_GGA_chempots(self, full_sub_approach=False):
         """
@@ -259,25 +331,19 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
             # diagram. This is essentially the assumption that the majority of
             # the elements in the total composition will be from the native
             # species present rather than the sub species (a good approximation)
+            sub_chempots = self.get_sub_chempots_from_region(
+                pd, {sub_el: self.entries["subs_set"][sub_el] for sub_el in self.sub_species}
+            )
             for sub_el in self.sub_species:
-                sub_specie_entries = entry_list[:]
-                for entry in self.entries["subs_set"][sub_el]:
-                    sub_specie_entries.append(entry)
-
-                pd = PhaseDiagram(sub_specie_entries)
-                chem_lims = self.get_chempots_from_pd(pd)
-
-                for key in chem_lims.keys():
-                    face_list = key.split("-")
-                    blk, blknom, subnom = self.diff_bulk_sub_phases(face_list, sub_el=sub_el)
+                for blk, blknom, subnom, chempots in sub_chempots[sub_el]:
                     # if number of facets from bulk phase diagram is
                     # equal to bulk species then full_sub_approach says this
                     # can be grouped with rest of structures
                     if len(blk) == len(self.bulk_species_symbol):
                         if blknom not in finchem_lims.keys():
-                            finchem_lims[blknom] = chem_lims[key]
+                            finchem_lims[blknom] = chempots
                         else:
-                            finchem_lims[blknom][Element(sub_el)] = chem_lims[key][Element(sub_el)]
+                            finchem_lims[blknom][Element(sub_el)] = chempots[Element(sub_el)]
                         if "name-append" not in finchem_lims[blknom].keys():
                             finchem_lims[blknom]["name-append"] = subnom
                         else:
@@ -362,8 +428,9 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
                 for sub_el in self.sub_species:
                     species_symbols.append(sub_el)
 
-                with MPRester(api_key=self.mapi_key) as mp:
-                    self.entries["bulk_derived"] = mp.get_entries_in_chemsys(species_symbols)
+                self.entries["bulk_derived"] = self.entry_provider.get_entries_in_chemsys(
+                    species_symbols
+                )
 
                 self.entries["subs_set"] = {sub_el: [] for sub_el in self.sub_species}
                 for entry in self.entries["bulk_derived"]:
@@ -372,10 +439,9 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
                             self.entries["subs_set"][sub_el].append(entry)
 
             else:
-                with MPRester(api_key=self.mapi_key) as mp:
-                    self.entries["bulk_derived"] = mp.get_entries_in_chemsys(
-                        self.bulk_species_symbol
-                    )
+                self.entries["bulk_derived"] = self.entry_provider.get_entries_in_chemsys(
+                    self.bulk_species_symbol
+                )
 
         pd = PhaseDiagram(self.entries["bulk_derived"])
         chem_lims = pd.get_all_chempots(redcomp)
@@ -399,8 +465,7 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
             self.redcomp = self.bulk_ce.composition.reduced_composition
             bce_override = True
         elif self.mpid:
-            with MPRester(api_key=self.mapi_key) as mp:
-                self.bulk_ce = mp.get_entry_by_material_id(self.mpid)
+            self.bulk_ce = self.entry_provider.get_entry_by_material_id(self.mpid)
             self.bulk_species_symbol = [s.symbol for s in self.bulk_ce.composition.elements]
             self.redcomp = self.bulk_ce.composition.reduced_composition
             bce_override = False
@@ -417,8 +482,9 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
             for sub_el in self.sub_species:
                 species_symbols.append(sub_el)
 
-            with MPRester(api_key=self.mapi_key) as mp:
-                self.entries["bulk_derived"] = mp.get_entries_in_chemsys(species_symbols)
+            self.entries["bulk_derived"] = self.entry_provider.get_entries_in_chemsys(
+                species_symbols
+            )
 
             self.entries["subs_set"] = {sub_el: [] for sub_el in self.sub_species}
             for entry in self.entries["bulk_derived"]:
@@ -428,10 +494,11 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
 
         else:  # this is recommended approach for running sub species seperately (assumes subs
             # are in dilute concentrations)
-            with MPRester(api_key=self.mapi_key) as mp:
-                self.entries["bulk_derived"] = mp.get_entries_in_chemsys(self.bulk_species_symbol)
-                if self.mpid and bce_override:  # overriding bulk_ce if mp-id is given.
-                    self.bulk_ce = mp.get_entry_by_material_id(self.mpid)
+            self.entries["bulk_derived"] = self.entry_provider.get_entries_in_chemsys(
+                self.bulk_species_symbol
+            )
+            if self.mpid and bce_override:  # overriding bulk_ce if mp-id is given.
+                self.bulk_ce = self.entry_provider.get_entry_by_material_id(self.mpid)
             if not self.entries:
                 msg = "Could not fetch bulk entries for atomic chempots!" "MPRester query error."
                 logger.warning(msg)
@@ -442,8 +509,7 @@ class MPChemPotAnalyzer(ChemPotAnalyzer):
             bulk_entry_set = [entry.entry_id for entry in self.entries["bulk_derived"]]
             for sub_el in self.sub_species:
                 els = self.bulk_species_symbol + [sub_el]
-                with MPRester(api_key=self.mapi_key) as mp:
-                    sub_entry_set = mp.get_entries_in_chemsys(els)
+                sub_entry_set = self.entry_provider.get_entries_in_chemsys(els)
                 if not sub_entry_set:
                     msg = (
                         "Could not fetch sub entries for {} atomic chempots! "
@@ -484,12 +550,15 @@ class UserChemPotAnalyzer(ChemPotAnalyzer):
                 structure of interest
             mapi_key (str): Materials API key to access database
                 (if not in ~/.pmgrc.yaml already)
+            entry_provider: Source of the MP entries (see doped.entry_providers), e.g. a
+                LocalEntryStore to run offline. Defaults to MPEntryProvider(mapi_key).
         """
         super(self.__class__, self).__init__(**kwargs)
         self.path_base = kwargs.get("path_base", ".")
         self.sub_species = kwargs.get("sub_species", set())
         self.entries = kwargs.get("entries", {})
         self.mapi_key = kwargs.get("mapi_key", None)
+        self.entry_provider = kwargs.get("entry_provider", None)
 
     def read_phase_diagram_and_chempots(self, full_sub_approach=False, include_mp_entries=True):
         """
@@ -566,7 +635,10 @@ class UserChemPotAnalyzer(ChemPotAnalyzer):
         # Supplement entries to phase diagram with those from MP database
         if include_mp_entries:
             mpcpa = MPChemPotAnalyzer(
-                bulk_ce=self.bulk_ce, sub_species=self.sub_species, mapi_key=self.mapi_key
+                bulk_ce=self.bulk_ce,
+                sub_species=self.sub_species,
+                mapi_key=self.mapi_key,
+                entry_provider=self.entry_provider,
             )
             tempcl = mpcpa.analyze_GGA_chempots(
                 full_sub_approach=full_sub_approach
@@ -658,25 +730,26 @@ class UserChemPotAnalyzer(ChemPotAnalyzer):
             # diagram. This is essentially the assumption that the majority of
             # the elements in the total composition will be from the native
             # species present rather than the sub species (a good approximation)
+            sub_chempots = self.get_sub_chempots_from_region(
+                pd,
+                {
+                    sub_el: [
+                        entry
+                        for entry in sub_associated_entry_list
+                        if Element(sub_el) in entry.composition.elements
+                    ]
+                    for sub_el in self.sub_species
+                },
+            )
             for sub_el in self.sub_species:
-                sub_specie_entries = entry_list[:]
-                for entry in sub_associated_entry_list:
-                    if sub_el in entry.composition.elements:
-                        sub_specie_entries.append(entry)
-
-                pd = PhaseDiagram(sub_specie_entries)
-                chem_lims = self.get_chempots_from_pd(pd)
-
-                for key in chem_lims.keys():
-                    face_list = key.split("-")
-                    blk, blknom, subnom = self.diff_bulk_sub_phases(face_list, sub_el=sub_el)
+                for blk, blknom, subnom, chempots in sub_chempots[sub_el]:
                     # if one less than number of bulk species then can be
                     # grouped with rest of structures
                     if len(blk) == len(self.bulk_species_symbol):
                         if blknom not in finchem_lims.keys():
-                            finchem_lims[blknom] = chem_lims[key]
+                            finchem_lims[blknom] = chempots
                         else:
-                            finchem_lims[blknom][sub_el] = chem_lims[key][sub_el]
+                            finchem_lims[blknom][Element(sub_el)] = chempots[Element(sub_el)]
                         if "name-append" not in finchem_lims[blknom].keys():
                             finchem_lims[blknom]["name-append"] = subnom
                         else:
@@ -738,9 +811,7 @@ class UserChemPotAnalyzer(ChemPotAnalyzer):
         self.phase_diagram = pd
         chem_lims = {
             "facets": chem_lims,
-            "elemental_refs": {
-                elt: ent.energy_per_atom for elt, ent in self.phase_diagram.el_refs.items()
-            },
+            "elemental_refs": self.get_elemental_refs(unique_entries),
             "facets_wrt_elt_refs": {},
         }
         for facet, chempot_dict in chem_lims["facets"].items():
@@ -756,7 +827,14 @@ class UserChemPotInputGenerator(object):
     For setting up phase diagram for user, based on structures that exist in the MP database
     """
 
-    def __init__(self, bulk_composition, sub_species=set(), path_base=".", mapi_key=None):
+    def __init__(
+        self,
+        bulk_composition,
+        sub_species=set(),
+        path_base=".",
+        mapi_key=None,
+        entry_provider=None,
+    ):
         """
         Args:
             bulk_composition : Composition of bulk as a pymatgen Composition
@@ -769,6 +847,9 @@ class UserChemPotInputGenerator(object):
                 defaults to the local folder
             mapi_key (str): Materials API key to access database
                 (if not in ~/.pmgrc.yaml already)
+            entry_provider: Source of the MP entries and structures (see
+                doped.entry_providers), e.g. a LocalEntryStore populated with structures to
+                run offline. Defaults to MPEntryProvider(mapi_key).
         """
         self.bulk_composition = bulk_composition
         self.bulk_species_symbol = [s.symbol for s in bulk_composition.elements]
@@ -776,7 +857,9 @@ class UserChemPotInputGenerator(object):
         self.sub_species = sub_species
         self.path_base = path_base
         self.mapi_key = mapi_key
-        self.MPC = MPChemPotAnalyzer(sub_species=sub_species)
+        self.MPC = MPChemPotAnalyzer(
+            sub_species=sub_species, mapi_key=mapi_key, entry_provider=entry_provider
+        )
 
     def setup_phase_diagram_calculations(
         self,
@@ -875,8 +958,9 @@ class UserChemPotInputGenerator(object):
             if (entry.name in setupphases) and (
                 pd.get_decomp_and_e_above_hull(entry, allow_negative=True)[1] <= energy_above_hull
             ):
-                with MPRester(api_key=self.mapi_key) as mp:
-                    localstruct = mp.get_structure_by_material_id(entry.entry_id)
+                localstruct = self.MPC.entry_provider.get_structure_by_material_id(
+                    entry.entry_id
+                )
 
                 # Name to two significant figures
                 name = (
@@ -78,6 +78,15 @@ def kumagai_correction_from_paths( defect_file_path, bulk_file_path, dielectric,
 
 
 
+def _wrap_frac_coords(frac_coords):
+    """
+    Map fractional coordinates into [0, 1), as required for a periodic
+    KD-tree with unit box size.
+    """
+    wrapped = np.mod(frac_coords, 1.0)
+    return np.where(wrapped >= 1.0, 0.0, wrapped)
+
+
 class ComputedDefect(object):
     """
     Holds all the info concerning a defect computation:
@@ -175,7 +184,21 @@ class DefectsAnalyzer(object):
         self._mu_elts = mu_elts
         self._band_gap = band_gap
         self._defects = []
-        self._formation_energies = []
+        # per-defect quantities are held as arrays (one row per defect), so
+        # that changing one entry only recomputes that row and moving the
+        # band edges is a single broadcast operation
+        self._element_idx = {Element(elt): i for i, elt in enumerate(mu_elts)}
+        self._mu_vector = np.array([mu_elts[elt] for elt in mu_elts],
+                                   dtype=float)
+        self._defect_types = []
+        self._type_idx = np.zeros(0, dtype=int)
+        self._charges = np.zeros(0)
+        self._energy_diffs = np.zeros(0)
+        self._comp_deltas = np.zeros((0, len(self._element_idx)))
+        self._charge_corrections = np.zeros(0)
+        self._other_corrections = np.zeros(0)
+        self._formation_energies = np.zeros(0)
+        self._site_index = None
         warnings.warn("Replaced PyCDT usage of DefectsAnalyzer objects with "
                       "DefectPhaseDiagram objects from pymatgen.analysis.defects.thermodynamics\n"
                       "Will remove DefectsAnalyzer with Version 2.5 of PyCDT.",
@@ -187,7 +210,7 @@ class DefectsAnalyzer(object):
              'mu_elts': {k.symbol:v for k,v in self._mu_elts.items()},
              'band_gap': self._band_gap,
              'defects': [d.as_dict() for d in self._defects],
-             'formation_energies': self._formation_energies,
+             'formation_energies': self._formation_energies.tolist(),
              "@module": self.__class__.__module__,
              "@class": self.__class__.__name__}
         return d
@@ -213,7 +236,30 @@ class DefectsAnalyzer(object):
                 a ComputedDefect object
         """
         self._defects.append(defect)
-        self._compute_form_en()
+        if defect.name not in self._defect_types:
+            self._defect_types.append(defect.name)
+        self._type_idx = np.append(self._type_idx,
+                                   self._defect_types.index(defect.name))
+
+        #compensate each element in defect with the chemical potential
+        comp_delta = np.zeros(len(self._element_idx))
+        for elt in defect.entry.composition.elements:
+            el_def_comp = defect.entry.composition[elt]
+            el_blk_comp = self._entry_bulk.composition[elt]
+            comp_delta[self._element_idx[Element(elt)]] = \
+                el_blk_comp - el_def_comp
+
+        self._comp_deltas = np.vstack([self._comp_deltas, comp_delta])
+        self._charges = np.append(self._charges, defect.charge)
+        self._energy_diffs = np.append(
+            self._energy_diffs,
+            defect.entry.energy - self._entry_bulk.energy)
+        self._charge_corrections = np.append(self._charge_corrections,
+                                             defect.charge_correction)
+        self._other_corrections = np.append(self._other_corrections,
+                                            defect.other_correction)
+        self._formation_energies = np.append(self._formation_energies, 0.0)
+        self._compute_form_en(len(self._defects) - 1)
 
     def change_charge_correction(self, i, correction):
         """
@@ -225,7 +271,8 @@ class DefectsAnalyzer(object):
                 New correction to be applied for defect
         """
         self._defects[i].charge_correction = correction
-        self._compute_form_en()
+        self._charge_corrections[i] = correction
+        self._compute_form_en(i)
 
     def change_other_correction(self, i, correction):
         """
@@ -237,35 +284,35 @@ class DefectsAnalyzer(object):
                 New correction to be applied for defect
         """
         self._defects[i].other_correction = correction
-        self._compute_form_en()
+        self._other_corrections[i] = correction
+        self._compute_form_en(i)
 
     def _get_all_defect_types(self):
-        to_return = []
-        for d in self._defects:
-            if d.name not in to_return: to_return.append(d.name)
-        return to_return
+        return list(self._defect_types)
 
-    def _compute_form_en(self):
+    def _compute_form_en(self, i=None):
         """
-        compute the formation energies for all defects in the analyzer
+        compute the formation energies of the defects in the analyzer
+        Args:
+            i:
+                Index of the only defect whose formation energy needs
+                updating. If None, all formation energies are recomputed
+                (as a single array operation).
         """
-        self._formation_energies = []
-        for d in self._defects:
-            #compensate each element in defect with the chemical potential
-            mu_needed_coeffs = {}
-            for elt in d.entry.composition.elements:
-                el_def_comp = d.entry.composition[elt]
-                el_blk_comp = self._entry_bulk.composition[elt]
-                mu_needed_coeffs[Element(elt)] = el_blk_comp - el_def_comp
-
-            sum_mus = 0.0
-            for elt in mu_needed_coeffs:
-                sum_mus += mu_needed_coeffs[elt] * self._mu_elts[elt]
+        if i is None:
+            self._charge_corrections = np.array(
+                [d.charge_correction for d in self._defects], dtype=float)
+            self._other_corrections = np.array(
+                [d.other_correction for d in self._defects], dtype=float)
+            rows = slice(None)
+        else:
+            rows = i
 
-            self._formation_energies.append(
-                    d.entry.energy - self._entry_bulk.energy + \
-                            sum_mus + d.charge*self._e_vbm + \
-                            d.charge_correction + d.other_correction)
+        sum_mus = self._comp_deltas[rows] @ self._mu_vector
+        self._formation_energies[rows] = \
+            self._energy_diffs[rows] + sum_mus + \
+            self._charges[rows]*self._e_vbm + \
+            self._charge_corrections[rows] + self._other_corrections[rows]
 
     def correct_bg_simple(self, vbm_correct, cbm_correct):
         """
@@ -283,7 +330,8 @@ class DefectsAnalyzer(object):
         """
         self._band_gap = self._band_gap + cbm_correct + vbm_correct
         self._e_vbm = self._e_vbm - vbm_correct
-        self._compute_form_en()
+        self._formation_energies = \
+            self._formation_energies - self._charges*vbm_correct
 
     def get_transition_levels(self):
         """
@@ -372,27 +420,40 @@ class DefectsAnalyzer(object):
             a list of dict of {'name': defect name, 'charge': defect charge
                                'conc': defects concentration in m-3}
         """
-        conc=[]
-        spga = SpacegroupAnalyzer(self._entry_bulk.structure, symprec=1e-1)
-        struct = spga.get_symmetrized_structure()
-        i = 0
-        for d in self._defects:
-            df_coords = d.site.frac_coords
-            target_site=None
-            for s in struct.sites:
-                sf_coords = s.frac_coords
-                if abs(s.frac_coords[0]-df_coords[0]) < 0.1 \
-                        and abs(s.frac_coords[1]-df_coords[1]) < 0.1 \
-                        and abs(s.frac_coords[2]-df_coords[2]) < 0.1:
-                    target_site=s
-                    break
-            equiv_site_no = len(struct.find_equivalent_sites(target_site))
-            n = equiv_site_no * 1e30 / struct.volume
-            conc.append({'name': d.name, 'charge': d.charge,
-                         'conc': n*exp(
-                             -self._get_form_energy(ef, i)/(kb*temp))})
-            i += 1
-        return conc
+        struct, kdtree, multiplicities = self._get_site_index()
+        df_coords = np.array([d.site.frac_coords for d in self._defects])
+        if len(df_coords) == 0:
+            return []
+        dist, site_idx = kdtree.query(_wrap_frac_coords(df_coords), p=np.inf,
+                                      distance_upper_bound=0.1)
+        if np.any(np.isinf(dist)):
+            missing = [self._defects[i].name for i in np.where(np.isinf(dist))[0]]
+            raise ValueError(f"No bulk site found within 0.1 (fractional) of "
+                             f"the defect site(s) of {missing}")
+
+        n = multiplicities[site_idx] * 1e30 / struct.volume
+        concs = n * np.exp(-(self._formation_energies + self._charges*ef) /
+                           (kb*temp))
+        return [{'name': d.name, 'charge': d.charge, 'conc': concs[i]}
+                for i, d in enumerate(self._defects)]
+
+    def _get_site_index(self):
+        """
+        Symmetrized bulk structure, a periodic KD-tree over its fractional
+        coordinates and the multiplicity of each of its sites. Computed
+        once for the bulk entry and cached.
+        """
+        if self._site_index is None:
+            from scipy.spatial import cKDTree
+
+            spga = SpacegroupAnalyzer(self._entry_bulk.structure, symprec=1e-1)
+            struct = spga.get_symmetrized_structure()
+            multiplicities = np.zeros(len(struct), dtype=int)
+            for equiv_indices in struct.equivalent_indices:
+                multiplicities[equiv_indices] = len(equiv_indices)
+            kdtree = cKDTree(_wrap_frac_coords(struct.frac_coords), boxsize=1.0)
+            self._site_index = (struct, kdtree, multiplicities)
+        return self._site_index
 
     def _get_dos(self, e, m1, m2, m3, e_ext):
         return sqrt(2) / (pi**2*hbar**3) * sqrt(m1*m2*m3) * sqrt(e-e_ext)
@@ -485,50 +546,54 @@ class DefectsAnalyzer(object):
         """
         from scipy.optimize import bisect
         eqsyn = self.get_eq_ef(tsyn, m_elec, m_hole)
-        cd = {}
-        for c in eqsyn['conc']:
-            if c['name'] in cd:
-                cd[c['name']] += c['conc']
-            else:
-                cd[c['name']] = c['conc']
+        # total population of each defect type is frozen in at tsyn, so
+        # compute it once here rather than inside every bisection step
+        names, type_idx = self._get_defect_type_indices()
+        conc_syn = np.array([c['conc'] for c in eqsyn['conc']])
+        cd = np.bincount(type_idx, weights=conc_syn, minlength=len(names))
         ef = bisect(lambda e:self._get_non_eq_qtot(cd, e, teq, m_elec, m_hole),
                     -1.0, self._band_gap+1.0)
         return {'ef':ef, 'Qi':self.get_qi(ef, teq, m_elec, m_hole),
                 'conc_syn':eqsyn['conc'],
                 'conc':self._get_non_eq_conc(cd, ef, teq)}
 
+    def _get_defect_type_indices(self):
+        """
+        Index each defect by its defect type (name)
+        Returns:
+            the list of defect names (in order of first appearance) and an
+            integer array giving the position of each defect's name in it
+        """
+        return self._get_all_defect_types(), self._type_idx
+
+    def _get_non_eq_fractions(self, ef, t):
+        """
+        Boltzmann-weighted fraction of each defect type found in each of
+        its charge states at Fermi level ef and temperature t
+        """
+        names, type_idx = self._get_defect_type_indices()
+        charges = self._charges
+        form_en = self._formation_energies + charges * ef
+        # shift by the lowest energy of each defect type before
+        # exponentiating, so that the weights cannot all underflow
+        e_min = np.full(len(names), np.inf)
+        np.minimum.at(e_min, type_idx, form_en)
+        weights = np.exp(-(form_en - e_min[type_idx]) / (kb * t))
+        totals = np.bincount(type_idx, weights=weights, minlength=len(names))
+        return weights / totals[type_idx], type_idx, charges
+
     def _get_non_eq_qd(self, cd, ef, t):
-        sum_tot = 0.0
-        for n in cd:
-            sum_d = 0.0
-            sum_q = 0.0
-            i = 0
-            for d in self._defects:
-                if d.name == n:
-                    sum_d += exp(-self._get_form_energy(ef, i)/(kb*t))
-                    sum_q += d.charge * exp(
-                            -self._get_form_energy(ef, i)/(kb*t))
-                i += 1
-            sum_tot += cd[n]*sum_q/sum_d
-        return sum_tot
+        fractions, type_idx, charges = self._get_non_eq_fractions(ef, t)
+        return float(np.sum(cd[type_idx] * fractions * charges))
 
     def _get_non_eq_conc(self, cd, ef, t):
-        sum_tot = 0.0
-        res=[]
-        for n in cd:
-            sum_tot = 0
-            i = 0
-            for d in self._defects:
-                if d.name == n:
-                    sum_tot += exp(-self._get_form_energy(ef,i)/(kb*t))
-                i += 1
-            i=0
-            for d in self._defects:
-                if d.name == n:
-                    res.append({'name':d.name,'charge':d.charge,
-                                'conc':cd[n]*exp(-self._get_form_energy(
-                                    ef,i)/(kb*t))/sum_tot})
-                i += 1
+        fractions, type_idx, _ = self._get_non_eq_fractions(ef, t)
+        conc = cd[type_idx] * fractions
+        res = []
+        for n in np.argsort(type_idx, kind='stable'):
+            d = self._defects[n]
+            res.append({'name': d.name, 'charge': d.charge,
+                        'conc': conc[n]})
         return res
 
     def _get_non_eq_qtot(self, cd, ef, t, m_elec, m_hole):
@@ -7,11 +7,17 @@ Code to generate charged defects structure files.
 
 
 import abc
+import functools
+import hashlib
 import re
+from collections.abc import Mapping
+
+import numpy as np
 
 
 #from monty.string import str2unicode
-from monty.serialization import dumpfn
+from monty.json import MSONable
+from monty.serialization import dumpfn, loadfn
 from pymatgen.core.structure import PeriodicSite, Structure
 from pymatgen.core.periodic_table import Element, Specie, get_el_sp
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
@@ -21,6 +27,165 @@ from pymatgen.analysis.defects.generators import VacancyGenerator, \
 from pymatgen.analysis.local_env import ValenceIonicRadiusEvaluator as VIRE
 
 
+# all lattice vectors with coefficients in {-1, 0, 1}, except the zero vector
+_image_coeffs = np.array([[a, b, c] for a in range(-1, 2) for b in range(-1, 2)
+                          for c in range(-1, 2) if (a, b, c) != (0, 0, 0)])
+
+
+def _get_hnf_matrices(n, diagonal=False):
+    """
+    All lower-triangular Hermite normal form matrices with determinant n,
+    i.e. [[a, 0, 0], [b, c, 0], [d, e, f]] with a*c*f = n, 0 <= b < c and
+    0 <= d, e < f, which give each distinct supercell (sublattice) of index
+    n exactly once. If diagonal, only the diagonal matrices are returned.
+    """
+    hnfs = []
+    for a in range(1, n + 1):
+        if n % a:
+            continue
+        for c in range(1, n // a + 1):
+            if (n // a) % c:
+                continue
+            f = n // (a * c)
+            if diagonal:
+                hnfs.append(np.diag([a, c, f])[np.newaxis])
+                continue
+            b, d, e = np.meshgrid(np.arange(c), np.arange(f), np.arange(f),
+                                  indexing='ij')
+            block = np.zeros((b.size, 3, 3), dtype=int)
+            block[:, 0, 0] = a
+            block[:, 1, 0] = b.ravel()
+            block[:, 1, 1] = c
+            block[:, 2, 0] = d.ravel()
+            block[:, 2, 1] = e.ravel()
+            block[:, 2, 2] = f
+            hnfs.append(block)
+    return np.concatenate(hnfs)
+
+
+def _reduce_bases(bases, max_iter=100):
+    """
+    Pairwise (Lagrange-Gauss) reduction of a stack of lattice bases (rows are
+    the lattice vectors), subtracting the nearest integer multiple of each
+    vector from each other vector until no vector can be shortened this way.
+    The shortest lattice vector of a reduced basis is then one of the
+    combinations with coefficients in {-1, 0, 1}.
+    """
+    bases = np.array(bases, dtype=float)
+    for _ in range(max_iter):
+        changed = False
+        for i in range(3):
+            for j in range(3):
+                if i == j:
+                    continue
+                norms = np.einsum('nk,nk->n', bases[:, j], bases[:, j])
+                mu = np.rint(np.einsum('nk,nk->n', bases[:, i], bases[:, j])
+                             / norms)
+                if np.any(mu):
+                    bases[:, i] -= mu[:, np.newaxis] * bases[:, j]
+                    changed = True
+        if not changed:
+            break
+    return bases
+
+
+def _get_image_distances_and_cubicities(bases):
+    """
+    Minimum periodic image distances (length of the shortest lattice vector)
+    and cubicities (V^(1/3) / longest reduced lattice vector, which is 1 only
+    for cubic cells) of a stack of lattice bases.
+    """
+    reduced = _reduce_bases(bases)
+    images = np.einsum('ck,nkl->ncl', _image_coeffs, reduced)
+    min_dists = np.sqrt(np.einsum('ncl,ncl->nc', images, images).min(axis=1))
+    volumes = np.abs(np.linalg.det(reduced))
+    cubicities = np.cbrt(volumes) / np.linalg.norm(reduced, axis=2).max(axis=1)
+    return min_dists, cubicities
+
+
+def get_supercell_candidates(inp_struct, final_site_no, n_candidates=5,
+                             diagonal=False, chunk_size=2000):
+    """
+    Get the best supercell matrices of inp_struct with at most final_site_no
+    sites, ranked by their minimum periodic image distance (rounded to
+    0.001 Å), then by their number of sites (fewest first), then by their
+    cubicity.
+
+    All (Hermite normal form) supercell matrices are enumerated, or only
+    diagonal expansions if diagonal is True, and the image distances are
+    calculated directly from the supercell lattice matrices (without
+    constructing the supercells). Matrices are only reduced if the shortest
+    of their basis vectors (an upper bound on the image distance) could
+    still beat the current candidates, and supercell sizes which cannot (as
+    even a face-centred cubic lattice of that volume, the best possible,
+    would have a smaller image distance) are skipped entirely.
+
+    Args:
+        inp_struct (Structure): primitive (or conventional) structure
+        final_site_no (int): maximum number of sites in the supercell
+        n_candidates (int): number of candidates to return
+        diagonal (bool): only consider diagonal supercell matrices
+        chunk_size (int): number of matrices reduced at once
+
+    Returns:
+        List of (up to) n_candidates dicts, with the supercell matrix
+        ('matrix'), number of sites ('num_sites'), minimum image distance
+        ('min_image_distance') and cubicity ('cubicity') of each distinct
+        candidate.
+    """
+    num_prim_sites = len(inp_struct.sites)
+    max_size = max(final_site_no // num_prim_sites, 1)
+    lattice_matrix = inp_struct.lattice.matrix
+    volume = inp_struct.lattice.volume
+
+    def rank(cand):
+        return (-cand['min_image_distance'], cand['num_sites'],
+                -cand['cubicity'], cand['num_off_diagonal'])
+
+    # matrices of the same size with the same image distance and cubicity are
+    # almost always symmetry-equivalent, so only the simplest of these is kept
+    best = {}
+    candidates = []
+    for size in range(max_size, 0, -1):
+        if len(candidates) == n_candidates:
+            max_dist = (2 ** 0.5 * size * volume) ** (1 / 3)
+            if round(max_dist, 3) < candidates[-1]['min_image_distance']:
+                break
+        hnfs = _get_hnf_matrices(size, diagonal=diagonal)
+        bases = np.einsum('nij,jk->nik', hnfs, lattice_matrix)
+        upper = np.round(np.linalg.norm(bases, axis=2).min(axis=1), 3)
+        order = np.argsort(-upper, kind='stable')
+        for start in range(0, len(order), chunk_size):
+            idx = order[start:start + chunk_size]
+            if (len(candidates) == n_candidates and
+                    upper[idx[0]] < candidates[-1]['min_image_distance']):
+                break
+            min_dists, cubicities = _get_image_distances_and_cubicities(
+                bases[idx])
+            min_dists = np.round(min_dists, 3)
+            cubicities = np.round(cubicities, 3)
+            for i, dist, cubicity in zip(idx, min_dists, cubicities):
+                if (len(candidates) == n_candidates and
+                        dist < candidates[-1]['min_image_distance']):
+                    continue
+                cand = {'matrix': hnfs[i].tolist(),
+                        'num_sites': int(size * num_prim_sites),
+                        'min_image_distance': float(dist),
+                        'cubicity': float(cubicity),
+                        'num_off_diagonal': int(
+                            np.count_nonzero(hnfs[i]) - 3)}
+                key = (size, cand['min_image_distance'], cand['cubicity'])
+                if key not in best or rank(cand) < rank(best[key]):
+                    best[key] = cand
+            candidates = sorted(best.values(), key=rank)[:n_candidates]
+            best = {(c['num_sites'] // num_prim_sites, c['min_image_distance'],
+                     c['cubicity']): c for c in candidates}
+
+    for cand in candidates:
+        del cand['num_off_diagonal']
+    return candidates
+
+
 def get_optimized_sc_scale(inp_struct, final_site_no):
 
     """
@@ -31,45 +196,121 @@ def get_optimized_sc_scale(inp_struct, final_site_no):
     if final_site_no < len(inp_struct.sites):
         final_site_no = len(inp_struct.sites)
 
-    dictio={}
-    result=[]
-    for k1 in range(1,6):
-        for k2 in range(1,6):
-            for k3 in range(1,6):
-                struct = inp_struct.copy()
-                struct.make_supercell([k1, k2, k3])
-                if len(struct.sites) > final_site_no:
-                    continue
-
-                min_dist = 1000.0
-                for a in range(-1,2):
-                    for b in range(-1,2):
-                        for c in range(-1,2):
-                            try:
-                                distance = struct.get_distance(0, 0, (a,b,c))
-                            except:
-                                print (a, b, c)
-                                raise
-                            if  distance < min_dist and distance>0.00001:
-                                min_dist = distance
-                min_dist = round(min_dist, 3)
-                if min_dist in dictio:
-                    if dictio[min_dist]['num_sites'] > struct.num_sites:
-                        dictio[min_dist]['num_sites'] = struct.num_sites
-                        dictio[min_dist]['supercell'] = [k1,k2,k3]
-                else:
-                    dictio[min_dist]={}
-                    dictio[min_dist]['num_sites'] = struct.num_sites
-                    dictio[min_dist]['supercell'] = [k1,k2,k3]
-    min_dist = -1.0
-    biggest = None
-    for c in dictio:
-        if c > min_dist:
-            biggest = dictio[c]['supercell']
-            min_dist = c
-    if biggest is None or min_dist < 0.0:
+    candidates = get_supercell_candidates(inp_struct, final_site_no,
+                                          n_candidates=1, diagonal=True)
+    if not candidates:
         raise RuntimeError('could not find any supercell scaling vector')
-    return biggest
+    return [int(k) for k in np.diag(candidates[0]['matrix'])]
+
+
+# fractional coordinates of the Voronoi interstitial sites of each host,
+# keyed by structure hash
+_voronoi_sites_cache = {}
+
+
+def _get_structure_hash(structure, decimals=4):
+    """
+    sha256 hash of the lattice, species and (wrapped) fractional coordinates
+    of structure, rounded to decimals.
+    """
+    sha = hashlib.sha256()
+    sha.update(np.round(structure.lattice.matrix, decimals).tobytes())
+    sha.update(" ".join(site.species_string for site in structure).encode())
+    sha.update(np.round(np.mod(structure.frac_coords, 1), decimals).tobytes())
+    return sha.hexdigest()
+
+
+def get_voronoi_interstitial_sites(structure):
+    """
+    Fractional coordinates of the symmetry-inequivalent Voronoi interstitial
+    sites of structure, from VoronoiInterstitialGenerator. The Voronoi and
+    symmetry analysis is independent of the interstitial element, so it is
+    done once per host structure and cached.
+    """
+    key = _get_structure_hash(structure)
+    if key not in _voronoi_sites_cache:
+        _voronoi_sites_cache[key] = [
+            inter.site.frac_coords
+            for inter in VoronoiInterstitialGenerator(structure, 'O')]
+    return [frac_coords.copy() for frac_coords in _voronoi_sites_cache[key]]
+
+
+def get_interstitial_multiplicities(structure, frac_coords, symprec=0.01,
+                                    dist_tol=0.1):
+    """
+    Multiplicities of interstitial sites in structure (the number of
+    symmetry-equivalent positions in the unit cell), as in
+    Interstitial.multiplicity, but from a single symmetry analysis of the
+    host, applying all the symmetry operations to all the sites at once.
+
+    Args:
+        structure (Structure): the host structure
+        frac_coords (array): fractional coordinates of the interstitial
+            sites, shape (n_sites, 3)
+        symprec (float): symmetry precision for SpacegroupAnalyzer
+        dist_tol (float): distance (in Å) within which images of a site are
+            taken to be the same position
+
+    Returns:
+        Array of the multiplicities of the interstitial sites.
+    """
+    frac_coords = np.reshape(frac_coords, (-1, 3))
+    ops = SpacegroupAnalyzer(
+        structure, symprec=symprec).get_symmetry_operations()
+    rotations = np.array([op.rotation_matrix for op in ops])
+    translations = np.array([op.translation_vector for op in ops])
+    images = np.mod(np.einsum('oij,sj->soi', rotations, frac_coords)
+                    + translations, 1)
+    diffs = images[:, :, np.newaxis] - images[:, np.newaxis]
+    diffs -= np.rint(diffs)
+    dists = np.linalg.norm(diffs @ structure.lattice.matrix, axis=-1)
+    # an image is a repeat if it coincides with any earlier image
+    repeats = np.any(np.tril(dists < dist_tol, k=-1), axis=2)
+    return len(ops) - repeats.sum(axis=1)
+
+
+# bond-valence valences of each host, keyed by structure hash
+_bv_valences_cache = {}
+
+
+def _get_bv_valences(structure):
+    """
+    Bond-valence valences (ValenceIonicRadiusEvaluator.valences) of
+    structure, cached by structure hash so that each host is only analysed
+    once.
+    """
+    key = _get_structure_hash(structure)
+    if key not in _bv_valences_cache:
+        _bv_valences_cache[key] = VIRE(structure).valences
+    return dict(_bv_valences_cache[key])
+
+
+@functools.lru_cache(maxsize=None)
+def _get_common_oxi_range(symbol):
+    """
+    (min, max) of the common oxidation states of the element symbol.
+    """
+    oxi_states = Element(symbol).common_oxidation_states
+    return min(oxi_states), max(oxi_states)
+
+
+def _memoize_charges(get_charges):
+    """
+    Decorator for DefectCharger.get_charges, storing the charges of each
+    (defect_type, site_specie, sub_specie) in a lookup table on the charger,
+    as get_charges is called for every generated defect.
+    """
+    @functools.wraps(get_charges)
+    def wrapper(self, defect_type, site_specie=None, sub_specie=None):
+        key = (defect_type, str(site_specie) if site_specie else None,
+               str(sub_specie) if sub_specie else None)
+        charges_table = self.__dict__.setdefault('_charges_table', {})
+        if key not in charges_table:
+            charges_table[key] = get_charges(self, defect_type, site_specie,
+                                             sub_specie)
+        charges = charges_table[key]
+        return list(charges) if charges is not None else None
+    return wrapper
 
 
 class DefectCharger:
@@ -121,8 +362,7 @@ class DefectChargerSemiconductor(DefectCharger):
         if (len(struct_species) == 1) and struct_species[0].symbol not in oxi_states.keys():
             oxi_states[struct_species[0].symbol] = 0
         else:
-            vir = VIRE(structure)
-            for elt, oxi in vir.valences.items():
+            for elt, oxi in _get_bv_valences(structure).items():
                 strip_key = ''.join([s for s in elt if s.isalpha()])
                 if strip_key not in oxi_states.keys():
                     oxi_states[strip_key] = oxi
@@ -137,15 +377,14 @@ class DefectChargerSemiconductor(DefectCharger):
             else:
                 continue
             if el.symbol not in min_max_oxi.keys():
-                max_oxi = max(el.common_oxidation_states)
-                min_oxi = min(el.common_oxidation_states)
-                min_max_oxi[el.symbol] = [min_oxi,max_oxi]
+                min_max_oxi[el.symbol] = list(_get_common_oxi_range(el.symbol))
             if min_max_oxi[el.symbol][0] < self.min_max_oxi_bulk[0]:
                 self.min_max_oxi_bulk[0] = min_max_oxi[el.symbol][0]
             if min_max_oxi[el.symbol][1] > self.min_max_oxi_bulk[1]:
                 self.min_max_oxi_bulk[1] = min_max_oxi[el.symbol][1]
         self.min_max_oxi = min_max_oxi
 
+    @_memoize_charges
     def get_charges(self, defect_type, site_specie, sub_specie=None):
         """
         Based on the type of defect, site and substitution (if any) species
@@ -159,14 +398,10 @@ class DefectChargerSemiconductor(DefectCharger):
                         At present used for substitution and antisite defects
         """
         if site_specie not in self.min_max_oxi.keys():
-            max_oxi = max(Element(site_specie).common_oxidation_states)
-            min_oxi = min(Element(site_specie).common_oxidation_states)
-            self.min_max_oxi[site_specie] = [min_oxi, max_oxi]
+            self.min_max_oxi[site_specie] = list(_get_common_oxi_range(site_specie))
         if sub_specie:
             if sub_specie not in self.min_max_oxi.keys():
-                max_oxi = max(Element(sub_specie).common_oxidation_states)
-                min_oxi = min(Element(sub_specie).common_oxidation_states)
-                self.min_max_oxi[sub_specie] = [min_oxi, max_oxi]
+                self.min_max_oxi[sub_specie] = list(_get_common_oxi_range(sub_specie))
         if defect_type == 'vacancy':
             site_oxi = self.oxi_states[site_specie]
             if site_oxi:
@@ -182,10 +417,10 @@ class DefectChargerSemiconductor(DefectCharger):
             return list(range(self.min_max_oxi_bulk[0],
                               self.min_max_oxi_bulk[1]-1))
         elif defect_type == 'substitution':
-            oxi_sub_set = Element(sub_specie).common_oxidation_states
+            min_oxi_sub, max_oxi_sub = _get_common_oxi_range(sub_specie)
             oxi_site = self.oxi_states[site_specie]
-            min_max_oxi_bulk_sub = [min(min(oxi_sub_set)-oxi_site,-1),
-                                    max(max(oxi_sub_set)-oxi_site,1)]
+            min_max_oxi_bulk_sub = [min(min_oxi_sub-oxi_site,-1),
+                                    max(max_oxi_sub-oxi_site,1)]
             if (min_max_oxi_bulk_sub[1] - min_max_oxi_bulk_sub[0]) > 2:
                 if min_max_oxi_bulk_sub[1] > 2:
                     return list(range(min_max_oxi_bulk_sub[0],
@@ -233,8 +468,7 @@ class DefectChargerInsulator(DefectCharger):
         if len(struct_species) == 1:
             oxi_states = {struct_species[0].symbol: 0}
         else:
-            vir = VIRE(structure)
-            oxi_states = vir.valences
+            oxi_states = _get_bv_valences(structure)
         self.oxi_states = {}
         for key,val in oxi_states.items():
             strip_key = ''.join([s for s in key if s.isalpha()])
@@ -248,10 +482,9 @@ class DefectChargerInsulator(DefectCharger):
                 el = s
             else:
                 continue
-            max_oxi = max(el.common_oxidation_states)
-            min_oxi = min(el.common_oxidation_states)
-            self.min_max_oxi[str2unicode(el.symbol)] = (min_oxi,max_oxi)
+            self.min_max_oxi[str2unicode(el.symbol)] = _get_common_oxi_range(el.symbol)
 
+    @_memoize_charges
     def get_charges(self, defect_type, site_specie=None, sub_specie=None):
         """
         Based on the type of defect, site and substitution (if any) species
@@ -274,9 +507,7 @@ class DefectChargerInsulator(DefectCharger):
                 max_oxi = min(vac_oxi_state, self.min_max_oxi[vac_symbol][1])
                 min_oxi = 0
             else: # most probably single element
-                oxi_states = get_el_sp(site_specie).common_oxidation_states
-                min_oxi = min(oxi_states)
-                max_oxi = max(oxi_states)
+                min_oxi, max_oxi = _get_common_oxi_range(vac_symbol)
             return [-c for c in range(min_oxi, max_oxi+1)]
 
         elif defect_type == 'antisite':
@@ -298,8 +529,7 @@ class DefectChargerInsulator(DefectCharger):
             vac_symbol = site_specie.symbol
             vac_oxi_state = self.oxi_states[str2unicode(vac_symbol)]
 
-            max_oxi_sub = max(sub_specie.common_oxidation_states)
-            min_oxi_sub = min(sub_specie.common_oxidation_states)
+            min_oxi_sub, max_oxi_sub = _get_common_oxi_range(sub_specie.symbol)
             if vac_oxi_state > 0:
                 if max_oxi_sub < 0:
                     raise ValueError("Substitution seems not possible")
@@ -318,9 +548,9 @@ class DefectChargerInsulator(DefectCharger):
                         return [min_oxi_sub - vac_oxi_state]
 
         elif defect_type == 'interstitial':
-            site_specie = get_el_sp(site_specie)
-            min_oxi = min(min(site_specie.common_oxidation_states), 0)
-            max_oxi = max(max(site_specie.common_oxidation_states), 0)
+            min_oxi, max_oxi = _get_common_oxi_range(get_el_sp(site_specie).symbol)
+            min_oxi = min(min_oxi, 0)
+            max_oxi = max(max_oxi, 0)
 
             return list(range(min_oxi, max_oxi+1))
 
@@ -339,13 +569,13 @@ class DefectChargerIonic(DefectCharger):
         if len(struct_species) == 1:
             oxi_states = {struct_species[0].symbol: 0}
         else:
-            vir = VIRE(structure)
-            oxi_states = vir.valences
+            oxi_states = _get_bv_valences(structure)
         self.oxi_states = {}
         for key,val in oxi_states.items():
             strip_key = ''.join([s for s in key if s.isalpha()])
             self.oxi_states[str2unicode(strip_key)] = val
 
+    @_memoize_charges
     def get_charges(self, defect_type, site_specie=None, sub_specie=None):
         """
         Based on the type of defect, site and substitution (if any) species
@@ -414,8 +644,7 @@ class DefectChargerUserCustom(DefectCharger):
         if (len(struct_species) == 1) and struct_species[0].symbol not in oxi_states.keys():
             oxi_states[struct_species[0].symbol] = 0
         else:
-            vir = VIRE(structure)
-            for elt, oxi in vir.valences.items():
+            for elt, oxi in _get_bv_valences(structure).items():
                 strip_key = ''.join([s for s in elt if s.isalpha()])
                 if strip_key not in oxi_states.keys():
                     oxi_states[strip_key] = oxi
@@ -485,6 +714,225 @@ class DefectChargerUserCustom(DefectCharger):
         return outchgs
 
 
+class _BulkSupercell(object):
+    """
+    The bulk supercell of a (primitive) structure, built once, with the
+    mapping from primitive sites to their images in the supercell, from
+    which defect supercells are derived by single-site edits.
+
+    Structure.make_supercell places the images of primitive site i at
+    indices i*n to i*n + n - 1 (n the supercell size), all translated by the
+    same lattice points, so the first image of site i (which is where
+    Defect.generate_defect_structure puts or removes the defect) is at index
+    i*n, translated by the first lattice point.
+    """
+    def __init__(self, struct, sc_scale):
+        self.struct = struct
+        self.sc_scale = sc_scale
+        self.structure = struct.copy()
+        self.structure.make_supercell(sc_scale)
+        self.n_images = len(self.structure) // len(struct)
+        self.origin = self.structure[0].coords - struct[0].coords
+
+    def get_index(self, site, tol=0.01):
+        """
+        Index of the primitive structure site at the position of site.
+        """
+        poss_deflist = sorted(self.struct.get_sites_in_sphere(
+            site.coords, tol, include_index=True), key=lambda x: x[1])
+        if not len(poss_deflist):
+            raise ValueError("Could not find defect site {} inside bulk "
+                             "structure".format(site))
+        return poss_deflist[0][2]
+
+    def get_image_site(self, index, specie):
+        """
+        The (first) image of primitive site index in the supercell (the site
+        edited by remove and replace), with the given specie.
+        """
+        image = self.structure[index * self.n_images]
+        return PeriodicSite(specie, image.coords, self.structure.lattice,
+                            coords_are_cartesian=True)
+
+    def get_supercell_site(self, site):
+        """
+        The position in the supercell at which insert places site (given in
+        the primitive structure).
+        """
+        coords = self.struct.lattice.get_cartesian_coords(
+            np.mod(site.frac_coords, 1)) + self.origin
+        return PeriodicSite(site.specie, coords, self.structure.lattice,
+                            coords_are_cartesian=True)
+
+    def remove(self, index, charge=0):
+        """
+        Supercell with the image of primitive site index removed.
+        """
+        defect_structure = self.structure.copy()
+        defect_structure.remove_sites([index * self.n_images])
+        defect_structure.set_charge(charge)
+        return defect_structure
+
+    def replace(self, index, site, charge=0):
+        """
+        Supercell with the image of primitive site index replaced by the
+        specie of site (which is moved to the end of the structure, as in
+        Substitution.generate_defect_structure).
+        """
+        defect_structure = self.structure.copy()
+        subsite = defect_structure.pop(index * self.n_images)
+        defect_structure.append(site.specie.symbol, subsite.coords,
+                                coords_are_cartesian=True,
+                                properties=site.properties)
+        defect_structure.set_charge(charge)
+        return defect_structure
+
+    def insert(self, site, charge=0):
+        """
+        Supercell with site (in the primitive structure) appended.
+        """
+        defect_structure = self.structure.copy()
+        defect_structure.append(site.specie.symbol,
+                                self.get_supercell_site(site).coords,
+                                coords_are_cartesian=True,
+                                properties=site.properties)
+        defect_structure.set_charge(charge)
+        return defect_structure
+
+
+class DefectSupercell(Mapping, MSONable):
+    """
+    A defect supercell record ({'size': ..., 'structure': ...}) which only
+    holds the recipe for the defect supercell (the shared bulk supercell,
+    the primitive site index and the site operation), and builds the
+    Structure on first access. One record is shared by all the charge
+    states of a defect, and it serialises to the primitive structure and
+    the recipe rather than the full supercell (or only the recipe, in
+    ChargedDefectsStructures.to, where the primitive structure is stored
+    once for all records).
+    """
+    operations = ('remove', 'replace', 'insert')
+
+    def __init__(self, bulk_supercell, operation, index=None, site=None,
+                 charge=0):
+        """
+        Args:
+            bulk_supercell (_BulkSupercell):
+                the bulk supercell the defect supercell is derived from.
+            operation (str):
+                'remove' (vacancy), 'replace' (antisite or substitution) or
+                'insert' (interstitial).
+            index (int):
+                index of the defect site in the primitive structure (for
+                'remove' and 'replace').
+            site (PeriodicSite):
+                the defect site in the primitive structure (for 'replace'
+                and 'insert').
+            charge (int):
+                charge of the defect supercell Structure.
+        """
+        if operation not in self.operations:
+            raise ValueError("operation must be one of {}, not {}".format(
+                self.operations, operation))
+        self.bulk_supercell = bulk_supercell
+        self.operation = operation
+        self.index = index
+        self.site = site
+        self.charge = charge
+        self._structure = None
+
+    @property
+    def structure(self):
+        if self._structure is None:
+            if self.operation == 'remove':
+                self._structure = self.bulk_supercell.remove(
+                    self.index, self.charge)
+            elif self.operation == 'replace':
+                self._structure = self.bulk_supercell.replace(
+                    self.index, self.site, self.charge)
+            else:
+                self._structure = self.bulk_supercell.insert(
+                    self.site, self.charge)
+        return self._structure
+
+    def __getitem__(self, key):
+        if key == 'size':
+            return self.bulk_supercell.sc_scale
+        if key == 'structure':
+            return self.structure
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('size', 'structure'))
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return "DefectSupercell({}, index={}, site={}, size={})".format(
+            self.operation, self.index, self.site, self['size'])
+
+    def as_dict(self, include_bulk=True):
+        """
+        Args:
+            include_bulk (bool):
+                if False, only the recipe is included (without the bulk
+                structure and supercell size, or '@module' and '@class'),
+                to be loaded with from_dict(d, bulk_supercell).
+        """
+        d = {'operation': self.operation,
+             'index': self.index,
+             'site': self.site.as_dict() if self.site else None,
+             'charge': self.charge}
+        if include_bulk:
+            d.update({'@module': self.__class__.__module__,
+                      '@class': self.__class__.__name__,
+                      'bulk_structure': self.bulk_supercell.struct.as_dict(),
+                      'size': self.bulk_supercell.sc_scale})
+        return d
+
+    @classmethod
+    def from_dict(cls, d, bulk_supercell=None):
+        if bulk_supercell is None:
+            bulk_supercell = _BulkSupercell(
+                Structure.from_dict(d['bulk_structure']), d['size'])
+        site = d['site']
+        if isinstance(site, dict):
+            site = PeriodicSite.from_dict(site)
+        return cls(bulk_supercell, d['operation'], index=d['index'],
+                   site=site, charge=d['charge'])
+
+
+def load_defects(filename):
+    """
+    Load a defects dict written with ChargedDefectsStructures.to, with all
+    the defect supercell records sharing one bulk supercell, and records
+    with the same recipe (i.e. the charge states of a defect) sharing one
+    DefectSupercell, as when they were generated.
+    """
+    defects = loadfn(filename)
+    bulk = defects['bulk']['supercell']
+    bulk_sc = _BulkSupercell(bulk.pop('bulk_structure'), bulk['size'])
+    bulk['structure'] = bulk_sc.structure
+    records = {}
+    for defect_type, defect_list in defects.items():
+        if defect_type == 'bulk':
+            continue
+        for defect in defect_list:
+            sc = defect['supercell']
+            if isinstance(sc, DefectSupercell):
+                continue
+            site = sc['site']
+            key = (sc['operation'], sc['index'], sc['charge'],
+                   None if site is None else
+                   (str(site.specie), tuple(np.round(site.frac_coords, 8))))
+            if key not in records:
+                records[key] = DefectSupercell.from_dict(
+                    sc, bulk_supercell=bulk_sc)
+            defect['supercell'] = records[key]
+    return defects
+
+
 class ChargedDefectsStructures(object):
     """
     A class to generate charged defective structures for use in first
@@ -588,8 +1036,9 @@ class ChargedDefectsStructures(object):
 
         sc_scale = get_optimized_sc_scale(self.struct, cellmax)
         self.defects = {}
-        sc = self.struct.copy()
-        sc.make_supercell(sc_scale)
+        bulk_sc = _BulkSupercell(self.struct, sc_scale)
+        self._bulk_supercell = bulk_sc
+        sc = bulk_sc.structure
         self.defects['bulk'] = {
                 'name': 'bulk',
                 'supercell': {'size': sc_scale, 'structure': sc}}
@@ -613,15 +1062,10 @@ class ChargedDefectsStructures(object):
         for i, vac in enumerate(VG):
             vac_site = vac.site
             vac_symbol = vac.site.specie.symbol
-            vac_sc = vac.generate_defect_structure(sc_scale)
-
-            #create a trivial defect structure to find where supercell transformation moves the lattice
-            struct_for_defect_site = Structure(vac.bulk_structure.copy().lattice,
-                                                 [vac.site.specie],
-                                                 [vac.site.frac_coords],
-                                                 to_unit_cell=True, coords_are_cartesian=False)
-            struct_for_defect_site.make_supercell(sc_scale)
-            vac_sc_site = struct_for_defect_site[0]
+            vac_index = bulk_sc.get_index(vac_site)
+            vac_sc = DefectSupercell(bulk_sc, 'remove', index=vac_index,
+                                     charge=vac.charge)
+            vac_sc_site = bulk_sc.get_image_site(vac_index, vac_site.specie)
 
             charges_vac = self.defect_charger.get_charges('vacancy', vac_symbol)
             
@@ -633,7 +1077,7 @@ class ChargedDefectsStructures(object):
                     'defect_type': 'vacancy',
                     'site_specie': vac_symbol,
                     'site_multiplicity': vac.multiplicity,
-                    'supercell': {'size': sc_scale,'structure': vac_sc},
+                    'supercell': vac_sc,
                     'charges': charges_vac,
                     'Possible_KV_Charge': c.charge})
 
@@ -643,21 +1087,13 @@ class ChargedDefectsStructures(object):
                 SG = SubstitutionGenerator(self.struct, as_specie)
                 for i, sub in enumerate(SG):
                     as_symbol = as_specie.symbol
-                    as_sc = sub.generate_defect_structure(sc_scale)
-
-                    # create a trivial defect structure to find where supercell transformation moves the defect
-                    struct_for_defect_site = Structure( sub.bulk_structure.copy().lattice,
-                                                        [sub.site.specie],
-                                                        [sub.site.frac_coords],
-                                                        to_unit_cell=True, coords_are_cartesian=False)
-                    struct_for_defect_site.make_supercell(sc_scale)
-                    as_sc_site = struct_for_defect_site[0]
+                    defindex = bulk_sc.get_index(sub.site)
+                    as_sc = DefectSupercell(bulk_sc, 'replace', index=defindex,
+                                            site=sub.site, charge=sub.charge)
+                    as_sc_site = bulk_sc.get_image_site(defindex,
+                                                        sub.site.specie)
 
                     #get bulk_site (non sc)
-                    poss_deflist = sorted(sub.bulk_structure.get_sites_in_sphere(sub.site.coords, 0.01, include_index=True), key=lambda x: x[1])
-                    if not len(poss_deflist):
-                        raise ValueError("Could not find substitution site inside bulk structure for {}?".format( sub.name))
-                    defindex = poss_deflist[0][2]
                     as_site = sub.bulk_structure[defindex]
                     vac_symbol = as_site.specie
 
@@ -674,7 +1110,7 @@ class ChargedDefectsStructures(object):
                             'site_specie': vac_symbol,
                             'substituting_specie': as_symbol,
                             'site_multiplicity': sub.multiplicity,
-                            'supercell': {'size': sc_scale,'structure': as_sc},
+                            'supercell': as_sc,
                             'charges': charges_as,
                             'Possible_KV_Charge': c.charge})
 
@@ -685,25 +1121,18 @@ class ChargedDefectsStructures(object):
                     sub_symbol = sub.site.specie.symbol
 
                     #get bulk_site (non sc)
-                    poss_deflist = sorted(sub.bulk_structure.get_sites_in_sphere(sub.site.coords, 0.1, include_index=True), key=lambda x: x[1])
-                    if not len(poss_deflist):
-                        raise ValueError("Could not find substitution site inside bulk structure for {}?".format( sub.name))
-                    defindex = poss_deflist[0][2]
+                    defindex = bulk_sc.get_index(sub.site, tol=0.1)
                     sub_site = self.struct[defindex]
                     this_vac_symbol = sub_site.specie.symbol
 
                     if (sub_symbol != subspecie_symbol) or (this_vac_symbol != vac_symbol):
                         continue
                     else:
-                        sub_sc = sub.generate_defect_structure(sc_scale)
-
-                        # create a trivial defect structure to find where supercell transformation moves the defect
-                        struct_for_defect_site = Structure( sub.bulk_structure.copy().lattice,
-                                                            [sub.site.specie],
-                                                            [sub.site.frac_coords],
-                                                            to_unit_cell=True, coords_are_cartesian=False)
-                        struct_for_defect_site.make_supercell(sc_scale)
-                        sub_sc_site = struct_for_defect_site[0]
+                        sub_sc = DefectSupercell(bulk_sc, 'replace',
+                                                 index=defindex, site=sub.site,
+                                                 charge=sub.charge)
+                        sub_sc_site = bulk_sc.get_image_site(
+                            defindex, sub.site.specie)
 
                         charges_sub = self.defect_charger.get_charges(
                                 'substitution', vac_symbol, subspecie_symbol)
@@ -717,7 +1146,7 @@ class ChargedDefectsStructures(object):
                                 'site_specie':vac_symbol,
                                 'substitution_specie':subspecie_symbol,
                                 'site_multiplicity': sub.multiplicity,
-                                'supercell':{'size':sc_scale,'structure':sub_sc},
+                                'supercell': sub_sc,
                                 'charges':charges_sub,
                                 'Possible_KV_Charge': c.charge})
 
@@ -739,6 +1168,8 @@ class ChargedDefectsStructures(object):
             if intersites:
                 print('Setting up interstitials from intersites')
                 #manual specification of interstitials
+                multiplicities = get_interstitial_multiplicities(
+                    self.struct, [intersite.frac_coords for intersite in intersites])
                 for i, intersite in enumerate(intersites):
                     elt = intersite.specie
                     name = "inter_{}_{}".format(i+1, elt)
@@ -750,17 +1181,15 @@ class ChargedDefectsStructures(object):
                                         "your interstitial PeriodicSite to match the standardized form of the bulk structure."
                         raise ValueError(err_msg)
                     else:
-                        intersite_object = Interstitial( self.struct, intersite)
+                        intersite_object = Interstitial(
+                            self.struct, intersite,
+                            multiplicity=int(multiplicities[i]))
 
-                    # create a trivial defect structure to find where supercell transformation moves the defect site
-                    struct_for_defect_site = Structure(intersite_object.bulk_structure.copy().lattice,
-                                                        [intersite_object.site.specie],
-                                                        [intersite_object.site.frac_coords],
-                                                        to_unit_cell=True, coords_are_cartesian=False)
-                    struct_for_defect_site.make_supercell(sc_scale)
-                    site_sc = struct_for_defect_site[0]
+                    site_sc = bulk_sc.get_supercell_site(intersite_object.site)
 
-                    sc_with_inter = intersite_object.generate_defect_structure( sc_scale)
+                    sc_with_inter = DefectSupercell(
+                        bulk_sc, 'insert', site=intersite_object.site,
+                        charge=intersite_object.charge)
                     charges_inter = self.defect_charger.get_charges(
                             'interstitial', elt)
 
@@ -772,45 +1201,36 @@ class ChargedDefectsStructures(object):
                                 'defect_type': 'interstitial',
                                 'site_specie': intersite_object.site.specie.symbol,
                                 'site_multiplicity': intersite_object.multiplicity,
-                                'supercell': {'size': sc_scale,
-                                                'structure': sc_with_inter},
+                                'supercell': sc_with_inter,
                                 'charges': charges_inter,
                                 'Possible_KV_Charge':c.charge})
 
             else:
                 print("Searching for Voronoi interstitial sites (this can take a while)")
                 # the use of O here is completely arbitrary i think 
-                IG = VoronoiInterstitialGenerator(self.struct, 'O')
-                sites = []
-                for i in IG: 
-                    sites.append(i)
-                
+                # (one Voronoi and symmetry analysis per host, shared by all elements)
+                sites = get_voronoi_interstitial_sites(self.struct)
+                multiplicities = get_interstitial_multiplicities(self.struct, sites)
+
                 inters = []
-                for el in inter_elems: 
-                    for s in sites: 
-                        d = PeriodicSite(el, s.site.frac_coords, s.bulk_structure.copy().lattice)
-                        inters.append(d)
-                
+                for el in inter_elems:
+                    for frac_coords, multiplicity in zip(sites, multiplicities):
+                        d = PeriodicSite(el, frac_coords, self.struct.lattice)
+                        inters.append((d, int(multiplicity)))
+
                 print('Found the interstital sites, setting up interstitials')
-                for i, intersite in enumerate(inters):
+                for i, (intersite, multiplicity) in enumerate(inters):
                     elt = intersite.specie
-                    if intersite.lattice != self.struct.lattice:
-                        err_msg = "Lattice matching error occurs between provided interstitial and the bulk structure."
-                        raise ValueError(err_msg)
-                    else:
-                        intersite_object = Interstitial(self.struct, intersite) 
-                    
+                    intersite_object = Interstitial(self.struct, intersite,
+                                                    multiplicity=multiplicity)
+
                     name = "inter_{}_{}".format(i+1, elt)
 
-                    # create a trivial defect structure to find where supercell transformation moves the defect site
-                    struct_for_defect_site = Structure(intersite_object.bulk_structure.copy().lattice,
-                                                        [intersite_object.site.specie],
-                                                        [intersite_object.site.frac_coords],
-                                                        to_unit_cell=True, coords_are_cartesian=False)
-                    struct_for_defect_site.make_supercell(sc_scale)
-                    site_sc = struct_for_defect_site[0]
+                    site_sc = bulk_sc.get_supercell_site(intersite_object.site)
 
-                    sc_with_inter = intersite_object.generate_defect_structure(sc_scale)
+                    sc_with_inter = DefectSupercell(
+                        bulk_sc, 'insert', site=intersite_object.site,
+                        charge=intersite_object.charge)
                     charges_inter = self.defect_charger.get_charges(
                             'interstitial', elt)
 
@@ -822,8 +1242,7 @@ class ChargedDefectsStructures(object):
                                 'defect_type': 'interstitial',
                                 'site_specie': intersite_object.site.specie.symbol,
                                 'site_multiplicity': intersite_object.multiplicity,
-                                'supercell': {'size': sc_scale,
-                                              'structure': sc_with_inter},
+                                'supercell': sc_with_inter,
                                 'charges': charges_inter,
                                 'Possible_KV_Charge': c.charge})
 
@@ -844,7 +1263,28 @@ class ChargedDefectsStructures(object):
         print("Total (non dielectric) jobs created = {}\n".format(tottmp))
 
     def to(self, outfile):
-        dumpfn(self.defects, outfile)
+        """
+        Write the defects dict to outfile, to be read with load_defects.
+        The primitive structure and size of the bulk supercell are stored
+        once (in defects['bulk']['supercell']), and the defect supercell
+        records derived from it only store their recipes.
+        """
+        bulk_sc = self._bulk_supercell
+        defects = {}
+        for defect_type, defect_list in self.defects.items():
+            if defect_type == 'bulk':
+                defects['bulk'] = dict(defect_list, supercell={
+                    'size': bulk_sc.sc_scale, 'bulk_structure': bulk_sc.struct})
+                continue
+            defects[defect_type] = []
+            for defect in defect_list:
+                sc = defect['supercell']
+                if isinstance(sc, DefectSupercell) and \
+                        sc.bulk_supercell is bulk_sc:
+                    defect = dict(defect,
+                                  supercell=sc.as_dict(include_bulk=False))
+                defects[defect_type].append(defect)
+        dumpfn(defects, outfile)
 
     def get_n_defects_of_type(self, defect_type):
         """
@@ -12,6 +12,7 @@ from shutil import copyfile
 from monty.serialization import loadfn, dumpfn
 from monty.json import MontyDecoder, MontyEncoder
 from monty.tempfile import ScratchDir
+import numpy as np
 
 from pymatgen import __file__ as initfilep
 from pymatgen.core import Element
@@ -23,6 +24,7 @@ from pymatgen.util.testing import PymatgenTest
 
 from doped.pycdt.core.defects_analyzer import ComputedDefect, DefectsAnalyzer, \
     freysoldt_correction_from_paths, kumagai_correction_from_paths
+from doped.pycdt.utils.units import kb
 
 pmgtestfiles_loc = os.path.join(
         os.path.split(os.path.split(initfilep)[0])[0], 'test_files')
@@ -161,6 +163,13 @@ class DefectsAnalyzerTest(PymatgenTest):
         self.da.add_computed_defect(self.cd)
         self.assertEqual( self.da._formation_energies[0], -3.6)
 
+    def test_correct_bg_simple_with_defects(self):
+        self.da.add_computed_defect(self.cd)
+        self.da.add_computed_defect(self.cd2)
+        self.da.change_charge_correction( 1, -1.)
+        self.da.correct_bg_simple( 0.3, 0.5)
+        self.assertArrayAlmostEqual( self.da._formation_energies, [-3.6, -4.3])
+
     def test_get_transition_levels(self):
         self.da.add_computed_defect(self.cd)
         self.da.add_computed_defect(self.cd2)
@@ -187,6 +196,17 @@ class DefectsAnalyzerTest(PymatgenTest):
         self.assertArrayEqual( [list_c[0]['conc'], list_c[1]['conc']] ,
                                [6.9852762150255027e+38, 7.6553010344336244e+43])
 
+    def test_get_defects_concentration_old(self):
+        self.da.add_computed_defect(self.cd)
+        self.da.add_computed_defect(self.cd2)
+        list_c = self.da.get_defects_concentration_old(temp=1000., ef=0.5)
+        self.assertEqual( len(list_c), 2)
+        self.assertAlmostEqual( list_c[1]['conc'] / list_c[0]['conc'],
+                                np.exp(1. / (kb * 1000.)))
+        site_index = self.da._get_site_index()
+        self.da.get_defects_concentration_old(temp=300., ef=0.5)
+        self.assertIs( self.da._get_site_index(), site_index)
+
     def test_get_dos(self):
         dosval = self.da._get_dos(-1., 2., 3., 4., -1.4)
         self.assertEqual( dosval, 1.5568745675641716e+45)
@@ -215,6 +235,19 @@ class DefectsAnalyzerTest(PymatgenTest):
         val = self.da._get_qtot(0.1, 300., [1., 2., 3.], [ 4., 5., 6.])
         self.assertEqual( val, 7.6228613357589505e+85)
 
+    def test_get_non_eq_conc(self):
+        self.da.add_computed_defect(self.cd)
+        self.da.add_computed_defect(self.cd2)
+        cd = np.array([1e20])
+        list_c = self.da._get_non_eq_conc(cd, 0.5, 300.)
+        self.assertEqual( [c['charge'] for c in list_c], [2, 1])
+        self.assertAlmostEqual( (list_c[0]['conc'] + list_c[1]['conc']) / 1e20, 1.)
+        self.assertAlmostEqual( list_c[0]['conc'] / list_c[1]['conc'],
+                                np.exp(-1. / (kb * 300.)))
+        val = self.da._get_non_eq_qd(cd, 0.5, 300.)
+        self.assertAlmostEqual( val / 1e20,
+                                (2 * list_c[0]['conc'] + list_c[1]['conc']) / 1e20)
+
 
 
 if __name__ == '__main__':
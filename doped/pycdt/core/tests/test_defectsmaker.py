@@ -6,10 +6,15 @@ __status__ = "Development"
 
 import os
 
+import numpy as np
+
 from pymatgen.core.structure import Structure
 from pymatgen.core import PeriodicSite
+from doped.pycdt.core import defectsmaker
 from doped.pycdt.core.defectsmaker import *
+from doped.pycdt.core.defectsmaker import _get_structure_hash
 from pymatgen.util.testing import PymatgenTest
+from monty.tempfile import ScratchDir
 
 file_loc = os.path.abspath(os.path.join(
     __file__, '..', '..', '..', '..', 'test_files'))
@@ -26,6 +31,55 @@ class GetOptimizedScScaleTest(PymatgenTest):
         self.assertEqual([3, 3, 3], lattchange)
 
 
+class GetSupercellCandidatesTest(PymatgenTest):
+    def setUp(self):
+        self.gaas_prim_struct = Structure.from_file(
+                os.path.join(file_loc, 'POSCAR_GaAs'))
+
+    def test_non_diagonal_beats_diagonal(self):
+        candidates = get_supercell_candidates(self.gaas_prim_struct, 300)
+        diag_candidates = get_supercell_candidates(
+            self.gaas_prim_struct, 300, diagonal=True)
+        self.assertLessEqual(len(candidates), 5)
+        self.assertGreaterEqual(candidates[0]['min_image_distance'],
+                                diag_candidates[0]['min_image_distance'])
+        for cand in candidates:
+            self.assertLessEqual(cand['num_sites'], 300)
+            sc = self.gaas_prim_struct.copy()
+            sc.make_supercell(cand['matrix'])
+            self.assertEqual(len(sc), cand['num_sites'])
+            lll_abc = sc.lattice.get_lll_reduced_lattice().abc
+            self.assertAlmostEqual(min(lll_abc), cand['min_image_distance'],
+                                   places=2)
+        dists = [cand['min_image_distance'] for cand in candidates]
+        self.assertEqual(dists, sorted(dists, reverse=True))
+
+
+class InterstitialSitesTest(PymatgenTest):
+    def setUp(self):
+        self.gaas_struct = Structure.from_file(
+            os.path.join(file_loc, 'POSCAR_GaAs'))
+
+    def test_interstitial_multiplicities(self):
+        frac_coords = [[0.5, 0.5, 0.5], [0.75, 0.75, 0.75], [0.1, 0.2, 0.35]]
+        multiplicities = get_interstitial_multiplicities(
+            self.gaas_struct, frac_coords)
+        self.assertArrayEqual(multiplicities, [1, 1, 24])
+        for coords, mult in zip(frac_coords, multiplicities):
+            inter = Interstitial(self.gaas_struct, PeriodicSite(
+                'Mn', coords, self.gaas_struct.lattice))
+            self.assertEqual(inter.multiplicity, mult)
+
+    def test_voronoi_sites_cached(self):
+        sites = get_voronoi_interstitial_sites(self.gaas_struct)
+        self.assertEqual(len(sites), 2)
+        self.assertIn(_get_structure_hash(self.gaas_struct),
+                      defectsmaker._voronoi_sites_cache)
+        sites[0][0] += 0.1  # returned coordinates are copies
+        self.assertArrayAlmostEqual(
+            sites[1], get_voronoi_interstitial_sites(self.gaas_struct)[1])
+
+
 class DefectChargerSemiconductorTest(PymatgenTest):
     def setUp(self):
         self.gaas_struct = Structure.from_file(
@@ -75,6 +129,18 @@ class DefectChargerSemiconductorTest(PymatgenTest):
         self.assertIn(-1, self_qs)
         self.assertIn(1, self_qs)
 
+    def test_charges_table(self):
+        mg_impurity_qs = self.def_charger.get_charges('substitution', 'Ga', 'Mg')
+        mg_impurity_qs.append(10)  # returned charges are copies
+        self.assertIn(('substitution', 'Ga', 'Mg'), self.def_charger._charges_table)
+        self.assertArrayEqual(
+            self.def_charger.get_charges('substitution', 'Ga', 'Mg'),
+            [-2, -1, 0, 1, 2])
+        self.assertIn(_get_structure_hash(self.gaas_struct),
+                      defectsmaker._bv_valences_cache)
+        self.assertEqual(DefectChargerSemiconductor(self.gaas_struct).oxi_states,
+                         self.def_charger.oxi_states)
+
 
 class DefectChargerInsulatorTest(PymatgenTest):
     def setUp(self):
@@ -156,6 +222,78 @@ class ChargedDefectsStructuresTest(PymatgenTest):
         self.assertEqual('as_1_Ga_on_As', CDS.defects['substitutions'][1]['name'])
         self.assertEqual(self.as_site, CDS.defects['substitutions'][1]['unique_site'])
 
+    def test_supercells_derived_from_bulk(self):
+        CDS = ChargedDefectsStructures(self.gaas_struct, cellmax=64)
+        sc_scale = CDS.defects['bulk']['supercell']['size']
+        bulk_sc = CDS.defects['bulk']['supercell']['structure']
+        vac = CDS.defects['vacancies'][0]
+        vac_gen = next(iter(VacancyGenerator(self.gaas_struct)))
+        self.assertEqual(vac_gen.generate_defect_structure(sc_scale),
+                         vac['supercell']['structure'])
+        self.assertEqual(len(bulk_sc), len(vac['supercell']['structure']) + 1)
+        self.assertArrayAlmostEqual(vac['bulk_supercell_site'].coords,
+                                    bulk_sc[0].coords)
+        antisite = CDS.defects['substitutions'][0]
+        as_sc = antisite['supercell']['structure']
+        self.assertEqual(len(bulk_sc), len(as_sc))
+        self.assertEqual('As', as_sc[-1].specie.symbol)
+        self.assertArrayAlmostEqual(antisite['bulk_supercell_site'].coords,
+                                    as_sc[-1].coords)
+
+    def test_bulk_supercell_site_outside_unit_cell(self):
+        shifted = self.gaas_struct.copy()
+        shifted.translate_sites([0], [-1, 0, 1], frac_coords=True,
+                                to_unit_cell=False)
+        # float noise just below 0, which np.mod wraps to exactly 1.0
+        noisy = self.gaas_struct.copy()
+        noisy.translate_sites([0], -noisy[0].frac_coords + [0, 0, -6e-33],
+                              frac_coords=True, to_unit_cell=False)
+        noisy.translate_sites([1], [0, 0, -6e-33], frac_coords=True,
+                              to_unit_cell=False)
+        for struct in [shifted, noisy]:
+            CDS = ChargedDefectsStructures(struct, cellmax=64,
+                                           substitutions={'Ga': ['In']})
+            bulk_sc = CDS.defects['bulk']['supercell']['structure']
+            for vac in CDS.defects['vacancies']:
+                coords = vac['bulk_supercell_site'].coords
+                self.assertTrue(any(np.allclose(site.coords, coords)
+                                    for site in bulk_sc))
+                self.assertFalse(any(
+                    np.allclose(site.coords, coords)
+                    for site in vac['supercell']['structure']))
+            for antisite in CDS.defects['substitutions']:
+                as_sc = antisite['supercell']['structure']
+                self.assertArrayAlmostEqual(
+                    antisite['bulk_supercell_site'].coords, as_sc[-1].coords)
+
+    def test_lazy_defect_supercells(self):
+        CDS = ChargedDefectsStructures(self.gaas_struct, cellmax=64)
+        vac_sc = CDS.defects['vacancies'][0]['supercell']
+        self.assertIsInstance(vac_sc, DefectSupercell)
+        self.assertIsNone(vac_sc._structure)
+        self.assertEqual(CDS.defects['bulk']['supercell']['size'],
+                         vac_sc['size'])
+        self.assertIs(vac_sc['structure'], vac_sc['structure'])
+        self.assertIs(CDS.defects['bulk']['supercell']['structure'],
+                      vac_sc.bulk_supercell.structure)
+        self.assertNotIn('structure', vac_sc.as_dict())
+        round_trip = DefectSupercell.from_dict(vac_sc.as_dict())
+        self.assertEqual(vac_sc['structure'], round_trip['structure'])
+
+        # the bulk is stored once, and shared by the loaded records
+        with ScratchDir('.'):
+            CDS.to('defects.json')
+            defects = load_defects('defects.json')
+        records = [defect['supercell'] for defect_type in
+                   ['vacancies', 'substitutions'] for defect in defects[defect_type]]
+        self.assertEqual(len({id(sc.bulk_supercell) for sc in records}), 1)
+        self.assertIs(defects['bulk']['supercell']['structure'],
+                      records[0].bulk_supercell.structure)
+        self.assertIs(defects['vacancies'][0]['supercell'],
+                      defects['vacancies'][1]['supercell'])
+        self.assertEqual(vac_sc['structure'],
+                         defects['vacancies'][0]['supercell']['structure'])
+
 
     def test_extra_initialization(self):
         CDS = ChargedDefectsStructures(self.gaas_struct, cellmax = 513,
@@ -30,7 +30,9 @@ from pymatgen.io.vasp.inputs import Potcar, UnknownPotcarWarning
 from pymatgen.io.vasp.outputs import Vasprun, Locpot, Outcar, Poscar
 from pymatgen.util.coord import pbc_diff
 
+from doped.entry_providers import MPEntryProvider
 from doped.pycdt.core import chemical_potentials
+from doped.pycdt.utils.vasp import TRANSFORMATION_MANIFEST, load_transformation_manifest
 
 angstrom = "\u212B"  # unicode symbol for angstrom to print in strings
 
@@ -359,6 +361,58 @@ def get_defect_site_idxs_and_unrelaxed_structure(
     )
 
 
+def get_defect_transformation(path_to_defect, transformation_manifest=None):
+    """
+    Get the transformation dict of the defect calculation in path_to_defect, from the
+    transformation manifest written by prepare_vasp_defect_dict() (which is only read
+    once, then kept in memory), or else from a (per-folder) transformation.json file.
+
+    The manifest is looked for in the folder above path_to_defect, then the folder
+    above that (for calculations in sub-folders of the defect folders), unless
+    transformation_manifest is given, and the defect is looked up by its folder name
+    (or its path relative to the manifest). If not found there, transformation.json
+    is looked for in path_to_defect, then the folder above.
+
+    Returns:
+        (transformation dict, path of the file it was loaded from), or (None, None) if
+        no transformation data was found.
+    """
+    path_to_defect = os.path.normpath(os.path.abspath(path_to_defect))
+    if transformation_manifest:
+        manifest_paths = [transformation_manifest]
+    else:
+        parent_dir = os.path.dirname(path_to_defect)
+        manifest_paths = [
+            os.path.join(folder, TRANSFORMATION_MANIFEST)
+            for folder in (parent_dir, os.path.dirname(parent_dir))
+        ]
+    for manifest_path in manifest_paths:
+        if not os.path.exists(manifest_path):
+            continue
+        transformations = load_transformation_manifest(manifest_path)
+        rel_path = os.path.relpath(
+            path_to_defect, os.path.dirname(os.path.abspath(manifest_path))
+        ).replace(os.sep, "/")
+        for key in (rel_path, os.path.dirname(rel_path)):
+            if key in transformations:
+                return dict(transformations[key]), manifest_path
+
+    transformation_path = os.path.join(path_to_defect, "transformation.json")
+    if not os.path.exists(transformation_path):  # try next folder up
+        orig_transformation_path = transformation_path
+        transformation_path = os.path.join(
+            os.path.dirname(path_to_defect), "transformation.json"
+        )
+        if os.path.exists(transformation_path):
+            print(
+                f"No transformation file found at {orig_transformation_path}, but found "
+                f"one at {transformation_path}. Using this for defect parsing."
+            )
+    if os.path.exists(transformation_path):
+        return loadfn(transformation_path), transformation_path
+    return None, None
+
+
 class SingleDefectParser:
     def __init__(
         self,
@@ -403,6 +457,7 @@ class SingleDefectParser:
             defect_tot_relax_tol=5.0,
         ),
         initial_defect_structure=None,
+        transformation_manifest=None,
     ):
         """
         Identify defect object based on file paths. Minimal parsing performing for
@@ -415,6 +470,10 @@ class SingleDefectParser:
         :param mpid (str):
         :param compatibility (DefectCompatibility): Compatibility class instance for
             performing compatibility analysis on defect entry.
+        :param transformation_manifest (str): path to the transformation manifest to
+            use if the defect site can't be identified automatically (see
+            get_defect_transformation()). If not given, it is looked for in the
+            folder(s) above path_to_defect.
 
         Return:
             Instance of the SingleDefectParser class.
@@ -470,23 +529,12 @@ class SingleDefectParser:
                 bulk_sc_structure, initial_defect_structure, def_type, comp_diff
             )
         except RuntimeError as exc:
-            # try transformation.json
-            # if auto site-matching failed, try use transformation.json
-            transformation_path = os.path.join(path_to_defect, "transformation.json")
-            if not os.path.exists(transformation_path):  # try next folder up
-                orig_transformation_path = transformation_path
-                transformation_path = os.path.join(
-                    os.path.dirname(os.path.normpath(path_to_defect)),
-                    "transformation.json",
-                )
-                if os.path.exists(transformation_path):
-                    print(
-                        f"No transformation file found at {orig_transformation_path}, but found "
-                        f"one at {transformation_path}. Using this for defect parsing."
-                    )
-
-            if os.path.exists(transformation_path):
-                tf = loadfn(transformation_path)
+            # if auto site-matching failed, try use the transformation manifest or
+            # transformation.json
+            tf, transformation_path = get_defect_transformation(
+                path_to_defect, transformation_manifest
+            )
+            if tf is not None:
                 site = tf["defect_supercell_site"]
                 if def_type == "vacancy":
                     poss_deflist = sorted(
@@ -528,7 +576,8 @@ class SingleDefectParser:
                     f"Could not identify {def_type} defect site in defect structure. "
                     f"Try supplying the initial defect structure to "
                     f"SingleDefectParser.from_paths(), or making sure the doped "
-                    f"transformation.json files are in the defect directory."
+                    f"transformation manifest (or transformation.json files) are in "
+                    f"the defect directory."
                 ) from exc
 
         if def_type == "vacancy":
@@ -848,7 +897,7 @@ class SingleDefectParser:
             {"eigenvalues": eigenvalues, "kpoint_weights": kpoint_weights}
         )
 
-    def get_bulk_gap_data(self, no_MP=True, actual_bulk_path=None):
+    def get_bulk_gap_data(self, no_MP=True, actual_bulk_path=None, entry_provider=None):
         """Get bulk gap data from Materials Project or from local OUTCAR file.
 
         Args:
@@ -857,6 +906,8 @@ class SingleDefectParser:
                 the VBM/CBM occur at reciprocal space points not included in the bulk supercell
                 calculation, you should use this tag to point to a bulk bandstructure calculation
                 instead. If None, will use self.defect_entry.parameters["bulk_path"].
+            entry_provider: Source of MP entries, structures and band structures if no_MP is
+                False (see doped.entry_providers). Defaults to MPEntryProvider().
         """
         if not self.bulk_vr:
             path_to_bulk = self.defect_entry.parameters["bulk_path"]
@@ -865,12 +916,14 @@ class SingleDefectParser:
         bulk_sc_structure = self.bulk_vr.initial_structure
         mpid = self.defect_entry.parameters["mpid"]
 
+        if entry_provider is None:
+            entry_provider = MPEntryProvider()
+
         if not mpid and not no_MP:
             try:
-                with MPRester() as mp:
-                    tmp_mplist = mp.get_entries_in_chemsys(
-                        list(bulk_sc_structure.symbol_set)
-                    )
+                tmp_mplist = entry_provider.get_entries_in_chemsys(
+                    list(bulk_sc_structure.symbol_set)
+                )
                 mplist = [
                     ment.entry_id
                     for ment in tmp_mplist
@@ -885,8 +938,7 @@ class SingleDefectParser:
 
             mpid_fit_list = []
             for trial_mpid in mplist:
-                with MPRester() as mp:
-                    mpstruct = mp.get_structure_by_material_id(trial_mpid)
+                mpstruct = entry_provider.get_structure_by_material_id(trial_mpid)
                 if StructureMatcher(
                     primitive_cell=True,
                     scale=False,
@@ -917,8 +969,7 @@ class SingleDefectParser:
         gap_parameters = {}
         if mpid is not None and not no_MP:
             print(f"Using user-provided mp-id for bulk structure: {mpid}.")
-            with MPRester() as mp:
-                bs = mp.get_bandstructure_by_material_id(mpid)
+            bs = entry_provider.get_bandstructure_by_material_id(mpid)
             if bs:
                 cbm = bs.get_cbm()["energy"]
                 vbm = bs.get_vbm()["energy"]
@@ -1101,7 +1152,20 @@ class PostProcess:
                 logger.error("Abandoning parsing of the calculations")
                 return {}
 
-        trans_dict = loadfn(os.path.join(fldr, "transformation.json"), cls=MontyDecoder)
+        manifest_path = os.path.join(self._root_fldr, TRANSFORMATION_MANIFEST)
+        transformations = (
+            load_transformation_manifest(manifest_path)
+            if os.path.exists(manifest_path)
+            else {}
+        )
+
+        def get_trans_dict(fldr):
+            rel_path = os.path.relpath(fldr, self._root_fldr).replace(os.sep, "/")
+            if rel_path in transformations:
+                return dict(transformations[rel_path])
+            return loadfn(os.path.join(fldr, "transformation.json"), cls=MontyDecoder)
+
+        trans_dict = get_trans_dict(fldr)
         supercell_size = trans_dict["supercell"]
 
         bulk_file_path = fldr
@@ -1120,9 +1184,7 @@ class PostProcess:
             fldr_name = os.path.split(fldr)[1]
             chrg_fldrs = glob.glob(os.path.join(fldr, "charge*"))
             for chrg_fldr in chrg_fldrs:
-                trans_dict = loadfn(
-                    os.path.join(chrg_fldr, "transformation.json"), cls=MontyDecoder
-                )
+                trans_dict = get_trans_dict(chrg_fldr)
                 chrg = trans_dict["charge"]
                 vr, error_msg = get_vr_and_check_locpot(chrg_fldr)
                 if error_msg:
@@ -13,6 +13,7 @@ from monty.serialization import loadfn, dumpfn
 from monty.json import MontyEncoder
 from monty.os.path import zpath
 
+from pymatgen.core import Lattice, PeriodicSite
 from pymatgen.io.vasp.inputs import Kpoints
 from pymatgen.io.vasp.sets import MPRelaxSet, MPStaticSet
 from pymatgen.io.vasp.inputs import PotcarSingle, Potcar
@@ -322,6 +323,85 @@ def write_additional_files(path, trans_dict=None, incar={}, kpoints=None,
         incar.write_file(os.path.join(path, "INCAR.hse2"))
 
 
+TRANSFORMATION_MANIFEST = "transformation_manifest.json"
+_manifest_site_keys = ("defect_site", "defect_supercell_site")
+
+# loaded transformation manifests, keyed by (absolute path, modification time)
+_transformation_manifests = {}
+
+
+def write_transformation_manifest(transformations, filename=TRANSFORMATION_MANIFEST):
+    """
+    Write the transformation dicts of a set of defect calculations to a single,
+    indexed json manifest, instead of one transformation.json per folder.
+    The defect sites are stored as compact arrays (species, fractional coordinates
+    and an index into the list of unique lattices) and the rest of each
+    transformation dict as per-folder metadata.
+    Args:
+        transformations (dict):
+            {folder (relative to the manifest location): transformation dict},
+            e.g. from prepare_vasp_defect_dict()
+        filename (str):
+            json file to write the manifest to
+    """
+    lattices = []
+    lattice_indices = {}
+    sites = {key: {"species": [], "frac_coords": [], "lattice": []}
+             for key in _manifest_site_keys}
+    metadata = []
+    for trans_dict in transformations.values():
+        trans_dict = dict(trans_dict)
+        for key in _manifest_site_keys:
+            site = trans_dict.pop(key, None)
+            if site is None:
+                sites[key]["species"].append(None)
+                sites[key]["frac_coords"].append([0.0, 0.0, 0.0])
+                sites[key]["lattice"].append(-1)
+                continue
+            lattice_key = tuple(np.round(site.lattice.matrix, 8).ravel())
+            if lattice_key not in lattice_indices:
+                lattice_indices[lattice_key] = len(lattices)
+                lattices.append(site.lattice.matrix.tolist())
+            sites[key]["species"].append(site.species_string)
+            sites[key]["frac_coords"].append(site.frac_coords.tolist())
+            sites[key]["lattice"].append(lattice_indices[lattice_key])
+        metadata.append(trans_dict)
+
+    manifest = {"folders": list(transformations), "lattices": lattices,
+                "metadata": metadata}
+    manifest.update(sites)
+    dumpfn(manifest, filename, cls=MontyEncoder)
+
+
+def load_transformation_manifest(filename=TRANSFORMATION_MANIFEST):
+    """
+    Load a transformation manifest written by write_transformation_manifest(), as
+    {folder: transformation dict} with the defect sites as PeriodicSites. Manifests
+    are kept in memory, and only re-read if the file has been modified, so the
+    returned dicts are shared between calls (copy them before modifying).
+    """
+    path = os.path.abspath(filename)
+    key = (path, os.path.getmtime(filename))
+    if key not in _transformation_manifests:
+        for old_key in [k for k in _transformation_manifests if k[0] == path]:
+            del _transformation_manifests[old_key]  # earlier version of the file
+        manifest = loadfn(filename)
+        lattices = [Lattice(matrix) for matrix in manifest["lattices"]]
+        transformations = {}
+        for i, folder in enumerate(manifest["folders"]):
+            trans_dict = dict(manifest["metadata"][i])
+            for site_key in _manifest_site_keys:
+                lattice_index = manifest[site_key]["lattice"][i]
+                if lattice_index >= 0:
+                    trans_dict[site_key] = PeriodicSite(
+                        manifest[site_key]["species"][i],
+                        manifest[site_key]["frac_coords"][i],
+                        lattices[lattice_index])
+            transformations[folder] = trans_dict
+        _transformation_manifests[key] = transformations
+    return _transformation_manifests[key]
+
+
 def make_vasp_defect_files(defects, path_base, user_settings={}, hse=False):
     """
     Generates VASP files for defect computations
@@ -338,6 +418,9 @@ def make_vasp_defect_files(defects, path_base, user_settings={}, hse=False):
              'bulk':{'INCAR':{...},'KPOINTS':{...}}
         hse:
             hse run or not
+
+    The transformation dicts of all calculations are also written to a
+    transformation manifest in path_base (see write_transformation_manifest).
     """
     bulk_sys = defects['bulk']['supercell']
     comb_defs = functools.reduce(lambda x, y: x+y, [
@@ -356,6 +439,7 @@ def make_vasp_defect_files(defects, path_base, user_settings={}, hse=False):
     user_kpoints = user_settings.pop('KPOINTS', {})
     potcar_settings = user_settings.pop('POTCAR', {})
     potcar_functional = potcar_settings.pop('functional', 'PBE')
+    transformations = {}
 
     for defect in comb_defs:
         for charge in defect['charges']:
@@ -376,6 +460,7 @@ def make_vasp_defect_files(defects, path_base, user_settings={}, hse=False):
 
             path = os.path.join(path_base, defect['name'],
                                 "charge_"+str(charge))
+            transformations[defect['name'] + "/charge_" + str(charge)] = dict_transf
             try:
                 potcar = defect_relax_set.potcar
             except:
@@ -414,6 +499,9 @@ def make_vasp_defect_files(defects, path_base, user_settings={}, hse=False):
 
     write_additional_files(path, dict_transf, incar=incar, kpoints=kpoints,
                            hse=hse)
+    transformations['bulk'] = dict_transf
+    write_transformation_manifest(
+        transformations, os.path.join(path_base, TRANSFORMATION_MANIFEST))
 
 
 def make_vasp_defect_files_dos(defects, path_base, user_settings={}, 
@@ -0,0 +1,509 @@
+"""
+Code to determine the chemical potential stability region of a host compound, directly from the
+formation energies of its competing phases.
+
+The region of (elemental-reference-relative) chemical potentials for which the host is stable
+(and no competing phase forms) is a convex polytope, bounded by one linear inequality per
+competing phase. Rather than building the full convex hull of all phases (as done with
+pymatgen's PhaseDiagram.get_all_chempots), the polytope vertices are obtained by half-space
+intersection, which scales much better for high-component (5-6 element) hosts. Dopant species
+can then be added one dimension at a time, reusing the host constraints.
+"""
+
+import copy
+
+import numpy as np
+from pymatgen.core.composition import Composition
+from pymatgen.core.periodic_table import Element
+from scipy.optimize import linprog
+from scipy.spatial import Delaunay, HalfspaceIntersection, QhullError
+from scipy.stats import qmc
+
+
+class StabilityRegion:
+    """
+    Chemical potential stability region (polytope) of a host compound, in terms of the
+    chemical potentials relative to the elemental reference phases (Delta mu).
+
+    The host stability condition sum_i x_i * Delta mu_i = Delta H_f(host) is used to eliminate
+    the chemical potential of one (dependent) host element, and each competing phase p gives
+    an inequality sum_i n_pi * Delta mu_i <= Delta H_f(p), along with Delta mu_i <= 0 for
+    each element (if no elemental phase is given for it). These are stored as
+    halfspaces (A @ x <= b) in the reduced (independent) coordinates x, with one column per
+    element in self.elements except the dependent element.
+    """
+
+    def __init__(self, host_composition, formation_energies, elements=None, tol=1e-6):
+        """
+        Args:
+            host_composition (str or Composition): Composition of the host compound.
+            formation_energies (dict): Formation energies of the host and competing phases
+                (relative to the elemental reference phases, per formula unit), as
+                {formula: formation_energy}. Phases containing elements not in the region are
+                stored and used when these elements are added (with add_species()). If
+                multiple phases have the same reduced composition, the lowest energy (per
+                atom) phase is used.
+            elements (list): Elements (chemical potential dimensions) of the region. Default
+                is the host elements.
+            tol (float): Tolerance (in eV) for determining the phases bounding each vertex.
+        """
+        self.host_composition = Composition(host_composition).reduced_composition
+        self.tol = tol
+        self.phases = {}  # reduced formula: (Composition, formation energy per formula unit)
+        for formula, formation_energy in formation_energies.items():
+            comp = Composition(formula)
+            reduced_formula = comp.reduced_formula
+            if (
+                reduced_formula not in self.phases
+                or formation_energy / comp.num_atoms
+                < self.phases[reduced_formula][1] / self.phases[reduced_formula][0].num_atoms
+            ):
+                self.phases[reduced_formula] = (comp, formation_energy)
+
+        host_formula = self.host_composition.reduced_formula
+        if host_formula not in self.phases:
+            raise ValueError(f"No formation energy given for the host {host_formula}")
+        host_comp, host_formation_energy = self.phases[host_formula]
+        self._host_formation_energy = (
+            host_formation_energy * self.host_composition.num_atoms / host_comp.num_atoms
+        )
+
+        host_elements = [str(el) for el in self.host_composition.elements]
+        # dependent variable: host element with the largest stoichiometry
+        self.dependent_element = max(host_elements, key=lambda el: self.host_composition[el])
+        self.elements = host_elements
+        self._build_host()
+        for element in elements or []:
+            if str(Element(element)) not in self.elements:
+                self._add_dimension(element)
+
+    @classmethod
+    def from_phase_diagram(cls, phase_diagram, host_composition, elements=None, tol=1e-6):
+        """
+        Create a StabilityRegion from a pymatgen PhaseDiagram (using the formation energies of
+        all its entries, relative to its elemental references).
+        """
+        formation_energies = {}
+        for entry in phase_diagram.all_entries:
+            formula = entry.composition.formula.replace(" ", "")
+            formation_energy = phase_diagram.get_form_energy(entry)
+            if formula not in formation_energies or formation_energy < formation_energies[formula]:
+                formation_energies[formula] = formation_energy
+        return cls(host_composition, formation_energies, elements=elements, tol=tol)
+
+    def _get_constraints(self, elements, new_element=None):
+        """Rows (stoichiometries, ordered as elements), bounds and names of the inequalities
+        from the competing phases containing only elements (and containing new_element, if
+        set), and Delta mu <= 0 for elements without an elemental phase."""
+        rows, bounds, names = [], [], []
+        host_formula = self.host_composition.reduced_formula
+        elemental_phases = set()
+        for reduced_formula, (comp, formation_energy) in self.phases.items():
+            phase_elements = {str(el) for el in comp.elements}
+            if (
+                reduced_formula == host_formula
+                or not phase_elements.issubset(elements)
+                or (new_element is not None and new_element not in phase_elements)
+            ):
+                continue
+            if len(phase_elements) == 1:
+                elemental_phases.add(phase_elements.pop())
+            rows.append([comp[el] for el in elements])
+            bounds.append(formation_energy)
+            names.append(reduced_formula)
+        for el in [new_element] if new_element is not None else elements:
+            if el not in elemental_phases:
+                rows.append([1.0 if other == el else 0.0 for other in elements])
+                bounds.append(0.0)
+                names.append(el)
+
+        return np.array(rows, dtype=float).reshape(len(rows), len(elements)), np.array(
+            bounds, dtype=float
+        ), names
+
+    def _reduce(self, full_A, bounds):
+        """Convert inequalities in full Delta mu coordinates (ordered as self.elements) to
+        reduced coordinates, substituting
+        Delta mu_dep = (Delta H_host - x_free . Delta mu_free) / x_dep."""
+        x_dep = self.host_composition[self.dependent_element]
+        dep_idx = self.elements.index(self.dependent_element)
+        x_free = np.array([self.host_composition[el] for el in self._free_elements])
+        A = np.delete(full_A, dep_idx, axis=1) - np.outer(full_A[:, dep_idx], x_free / x_dep)
+        b = bounds - full_A[:, dep_idx] * self._host_formation_energy / x_dep
+        return A, b
+
+    @property
+    def _free_elements(self):
+        return [el for el in self.elements if el != self.dependent_element]
+
+    def _build_host(self):
+        """Build the host stability region halfspaces and vertices."""
+        full_A, bounds, names = self._get_constraints(self.elements)
+        self.A, self.b = self._reduce(full_A, bounds)
+        self.constraint_names = names
+        self._is_lower_bound = np.zeros(len(names), dtype=bool)
+        self.interior_point = self._get_interior_point()
+        self.vertices, self.limiting_phases = self._get_vertices()
+        self._host_reduced_vertices = self.to_reduced(self.vertices)
+
+    def _add_dimension(self, element):
+        """
+        Add the chemical potential of element as an extra (last) dimension, reusing the current
+        halfspaces (with zero coefficient for element) and adding those for the competing
+        phases containing element.
+        """
+        element = str(Element(element))
+        A = self.A[~self._is_lower_bound]
+        b = self.b[~self._is_lower_bound]
+        names = [name for name, lb in zip(self.constraint_names, self._is_lower_bound) if not lb]
+        self.elements = self.elements + [element]
+        full_new_A, new_bounds, new_names = self._get_constraints(
+            self.elements, new_element=element
+        )
+        new_A, new_b = self._reduce(full_new_A, new_bounds)
+        A = np.vstack([np.hstack([A, np.zeros((len(A), 1))]), new_A])
+        b = np.concatenate([b, new_b])
+        names = names + new_names
+
+        # dopant chemical potentials are unbounded below, so add lower bounds (below any vertex
+        # of the region) to bound the polytope, and ignore vertices on these bounds. Each
+        # vertex has an active constraint containing each dopant, which (as the dopant
+        # stoichiometries are non-negative) gives a lower bound for the dopant chemical
+        # potential from the maximum host contribution (over the host vertices) and the
+        # maximum chemical potentials of the other dopants
+        n_host = self._host_reduced_vertices.shape[1]
+        n_dopants = A.shape[1] - n_host
+        max_dopant_chempots = np.array(
+            [
+                -linprog(
+                    -np.eye(A.shape[1])[n_host + j], A_ub=A, b_ub=b,
+                    bounds=[(None, None)] * A.shape[1]
+                ).fun
+                for j in range(n_dopants)
+            ]
+        )
+        max_host_contributions = (
+            (A[:, :n_host] @ self._host_reduced_vertices.T).max(axis=1) if n_host else 0.0
+        )
+        dopant_A = A[:, n_host:]
+        lower_bound_rows, lower_bounds = [], []
+        for j in range(n_dopants):
+            max_other_dopants = dopant_A @ max_dopant_chempots - dopant_A[:, j] * (
+                max_dopant_chempots[j]
+            )
+            rows = dopant_A[:, j] > 0
+            lower_bound = (
+                (b - max_host_contributions - max_other_dopants)[rows] / dopant_A[rows, j]
+            ).min() - 1.0
+            lower_bound_rows.append(-np.eye(A.shape[1])[n_host + j])
+            lower_bounds.append(-lower_bound)
+
+        self.A = np.vstack([A, lower_bound_rows])
+        self.b = np.concatenate([b, lower_bounds])
+        dopants = self.elements[-n_dopants:]
+        self.constraint_names = names + [f"{el}_lower_bound" for el in dopants]
+        self._is_lower_bound = np.array([False] * len(names) + [True] * n_dopants)
+        self.interior_point = self._get_interior_point()
+        self.vertices, self.limiting_phases = self._get_vertices()
+
+    def _get_interior_point(self):
+        """Chebyshev centre of the polytope (in reduced coordinates), obtained with linear
+        programming."""
+        dim = self.A.shape[1]
+        if dim == 0:
+            if np.any(self.b < -self.tol):
+                raise ValueError(
+                    f"{self.host_composition.reduced_formula} is not stable with respect to "
+                    f"competing phases"
+                )
+            return np.zeros(0)
+
+        norms = np.linalg.norm(self.A, axis=1)
+        c = np.zeros(dim + 1)
+        c[-1] = -1.0  # maximise radius
+        result = linprog(
+            c,
+            A_ub=np.hstack([self.A, norms[:, None]]),
+            b_ub=self.b,
+            bounds=[(None, None)] * dim + [(0, None)],
+        )
+        if not result.success or result.x[-1] <= self.tol:
+            raise ValueError(
+                f"{self.host_composition.reduced_formula} is not stable with respect to "
+                f"competing phases"
+            )
+        return result.x[:-1]
+
+    def _get_vertices(self):
+        """Vertices of the polytope (as full Delta mu vectors, ordered as self.elements) and
+        the names of the phases bounding each vertex."""
+        dim = self.A.shape[1]
+        if dim == 0:
+            reduced_vertices = np.zeros((1, 0))
+        elif dim == 1:
+            a = self.A[:, 0]
+            upper = (self.b[a > 0] / a[a > 0]).min()
+            lower = (self.b[a < 0] / a[a < 0]).max()
+            reduced_vertices = np.array([[lower], [upper]])
+        else:
+            halfspaces = np.hstack([self.A, -self.b[:, None]])
+            intersections = HalfspaceIntersection(halfspaces, self.interior_point).intersections
+            # remove duplicate vertices (from degenerate facets)
+            _, unique_idx = np.unique(np.round(intersections, 8), axis=0, return_index=True)
+            reduced_vertices = intersections[np.sort(unique_idx)]
+        self._reduced_polytope_vertices = reduced_vertices  # including those on lower bounds
+
+        active = np.abs(self.b[None, :] - reduced_vertices @ self.A.T) < self.tol
+        keep = ~active[:, self._is_lower_bound].any(axis=1)
+        reduced_vertices, active = reduced_vertices[keep], active[keep]
+
+        limiting_phases = [
+            tuple(
+                name
+                for name, is_active, is_lower_bound in zip(
+                    self.constraint_names, row, self._is_lower_bound
+                )
+                if is_active and not is_lower_bound
+            )
+            for row in active
+        ]
+        return self.to_full(reduced_vertices), limiting_phases
+
+    def to_full(self, reduced_points):
+        """Convert points in reduced coordinates (Delta mu of the independent elements) to full
+        Delta mu vectors (ordered as self.elements)."""
+        reduced_points = np.atleast_2d(reduced_points)
+        x_dep = self.host_composition[self.dependent_element]
+        x_free = np.array([self.host_composition[el] for el in self._free_elements])
+        dep = (self._host_formation_energy - reduced_points @ x_free) / x_dep
+        full = np.empty((len(reduced_points), len(self.elements)))
+        dep_idx = self.elements.index(self.dependent_element)
+        free_idx = [i for i in range(len(self.elements)) if i != dep_idx]
+        full[:, dep_idx] = dep
+        full[:, free_idx] = reduced_points
+        return full
+
+    def to_reduced(self, points):
+        """Convert full Delta mu vectors (ordered as self.elements) to reduced coordinates."""
+        points = np.atleast_2d(points)
+        dep_idx = self.elements.index(self.dependent_element)
+        return np.delete(points, dep_idx, axis=1)
+
+    def contains(self, points, tol=None):
+        """
+        Whether each of the Delta mu vectors (rows of points, ordered as self.elements) is in
+        the stability region (only the host stoichiometry condition for the dependent element
+        is not checked; points are projected onto it).
+        """
+        tol = self.tol if tol is None else tol
+        reduced_points = self.to_reduced(points)
+        A, b = self.A[~self._is_lower_bound], self.b[~self._is_lower_bound]
+        return np.all(reduced_points @ A.T <= b + tol, axis=1)
+
+    def get_limiting_phases(self, points, tol=None):
+        """
+        Phases (competing phases, or elements without an elemental phase, for Delta mu = 0)
+        in equilibrium with the host at each of the Delta mu vectors (rows of points,
+        ordered as self.elements), i.e. the names of the constraints which are active there.
+        Points in the interior of the region have no limiting phases.
+        """
+        tol = self.tol if tol is None else tol
+        reduced_points = self.to_reduced(points)
+        active = np.abs(self.b[None, :] - reduced_points @ self.A.T) < tol
+        return [
+            tuple(
+                name
+                for name, is_active, is_lower_bound in zip(
+                    self.constraint_names, row, self._is_lower_bound
+                )
+                if is_active and not is_lower_bound
+            )
+            for row in active
+        ]
+
+    def sample(self, n_points, method="sobol", seed=None, on_faces=False):
+        """
+        Sample chemical potentials (Delta mu) in the stability region, for evaluating defect
+        formation energies, concentrations and Fermi levels across the region rather than only
+        at the vertices (e.g. with DefectTable.formation_energies() and
+        DefectTable.solve_for_fermi_energies(), using chemical potentials from get_chempots()).
+
+        Points are sampled exactly uniformly over the region (in reduced coordinates), by
+        splitting it into simplices (Delaunay triangulation of its vertices), choosing a
+        simplex for each point with probability proportional to its volume, then taking a
+        Dirichlet(1)-weighted (i.e. uniform) combination of the simplex vertices. Dopant
+        chemical potentials are unbounded below, so are sampled down to the lower bounds used
+        to bound the region (below the lowest vertex value).
+
+        Args:
+            n_points (int): Number of points. If on_faces is True, the points are divided
+                equally between the faces.
+            method (str): "sobol" (scrambled Sobol sequence, for a more even coverage of the
+                region) or "uniform" (uniform random points).
+            seed (int): Random seed, for reproducible samples.
+            on_faces (bool): If True, sample points on the faces of the region (i.e. where
+                each competing phase is in equilibrium with the host), as random convex
+                combinations of the vertices of each face, rather than in its interior.
+
+        Returns:
+            Array of Delta mu vectors (n_points x len(self.elements), ordered as
+            self.elements).
+        """
+        if method not in ["sobol", "uniform"]:
+            raise ValueError(f"method must be 'sobol' or 'uniform', got {method}")
+        rng = np.random.default_rng(seed)
+        vertices = self._reduced_polytope_vertices
+        dim = vertices.shape[1]
+        if dim == 0:
+            return self.to_full(np.zeros((n_points, 0)))
+        if on_faces:
+            return self.to_full(self._sample_faces(n_points, rng))
+
+        simplices, volumes = _get_simplices(vertices, tol=self.tol)
+        simplex_idx, weights = _sample_simplices(simplices, volumes, n_points, method, rng)
+        points = np.einsum("ij,ijk->ik", weights, vertices[simplices[simplex_idx]])
+        return self.to_full(points)
+
+    def _sample_faces(self, n_points, rng):
+        """Random points (in reduced coordinates) on the faces of the region, as
+        Dirichlet-weighted combinations of the vertices of each face."""
+        vertices = self._reduced_polytope_vertices
+        dim = vertices.shape[1]
+        active = np.abs(self.b[None, :] - vertices @ self.A.T) < self.tol
+        faces = []
+        for i in np.flatnonzero(~self._is_lower_bound):
+            face_vertices = vertices[active[:, i]]
+            # only faces of full dimension (dim - 1), and each face only once
+            if len(face_vertices) >= dim and not any(
+                len(face) == len(face_vertices) and np.allclose(face, face_vertices)
+                for face in faces
+            ):
+                faces.append(face_vertices)
+
+        points = []
+        for i, face_vertices in enumerate(faces):
+            n_face_points = n_points // len(faces) + (i < n_points % len(faces))
+            weights = rng.dirichlet(np.ones(len(face_vertices)), size=n_face_points)
+            points.append(weights @ face_vertices)
+        return np.vstack(points)
+
+    def get_chempots(self, points, elemental_refs=None):
+        """
+        Chemical potentials of the points (Delta mu vectors, ordered as self.elements, e.g.
+        from sample()) as a dict of {Element: array of chemical potentials}, which can be used
+        directly with DefectTable.formation_energies() etc.
+
+        Args:
+            points (array): Delta mu vectors.
+            elemental_refs (dict): Energies per atom of the elemental reference phases, as
+                {element: energy}, to give absolute chemical potentials. If not set, the
+                chemical potentials are relative to the elemental references (Delta mu).
+        """
+        elemental_refs = {Element(el): energy for el, energy in (elemental_refs or {}).items()}
+        points = np.atleast_2d(points)
+        return {
+            Element(el): points[:, i] + elemental_refs.get(Element(el), 0.0)
+            for i, el in enumerate(self.elements)
+        }
+
+    def add_species(self, element):
+        """
+        Return a new StabilityRegion with the chemical potential of element added as an
+        extra dimension, bounded by the stored competing phases containing element (and any
+        other elements already in the region). The host region is unchanged, so can be
+        extended with each dopant in turn.
+        """
+        element = str(Element(element))
+        if element in self.elements:
+            raise ValueError(f"{element} is already in the stability region")
+        new_region = copy.copy(self)
+        new_region._add_dimension(element)
+        return new_region
+
+    def get_facets(self):
+        """
+        Vertices of the stability region as a dict of {facet name: {Element: Delta mu}}, where
+        the facet name is the host and bounding phases, joined with "-".
+        """
+        facets = {}
+        host_formula = self.host_composition.reduced_formula
+        for i, (vertex, phases) in enumerate(zip(self.vertices, self.limiting_phases)):
+            name = "-".join([host_formula] + sorted(phases))
+            if name in facets:
+                name += f"_{i}"
+            facets[name] = {Element(el): mu for el, mu in zip(self.elements, vertex)}
+        return facets
+
+    def get_chempot_limits(self, elemental_refs=None):
+        """
+        Chemical potential limits dict, in the same format as returned by
+        UserChemPotAnalyzer.read_phase_diagram_and_chempots() (i.e. with "facets",
+        "elemental_refs" and "facets_wrt_elt_refs"), for use in formation energy analysis.
+
+        Args:
+            elemental_refs (dict): Energies per atom of the elemental reference phases, as
+                {element: energy}. If not set, absolute chemical potentials ("facets") are
+                given relative to zero (i.e. are the same as "facets_wrt_elt_refs").
+        """
+        elemental_refs = {Element(el): energy for el, energy in (elemental_refs or {}).items()}
+        facets_wrt_elt_refs = self.get_facets()
+        return {
+            "facets": {
+                facet: {el: mu + elemental_refs.get(el, 0.0) for el, mu in chempots.items()}
+                for facet, chempots in facets_wrt_elt_refs.items()
+            },
+            "elemental_refs": elemental_refs,
+            "facets_wrt_elt_refs": facets_wrt_elt_refs,
+        }
+
+
+def _get_simplices(vertices, tol=1e-6):
+    """
+    Simplices filling the convex hull of vertices (n_vertices x dim array, spanning all dim
+    dimensions), from a Delaunay triangulation (or the segment between the end points in
+    1D), as an n_simplices x (dim + 1) array of vertex indices, and their (unnormalised)
+    volumes. Raises a ValueError if the hull has zero volume.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    dim = vertices.shape[1]
+    degenerate_error = ValueError(
+        "The stability region has zero volume in chemical potential space, so it can't be "
+        "sampled"
+    )
+    if len(vertices) < dim + 1:
+        raise degenerate_error
+    if dim == 1:
+        simplices = np.array([[np.argmin(vertices[:, 0]), np.argmax(vertices[:, 0])]])
+    else:
+        try:
+            simplices = Delaunay(vertices).simplices
+        except QhullError as exc:
+            raise degenerate_error from exc
+    simplex_vertices = vertices[simplices]
+    volumes = np.abs(np.linalg.det(simplex_vertices[:, 1:] - simplex_vertices[:, :1]))
+    if volumes.sum() <= tol**dim:
+        raise degenerate_error
+    return simplices, volumes
+
+
+def _sample_simplices(simplices, volumes, n_points, method="sobol", rng=None):
+    """
+    Uniformly distributed points in the union of simplices (from _get_simplices()), as the
+    index of the simplex of each point (chosen with probability proportional to its volume)
+    and the (Dirichlet(1)-distributed) weights of its vertices (n_points x (dim + 1)).
+    method is "sobol" (scrambled Sobol sequence) or "uniform" (uniform random numbers).
+    """
+    rng = np.random.default_rng(rng)
+    n_weights = simplices.shape[1]
+    # one coordinate to choose the simplex, and one for each Dirichlet(1) weight
+    if method == "sobol":  # keep the number of Sobol points a power of 2
+        n_sobol = 2 ** int(np.ceil(np.log2(max(n_points, 1))))
+        u = qmc.Sobol(n_weights + 1, seed=rng).random(n_sobol)[:n_points]
+    else:
+        u = rng.random((n_points, n_weights + 1))
+    cumulative_volumes = np.cumsum(volumes) / np.sum(volumes)
+    simplex_idx = np.minimum(
+        np.searchsorted(cumulative_volumes, u[:, 0], side="right"), len(simplices) - 1
+    )
+    exponentials = -np.log(np.clip(u[:, 1:], 1e-300, 1.0))
+    return simplex_idx, exponentials / exponentials.sum(axis=1, keepdims=True)
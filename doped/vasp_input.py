@@ -5,10 +5,13 @@ Code to generate VASP defect calculation input files.
 """
 
 import functools
+import hashlib
 import os
-from copy import deepcopy  # See https://stackoverflow.com/a/22341377/14020960 why
+import shutil
 import warnings
 from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
 
 from monty.io import zopen
@@ -22,7 +25,14 @@ from pymatgen.io.vasp.inputs import (
 from pymatgen.io.vasp.sets import DictSet, BadInputSetWarning
 from ase.dft.kpoints import monkhorst_pack
 
-from doped.pycdt.utils.vasp import DefectRelaxSet, _check_psp_dir
+from doped.kpoints import get_kpoint_meshes, is_nkred_eligible
+from doped.pycdt.utils.vasp import (
+    DefectRelaxSet,
+    PotcarMod,
+    _check_psp_dir,
+    TRANSFORMATION_MANIFEST,
+    write_transformation_manifest,
+)
 
 
 if TYPE_CHECKING:
@@ -31,6 +41,89 @@ if TYPE_CHECKING:
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 default_potcar_dict = loadfn(os.path.join(MODULE_DIR, "default_POTCARs.yaml"))
+VASP_STD_TO_NCL_STATE = "vasp_std_to_ncl_state.json"
+
+
+def _get_potcar_dict(potcar_settings: dict = None) -> dict:
+    """
+    POTCAR settings (functional and {element: POTCAR symbol}) from default_potcar_dict,
+    updated with any user potcar_settings (without modifying either).
+    """
+    potcar_dict = {
+        "POTCAR_FUNCTIONAL": default_potcar_dict["POTCAR_FUNCTIONAL"],
+        "POTCAR": dict(default_potcar_dict["POTCAR"]),
+    }
+    if potcar_settings:
+        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
+            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
+        if "POTCAR" in potcar_settings.keys():
+            potcar_dict["POTCAR"].update(potcar_settings["POTCAR"])
+    return potcar_dict
+
+
+@functools.lru_cache(maxsize=None)
+def _get_potcar(potcar_symbols: tuple, functional: str):
+    """
+    POTCAR file contents and number of valence electrons (ZVAL) of each element, for the
+    POTCAR symbols and functional. Cached, so each POTCAR is only read and parsed from
+    PMG_VASP_PSP_DIR once per process, rather than for every defect and calculation type.
+    """
+    potcar = PotcarMod(symbols=list(potcar_symbols), functional=functional)
+    return str(potcar), {
+        potcar_single.element: potcar_single.nelectrons for potcar_single in potcar
+    }
+
+
+def _get_potcar_and_nelect(input_set):
+    """
+    POTCAR file contents of input_set (a pymatgen VaspInputSet, e.g. DefectRelaxSet), using
+    the cached POTCAR data, and the number of electrons (NELECT) of its neutral structure (as
+    given by input_set.nelect).
+    """
+    potcar_string, nelectrons = _get_potcar(
+        tuple(input_set.potcar_symbols), input_set.potcar_functional
+    )
+    return potcar_string, sum(
+        num_atoms * nelectrons[str(el)]
+        for el, num_atoms in input_set.structure.composition.element_composition.items()
+    )
+
+
+def _write_potcar(input_set, filename: str) -> float:
+    """
+    Write the POTCAR of input_set (a pymatgen VaspInputSet, e.g. DefectRelaxSet) to filename,
+    using the cached POTCAR data, and return the number of electrons (NELECT) of its neutral
+    structure (as given by input_set.nelect).
+    """
+    potcar_string, nelect = _get_potcar_and_nelect(input_set)
+    with zopen(filename, "wt") as f:
+        f.write(potcar_string)
+    return nelect
+
+
+def _get_defect_relax_set(
+    single_defect_dict: dict, potcar_settings: dict = None
+) -> DefectRelaxSet:
+    """
+    DefectRelaxSet of the defect structure and charge in single_defect_dict, with the doped
+    default POTCARs updated with any user potcar_settings.
+    """
+    potcar_dict = _get_potcar_dict(potcar_settings)
+    return DefectRelaxSet(
+        single_defect_dict["Defect Structure"],
+        charge=single_defect_dict["Transformation Dict"]["charge"],
+        user_potcar_settings=potcar_dict["POTCAR"],
+        user_potcar_functional=potcar_dict["POTCAR_FUNCTIONAL"],
+    )
+
+
+def _write_rendered_files(input_dir: str, files: dict) -> None:
+    """Write rendered input files ({filename: contents}) to input_dir."""
+    if not os.path.exists(input_dir):
+        os.makedirs(input_dir)
+    for filename, contents in files.items():
+        with zopen(os.path.join(input_dir, filename), "wt") as f:
+            f.write(contents)
 
 
 def scaled_ediff(natoms):  # 1e-5 for 50 atoms, up to max 1e-4
@@ -88,7 +181,11 @@ def prepare_vasp_defect_inputs(defects: dict) -> dict:
 
 
 def prepare_vasp_defect_dict(
-    defects: dict, write_files: bool = False, sub_folders: list = None
+    defects: dict,
+    write_files: bool = False,
+    sub_folders: list = None,
+    manifest_file: str = TRANSFORMATION_MANIFEST,
+    per_folder_files: bool = False,
 ) -> dict:
     """
     Creates a transformation dictionary so we can tell PyCDT the
@@ -99,14 +196,23 @@ def prepare_vasp_defect_dict(
                     Dictionary of defect-object-dictionaries from PyCDT's
                     ChargedDefectsStructures class (see example notebook)
                 write_files (bool):
-                    If True, write transformation.json files to
-                    {defect_folder}/ or {defect_folder}/{*sub_folders}/
-                    if sub_folders specified
+                    If True, write the transformation dicts of all defect
+                    folders to a single manifest file (manifest_file), which
+                    is loaded by SingleDefectParser.from_paths()
                     (default: False)
                 sub_folders (list):
                     List of sub-folders (in the defect folder) to write
-                    the transformation.json file to
+                    the transformation.json file to, if per_folder_files
                     (default: None)
+                manifest_file (str):
+                    Path of the transformation manifest to write, which should
+                    be in the folder containing the defect folders
+                    (default: "transformation_manifest.json")
+                per_folder_files (bool):
+                    If True (and write_files), also write (the older format)
+                    transformation.json files to {defect_folder}/ or
+                    {defect_folder}/{*sub_folders}/ if sub_folders specified
+                    (default: False)
     """
     overall_dict = {}
     comb_defs = functools.reduce(
@@ -131,6 +237,9 @@ def prepare_vasp_defect_dict(
             overall_dict[folder_name] = dict_transf
 
     if write_files:
+        write_transformation_manifest(overall_dict, manifest_file)
+
+    if write_files and per_folder_files:
         if sub_folders:
             for key, val in overall_dict.items():
                 for sub_folder in sub_folders:
@@ -178,6 +287,26 @@ def vasp_gam_files(
             the (Pymatgen) syntax and doped default settings are.
             (default: None)
     """
+    vaspgaminputdir = input_dir + "/vasp_gam/" if input_dir else "VASP_Files/vasp_gam/"
+    _write_rendered_files(
+        vaspgaminputdir,
+        _render_vasp_gam_files(
+            single_defect_dict, incar_settings=incar_settings, potcar_settings=potcar_settings
+        ),
+    )
+
+
+def _render_vasp_gam_files(
+    single_defect_dict: dict,
+    incar_settings: dict = None,
+    potcar_settings: dict = None,
+    defect_relax_set: DefectRelaxSet = None,
+) -> dict:
+    """
+    Contents of the vasp_gam input files ({filename: contents}) written by vasp_gam_files(),
+    rendered in memory. defect_relax_set can be given to reuse an existing DefectRelaxSet of
+    single_defect_dict (with potcar_settings).
+    """
     supercell = single_defect_dict["Defect Structure"]
     poscar_comment = (
         single_defect_dict["POSCAR Comment"]
@@ -185,50 +314,26 @@ def vasp_gam_files(
         else None
     )
 
-    # Directory
-    vaspgaminputdir = input_dir + "/vasp_gam/" if input_dir else "VASP_Files/vasp_gam/"
-    if not os.path.exists(vaspgaminputdir):
-        os.makedirs(vaspgaminputdir)
-
     warnings.filterwarnings(
         "ignore", category=BadInputSetWarning
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
-    potcar_dict = deepcopy(default_potcar_dict)
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
-
-    defect_relax_set = DefectRelaxSet(
-        supercell,
-        charge=single_defect_dict["Transformation " "Dict"]["charge"],
-        user_potcar_settings=potcar_dict["POTCAR"],
-        user_potcar_functional=potcar_dict["POTCAR_FUNCTIONAL"],
-    )
+    if defect_relax_set is None:
+        defect_relax_set = _get_defect_relax_set(single_defect_dict, potcar_settings)
     vaspgamposcar = defect_relax_set.poscar
     if poscar_comment:
         vaspgamposcar.comment = poscar_comment
 
     potcars = _check_psp_dir()
-    if potcars:
-        defect_relax_set.potcar.write_file(vaspgaminputdir + "POTCAR")
-    else:  # make the folders without POTCARs
+    if not potcars:  # make the folders without POTCARs
         warnings.warn(
             "POTCAR directory not set up with pymatgen, so only POSCAR files will be "
             "generated (POTCARs also needed to determine appropriate NELECT setting in "
             "INCAR files)"
         )
-        vaspgamposcar.write_file(vaspgaminputdir + "POSCAR")
-        return  # exit here
+        return {"POSCAR": str(vaspgamposcar)}  # exit here
 
-    relax_set_incar = defect_relax_set.incar
-    try:
-        # Only set if change in NELECT
-        nelect = relax_set_incar.as_dict()["NELECT"]
-    except KeyError:
-        # Get NELECT if no change (-dNELECT = 0)
-        nelect = defect_relax_set.nelect
+    potcar_string, nelect = _get_potcar_and_nelect(defect_relax_set)
+    nelect -= defect_relax_set.charge  # NELECT of the charged defect supercell
 
     # Variable parameters first
     vaspgamincardict = {
@@ -287,10 +392,13 @@ def vasp_gam_files(
         {"comment": "Kpoints from doped.vasp_gam_files", "generation_style": "Gamma"}
     )
     vaspgamincar = Incar.from_dict(vaspgamincardict)
-    vaspgamincar.write_file(vaspgaminputdir + "INCAR")
 
-    vaspgamposcar.write_file(vaspgaminputdir + "POSCAR")
-    vaspgamkpts.write_file(vaspgaminputdir + "KPOINTS")
+    return {
+        "INCAR": str(vaspgamincar),
+        "POSCAR": str(vaspgamposcar),
+        "KPOINTS": str(vaspgamkpts),
+        "POTCAR": potcar_string,
+    }
 
 
 def vasp_std_files(
@@ -340,6 +448,32 @@ def vasp_std_files(
             'Groundstate' CONTCARs.
             (default: False)
     """
+    vaspstdinputdir = input_dir + "/vasp_std/" if input_dir else "VASP_Files/vasp_std/"
+    _write_rendered_files(
+        vaspstdinputdir,
+        _render_vasp_std_files(
+            single_defect_dict,
+            incar_settings=incar_settings,
+            kpoints_settings=kpoints_settings,
+            potcar_settings=potcar_settings,
+            unperturbed_poscar=unperturbed_poscar,
+        ),
+    )
+
+
+def _render_vasp_std_files(
+    single_defect_dict: dict,
+    incar_settings: dict = None,
+    kpoints_settings: dict = None,
+    potcar_settings: dict = None,
+    unperturbed_poscar: bool = False,
+    defect_relax_set: DefectRelaxSet = None,
+) -> dict:
+    """
+    Contents of the vasp_std input files ({filename: contents}) written by vasp_std_files(),
+    rendered in memory. defect_relax_set can be given to reuse an existing DefectRelaxSet of
+    single_defect_dict (with potcar_settings).
+    """
     supercell = single_defect_dict["Defect Structure"]
     poscar_comment = (
         single_defect_dict["POSCAR Comment"]
@@ -347,29 +481,11 @@ def vasp_std_files(
         else None
     )
 
-    # Directory
-    vaspstdinputdir = input_dir + "/vasp_std/" if input_dir else "VASP_Files/vasp_std/"
-    if not os.path.exists(vaspstdinputdir):
-        os.makedirs(vaspstdinputdir)
-
     warnings.filterwarnings(
         "ignore", category=BadInputSetWarning
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
-
-    # POTCAR
-    potcar_dict = deepcopy(default_potcar_dict)
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
-
-    defect_relax_set = DefectRelaxSet(
-        supercell,
-        charge=single_defect_dict["Transformation Dict"]["charge"],
-        user_potcar_settings=potcar_dict["POTCAR"],
-        user_potcar_functional=potcar_dict["POTCAR_FUNCTIONAL"],
-    )
+    if defect_relax_set is None:
+        defect_relax_set = _get_defect_relax_set(single_defect_dict, potcar_settings)
     vaspstdposcar = defect_relax_set.poscar
     if poscar_comment:
         vaspstdposcar.comment = poscar_comment
@@ -382,28 +498,18 @@ def vasp_std_files(
                 "generated (POTCARs also needed to determine appropriate NELECT setting "
                 "in INCAR files)"
             )
-            vaspstdposcar.write_file(vaspstdinputdir + "POSCAR")
+            return {"POSCAR": str(vaspstdposcar)}
 
-        else:
-            warnings.warn(
-                "POTCAR directory not set up with pymatgen, so no input files will be "
-                "generated (you should use vasp_input.vasp_gam_files() to create the "
-                "initial relaxation files, then continue from this pre-converged "
-                "structure with vasp_std)"
-            )
-        return  # exit here
-    defect_relax_set.potcar.write_file(vaspstdinputdir + "POTCAR")
-
-    if unperturbed_poscar:
-        vaspstdposcar.write_file(vaspstdinputdir + "POSCAR")
+        warnings.warn(
+            "POTCAR directory not set up with pymatgen, so no input files will be "
+            "generated (you should use vasp_input.vasp_gam_files() to create the "
+            "initial relaxation files, then continue from this pre-converged "
+            "structure with vasp_std)"
+        )
+        return {}  # exit here
 
-    relax_set_incar = defect_relax_set.incar
-    try:
-        # Only set if change in NELECT
-        nelect = relax_set_incar.as_dict()["NELECT"]
-    except KeyError:
-        # Get NELECT if no change (-dNELECT = 0)
-        nelect = defect_relax_set.nelect
+    potcar_string, nelect = _get_potcar_and_nelect(defect_relax_set)
+    nelect -= defect_relax_set.charge  # NELECT of the charged defect supercell
 
     # Variable parameters first
     vaspstdincardict = {
@@ -465,10 +571,12 @@ def vasp_std_files(
     if kpoints_settings:
         vaspstdkpointsdict.update(kpoints_settings)
     vaspstdkpts = Kpoints.from_dict(vaspstdkpointsdict)
-    vaspstdkpts.write_file(vaspstdinputdir + "KPOINTS")
-
     vaspstdincar = Incar.from_dict(vaspstdincardict)
-    vaspstdincar.write_file(vaspstdinputdir + "INCAR")
+
+    files = {"INCAR": str(vaspstdincar), "KPOINTS": str(vaspstdkpts), "POTCAR": potcar_string}
+    if unperturbed_poscar:
+        files["POSCAR"] = str(vaspstdposcar)
+    return files
 
 
 def vasp_ncl_files(
@@ -520,6 +628,32 @@ def vasp_ncl_files(
             important.
             (default: False)
     """
+    vaspnclinputdir = input_dir + "/vasp_ncl/" if input_dir else "VASP_Files/vasp_ncl/"
+    _write_rendered_files(
+        vaspnclinputdir,
+        _render_vasp_ncl_files(
+            single_defect_dict,
+            incar_settings=incar_settings,
+            kpoints_settings=kpoints_settings,
+            potcar_settings=potcar_settings,
+            unperturbed_poscar=unperturbed_poscar,
+        ),
+    )
+
+
+def _render_vasp_ncl_files(
+    single_defect_dict: dict,
+    incar_settings: dict = None,
+    kpoints_settings: dict = None,
+    potcar_settings: dict = None,
+    unperturbed_poscar: bool = False,
+    defect_relax_set: DefectRelaxSet = None,
+) -> dict:
+    """
+    Contents of the vasp_ncl input files ({filename: contents}) written by vasp_ncl_files(),
+    rendered in memory. defect_relax_set can be given to reuse an existing DefectRelaxSet of
+    single_defect_dict (with potcar_settings).
+    """
     supercell = single_defect_dict["Defect Structure"]
     poscar_comment = (
         single_defect_dict["POSCAR Comment"]
@@ -527,27 +661,11 @@ def vasp_ncl_files(
         else None
     )
 
-    # Directory
-    vaspnclinputdir = input_dir + "/vasp_ncl/" if input_dir else "VASP_Files/vasp_ncl/"
-    if not os.path.exists(vaspnclinputdir):
-        os.makedirs(vaspnclinputdir)
-
     warnings.filterwarnings(
         "ignore", category=BadInputSetWarning
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
-
-    potcar_dict = deepcopy(default_potcar_dict)
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
-    defect_relax_set = DefectRelaxSet(
-        supercell,
-        charge=single_defect_dict["Transformation Dict"]["charge"],
-        user_potcar_settings=potcar_dict["POTCAR"],
-        user_potcar_functional=potcar_dict["POTCAR_FUNCTIONAL"],
-    )
+    if defect_relax_set is None:
+        defect_relax_set = _get_defect_relax_set(single_defect_dict, potcar_settings)
     vaspnclposcar = defect_relax_set.poscar
     if poscar_comment:
         vaspnclposcar.comment = poscar_comment
@@ -560,28 +678,18 @@ def vasp_ncl_files(
                 "generated (POTCARs also needed to determine appropriate NELECT setting "
                 "in INCAR files)"
             )
-            vaspnclposcar.write_file(vaspnclinputdir + "POSCAR")
+            return {"POSCAR": str(vaspnclposcar)}
 
-        else:
-            warnings.warn(
-                "POTCAR directory not set up with pymatgen, so no input files will be "
-                "generated (you should use vasp_input.vasp_gam_files() to create the "
-                "initial relaxation files, then continue from this pre-converged "
-                "structure with vasp_std and finally vasp_ncl if SOC important)"
-            )
-        return  # exit here
-
-    defect_relax_set.potcar.write_file(vaspnclinputdir + "POTCAR")
-    if unperturbed_poscar:
-        vaspnclposcar.write_file(vaspnclinputdir + "POSCAR")
+        warnings.warn(
+            "POTCAR directory not set up with pymatgen, so no input files will be "
+            "generated (you should use vasp_input.vasp_gam_files() to create the "
+            "initial relaxation files, then continue from this pre-converged "
+            "structure with vasp_std and finally vasp_ncl if SOC important)"
+        )
+        return {}  # exit here
 
-    relax_set_incar = defect_relax_set.incar
-    try:
-        # Only set if change in NELECT
-        nelect = relax_set_incar.as_dict()["NELECT"]
-    except KeyError:
-        # Get NELECT if no change (-dNELECT = 0)
-        nelect = defect_relax_set.nelect
+    potcar_string, nelect = _get_potcar_and_nelect(defect_relax_set)
+    nelect -= defect_relax_set.charge  # NELECT of the charged defect supercell
 
     # Variable parameters first
     vaspnclincardict = {
@@ -632,6 +740,7 @@ def vasp_ncl_files(
                 )
         vaspnclincardict.update(incar_settings)
 
+    kpoints_settings = dict(kpoints_settings) if kpoints_settings else None  # don't modify
     k_grid = (
         kpoints_settings.pop("kpoints")[0]
         if (kpoints_settings and "kpoints" in kpoints_settings)
@@ -658,10 +767,377 @@ def vasp_ncl_files(
         modified_kpts_dict = vasp_ncl_kpts.as_dict()
         modified_kpts_dict.update(kpoints_settings)
         vasp_ncl_kpts = Kpoints.from_dict(modified_kpts_dict)
-    vasp_ncl_kpts.write_file(vaspnclinputdir + "KPOINTS")
-
     vaspnclincar = Incar.from_dict(vaspnclincardict)
-    vaspnclincar.write_file(vaspnclinputdir + "INCAR")
+
+    files = {"INCAR": str(vaspnclincar), "KPOINTS": str(vasp_ncl_kpts), "POTCAR": potcar_string}
+    if unperturbed_poscar:
+        files["POSCAR"] = str(vaspnclposcar)
+    return files
+
+
+_renderers = {
+    "vasp_gam": _render_vasp_gam_files,
+    "vasp_std": _render_vasp_std_files,
+    "vasp_ncl": _render_vasp_ncl_files,
+}
+
+
+def write_defect_campaign(
+    defect_input_dict: dict,
+    stages: tuple = ("vasp_gam", "vasp_std", "vasp_ncl"),
+    output_path: str = ".",
+    workers: int = None,
+    incar_settings: dict = None,
+    kpoints_settings: dict = None,
+    potcar_settings: dict = None,
+    unperturbed_poscar: bool = False,
+    manifest_file: str = "defect_campaign_manifest.json",
+    dry_run: bool = False,
+) -> dict:
+    """
+    Generates the input files of all defects in defect_input_dict, for each calculation stage
+    (vasp_gam, vasp_std and/or vasp_ncl; as from vasp_gam_files(), vasp_std_files() and
+    vasp_ncl_files()), in {output_path}/{defect folder}/{stage}/.
+    All files are first rendered in memory (with one DefectRelaxSet per defect, shared between
+    stages), then only new or changed files are written, concurrently. Existing files are
+    compared to the rendered files by their SHA-256 hashes (which are also recorded in a json
+    manifest), so that regenerating the inputs (e.g. after changing an INCAR setting) only
+    touches the files which actually change, including any edited by hand since.
+    Args:
+        defect_input_dict (dict):
+            Dictionary of defect calculations from prepare_vasp_defect_inputs(), with the
+            defect folder names as keys.
+        stages (tuple):
+            Calculation stages to generate input files for ("vasp_gam", "vasp_std" and/or
+            "vasp_ncl").
+            (default: ("vasp_gam", "vasp_std", "vasp_ncl"))
+        output_path (str):
+            Folder in which to create the defect folders.
+            (default: ".")
+        workers (int):
+            Number of threads to write files with. Default is the ThreadPoolExecutor default.
+            (default: None)
+        incar_settings (dict):
+            Dictionary of user INCAR settings to override default settings, for all stages,
+            or a dictionary of these for each stage (e.g. {"vasp_std": {"KPAR": 4}}).
+            (default: None)
+        kpoints_settings (dict):
+            Dictionary of user KPOINTS settings (see vasp_std_files() and vasp_ncl_files()),
+            for all stages, or a dictionary of these for each stage. Not used for vasp_gam.
+            (default: None)
+        potcar_settings (dict):
+            Dictionary of user POTCAR settings to override default settings.
+            (default: None)
+        unperturbed_poscar (bool):
+            If True, write the unperturbed defect POSCAR to the vasp_std and vasp_ncl folders
+            as well (always written for vasp_gam).
+            (default: False)
+        manifest_file (str):
+            Json file (relative to output_path) in which to record the files and their
+            hashes, as {file path relative to output_path: {"sha256", "size"}}. Merged with
+            any existing manifest.
+            (default: "defect_campaign_manifest.json")
+        dry_run (bool):
+            If True, don't write any files (or the manifest), only report which files would
+            be created or changed.
+            (default: False)
+
+    vasp_ncl files which have since been set up from the finished vasp_std calculations with
+    vasp_std_to_ncl() (as recorded in its state file in output_path, e.g. the symmetrised
+    KPOINTS and relaxed POSCAR) are not regenerated.
+
+    Returns:
+        Dictionary of the (relative) file paths which were (or, if dry_run, would be)
+        "created" or "changed", those which were "unchanged", and those which were
+        "skipped" (as they were handed off by vasp_std_to_ncl()).
+    """
+    unknown_stages = set(stages) - set(_renderers)
+    if unknown_stages:
+        raise ValueError(
+            f"Unrecognised stages {sorted(unknown_stages)}, must be in {list(_renderers)}"
+        )
+
+    def _stage_settings(settings, stage):
+        if settings and set(settings).issubset(_renderers):  # per-stage settings
+            return settings.get(stage)
+        return settings
+
+    rendered_files = {}
+    for defect_folder, single_defect_dict in defect_input_dict.items():
+        defect_relax_set = _get_defect_relax_set(single_defect_dict, potcar_settings)
+        for stage in stages:
+            render_kwargs = {"incar_settings": _stage_settings(incar_settings, stage)}
+            if stage != "vasp_gam":
+                render_kwargs["kpoints_settings"] = _stage_settings(kpoints_settings, stage)
+                render_kwargs["unperturbed_poscar"] = unperturbed_poscar
+            files = _renderers[stage](
+                single_defect_dict, defect_relax_set=defect_relax_set, **render_kwargs
+            )
+            for filename, contents in files.items():
+                rendered_files[f"{defect_folder}/{stage}/{filename}"] = contents.encode()
+
+    handoff_state_path = os.path.join(output_path, VASP_STD_TO_NCL_STATE)
+    handoff_state = loadfn(handoff_state_path) if os.path.exists(handoff_state_path) else {}
+    handed_off_files = {
+        f"{calc_folder}/vasp_ncl/{filename}"
+        for calc_folder, handoff in handoff_state.items()
+        for filename in handoff["files"]
+    }
+
+    manifest_path = os.path.join(output_path, manifest_file)
+    manifest = loadfn(manifest_path) if os.path.exists(manifest_path) else {}
+    hashes = {}  # many files (e.g. POTCARs) are identical, so only hash each once
+    report = {"created": [], "changed": [], "unchanged": [], "skipped": []}
+    for path, contents in rendered_files.items():
+        if path in handed_off_files:
+            report["skipped"].append(path)
+            continue
+        if contents not in hashes:
+            hashes[contents] = hashlib.sha256(contents).hexdigest()
+        file_record = {"sha256": hashes[contents], "size": len(contents)}
+        full_path = os.path.join(output_path, path)
+        if not os.path.exists(full_path):
+            report["created"].append(path)
+        elif os.path.getsize(full_path) != len(contents):
+            report["changed"].append(path)
+        else:  # always compare to the file contents, in case it was edited since
+            with open(full_path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == file_record["sha256"]:
+                    report["unchanged"].append(path)
+                else:
+                    report["changed"].append(path)
+        manifest[path] = file_record
+
+    if dry_run:
+        return report
+
+    def _write_file(path):
+        full_path = os.path.join(output_path, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(rendered_files[path])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_write_file, report["created"] + report["changed"]))
+
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    dumpfn(manifest, manifest_path, indent=2)
+    return report
+
+
+def _vasp_run_finished(calc_dir: str) -> bool:
+    """Whether the VASP run in calc_dir has finished (i.e. OUTCAR has its final timings)."""
+    outcar = os.path.join(calc_dir, "OUTCAR")
+    if not os.path.exists(outcar):
+        return False
+    with open(outcar, "rb") as f:
+        f.seek(max(os.path.getsize(outcar) - 20000, 0))
+        return b"General timing and accounting" in f.read()
+
+
+def _link_or_copy(src: str, dst: str, link: bool = True) -> None:
+    """
+    Hard link src to dst (replacing any existing dst), falling back to copying if hard
+    links aren't possible (e.g. different filesystems).
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def _vasp_outputs_disabled(calc_dir: str) -> bool:
+    """
+    Whether the INCAR in calc_dir sets both LWAVE and LCHARG to False, so that VASP doesn't
+    write to WAVECAR or CHGCAR (which is needed for these to be safely hard linked).
+    """
+    incar_path = os.path.join(calc_dir, "INCAR")
+    if not os.path.exists(incar_path):
+        return False
+    incar = Incar.from_file(incar_path)
+    return incar.get("LWAVE", True) is False and incar.get("LCHARG", True) is False
+
+
+def _get_isym(incar: dict) -> int:
+    """ISYM used by VASP for incar (the VASP default if not set)."""
+    return int(incar.get("ISYM", 3 if incar.get("LHFCALC", False) else 2))
+
+
+def _get_ibzkpt_issue(vasp_std_dir: str, vasp_ncl_dir: str):
+    """
+    Reason why the irreducible kpoints of the vasp_std run (IBZKPT) can't be used for the
+    vasp_ncl calculation, or None if they can. They can only be used if vasp_ncl uses the
+    same symmetry (ISYM) as vasp_std, as VASP can't unfold a kpoint list which was reduced
+    with more symmetry (e.g. for the full kpoint grid needed for the Hartree-Fock exchange
+    with ISYM = 0), and if vasp_ncl is not spin polarised or given initial magnetic moments
+    (which can break the symmetry of the vasp_std run).
+    """
+    ncl_incar_path = os.path.join(vasp_ncl_dir, "INCAR")
+    if not os.path.exists(ncl_incar_path):
+        return "there is no vasp_ncl INCAR to check the symmetry settings of"
+    ncl_incar = Incar.from_file(ncl_incar_path)
+    std_incar_path = os.path.join(vasp_std_dir, "INCAR")
+    std_incar = Incar.from_file(std_incar_path) if os.path.exists(std_incar_path) else {}
+    if _get_isym(ncl_incar) != _get_isym(std_incar):
+        return (
+            f"vasp_ncl uses ISYM = {_get_isym(ncl_incar)} but the vasp_std kpoints were "
+            f"reduced with ISYM = {_get_isym(std_incar)}"
+        )
+    if ncl_incar.get("ISPIN", 1) == 2 or "MAGMOM" in ncl_incar:
+        return "vasp_ncl is spin polarised (ISPIN = 2 or MAGMOM set)"
+    return None
+
+
+def _handoff_vasp_std_to_ncl(calc_folder: str, link_files: tuple, link: bool) -> list:
+    """
+    Set up {calc_folder}/vasp_ncl from the finished {calc_folder}/vasp_std run (see
+    vasp_std_to_ncl()), returning the files written.
+    """
+    vasp_std_dir = os.path.join(calc_folder, "vasp_std")
+    vasp_ncl_dir = os.path.join(calc_folder, "vasp_ncl")
+    os.makedirs(vasp_ncl_dir, exist_ok=True)
+    link = link and _vasp_outputs_disabled(vasp_ncl_dir)
+
+    written = []
+    ibzkpt_issue = _get_ibzkpt_issue(vasp_std_dir, vasp_ncl_dir)
+    if ibzkpt_issue is None:
+        with open(os.path.join(vasp_std_dir, "IBZKPT")) as f:
+            ibzkpt_lines = f.read().splitlines(keepends=True)
+        ibzkpt_lines[0] = "Symmetrised KPOINTS for vasp_ncl, from vasp_std IBZKPT (doped)\n"
+        with open(os.path.join(vasp_ncl_dir, "KPOINTS"), "w") as f:
+            f.write("".join(ibzkpt_lines))
+        written.append("KPOINTS")
+    else:
+        warnings.warn(
+            f"Not using the vasp_std IBZKPT as KPOINTS for {vasp_ncl_dir}, as {ibzkpt_issue}, "
+            f"so the vasp_ncl KPOINTS (e.g. the full kpoint mesh from vasp_ncl_files()) are "
+            f"left unchanged."
+        )
+    shutil.copyfile(
+        os.path.join(vasp_std_dir, "CONTCAR"), os.path.join(vasp_ncl_dir, "POSCAR")
+    )
+    written.append("POSCAR")
+
+    for filename in link_files:
+        src = os.path.join(vasp_std_dir, filename)
+        if os.path.exists(src) and os.path.getsize(src) > 0:
+            _link_or_copy(src, os.path.join(vasp_ncl_dir, filename), link=link)
+            written.append(filename)
+    potcar = os.path.join(vasp_std_dir, "POTCAR")
+    if os.path.exists(potcar) and not os.path.exists(os.path.join(vasp_ncl_dir, "POTCAR")):
+        # VASP never writes to POTCAR, so it can always be hard linked
+        _link_or_copy(potcar, os.path.join(vasp_ncl_dir, "POTCAR"))
+        written.append("POTCAR")
+    return written
+
+
+def vasp_std_to_ncl(
+    output_path: str = ".",
+    link_files: tuple = ("CHGCAR", "WAVECAR"),
+    link: bool = False,
+    workers: int = None,
+    state_file: str = VASP_STD_TO_NCL_STATE,
+) -> dict:
+    """
+    Sets up the vasp_ncl (SOC) calculations of all finished vasp_std calculations in
+    output_path (i.e. all {folder}/vasp_std subfolders, for defects or competing phases),
+    as in the `chempot_std_to_ncl.sh` step of the ToDo:
+    - KPOINTS is written from the irreducible kpoints of the vasp_std run (vasp_std/IBZKPT),
+      rather than the full kpoint mesh from vasp_ncl_files(). This is only done if the
+      vasp_ncl INCAR uses the same symmetry setting (ISYM) as vasp_std and is not spin
+      polarised (ISPIN = 2) or given initial magnetic moments (MAGMOM), as otherwise the
+      vasp_std kpoints were reduced with symmetry that vasp_ncl doesn't use (e.g. the
+      competing phase vasp_ncl INCARs set ISYM = 0, as the Hartree-Fock exchange needs the
+      full kpoint grid); a warning is given and the vasp_ncl KPOINTS are left unchanged.
+    - vasp_std/CONTCAR is copied to vasp_ncl/POSCAR.
+    - vasp_std/CHGCAR and WAVECAR (link_files) are copied to vasp_ncl (or hard linked, see
+      link), and POTCAR is hard linked if vasp_ncl doesn't already have one.
+    The vasp_ncl INCARs are not touched, so should be generated beforehand with
+    vasp_ncl_files() or write_defect_campaign() (which then leaves the handed-off files
+    alone when rerun).
+    Folders are handed off concurrently, and recorded in a json state file as they finish,
+    so the function can be rerun as more vasp_std calculations finish (or after being
+    interrupted); folders are only handed off again if vasp_std/CONTCAR has changed since.
+    Args:
+        output_path (str):
+            Folder to search (recursively) for vasp_std calculation folders.
+            (default: ".")
+        link_files (tuple):
+            vasp_std output files to reuse in vasp_ncl (skipped if missing or empty).
+            (default: ("CHGCAR", "WAVECAR"))
+        link (bool):
+            If True, hard link link_files rather than copying them, to save time and disk
+            space, for folders where the vasp_ncl INCAR sets LWAVE = False and
+            LCHARG = False. Hard links share their data with the vasp_std files, which
+            would otherwise be overwritten when vasp_ncl writes its own CHGCAR or WAVECAR,
+            so link_files are copied for all other folders.
+            (default: False)
+        workers (int):
+            Number of threads to hand off folders with. Default is the ThreadPoolExecutor
+            default.
+            (default: None)
+        state_file (str):
+            Json file (relative to output_path) in which to record the handed-off folders,
+            as {folder relative to output_path: {"contcar_mtime", "files"}}.
+            (default: "vasp_std_to_ncl_state.json")
+
+    Returns:
+        Dictionary of the (relative) folders which were "handed_off", "unchanged" (already
+        handed off) or "unfinished" (vasp_std not finished, or IBZKPT/CONTCAR missing).
+    """
+    state_path = os.path.join(output_path, state_file)
+    state = loadfn(state_path) if os.path.exists(state_path) else {}
+
+    report = {"handed_off": [], "unchanged": [], "unfinished": []}
+    to_hand_off = {}
+    for root, dirs, _files in os.walk(output_path):
+        if "vasp_std" not in dirs:
+            continue
+        dirs.remove("vasp_std")  # don't search the calculation folders themselves
+        calc_folder = os.path.relpath(root, output_path).replace(os.sep, "/")
+        vasp_std_dir = os.path.join(root, "vasp_std")
+        if not (
+            _vasp_run_finished(vasp_std_dir)
+            and os.path.exists(os.path.join(vasp_std_dir, "IBZKPT"))
+            and os.path.exists(os.path.join(vasp_std_dir, "CONTCAR"))
+        ):
+            report["unfinished"].append(calc_folder)
+            continue
+        contcar_mtime = os.path.getmtime(os.path.join(vasp_std_dir, "CONTCAR"))
+        if state.get(calc_folder, {}).get("contcar_mtime") == contcar_mtime:
+            report["unchanged"].append(calc_folder)
+        else:
+            to_hand_off[calc_folder] = contcar_mtime
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _handoff_vasp_std_to_ncl,
+                os.path.join(output_path, calc_folder),
+                link_files,
+                link,
+            ): calc_folder
+            for calc_folder in to_hand_off
+        }
+        for future in as_completed(futures):
+            calc_folder = futures[future]
+            state[calc_folder] = {
+                "contcar_mtime": to_hand_off[calc_folder],
+                "files": future.result(),
+            }
+            report["handed_off"].append(calc_folder)
+            dumpfn(state, state_path, indent=2)  # so an interrupted run can be resumed
+
+    for folders in report.values():
+        folders.sort()
+    return report
 
 
 def is_metal(element: "pymatgen.core.periodic_table.Element") -> bool:
@@ -772,14 +1248,9 @@ def vasp_converge_files(
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
 
     # POTCAR
-    potcar_dict = deepcopy(default_potcar_dict)
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
+    potcar_dict = _get_potcar_dict(potcar_settings)
     vaspconvergeinput = DictSet(structure, config_dict=potcar_dict)
-    vaspconvergeinput.potcar.write_file(vaspconvergeinputdir + "POTCAR")
+    _write_potcar(vaspconvergeinput, vaspconvergeinputdir + "POTCAR")
 
     vaspconvergekpts = Kpoints().from_dict(
         {"comment": "Kpoints from vasp_gam_files", "generation_style": "Gamma"}
@@ -799,6 +1270,26 @@ def vasp_converge_files(
             config_file.write(f"""\nname="{input_dir[13:]}" # input_dir""")
 
 
+def _update_kpoints_dict(
+    kpoints_dict: dict, structure: "pymatgen.core.Structure", kpoints_settings: dict = None
+) -> dict:
+    """
+    Update kpoints_dict (in Kpoints.from_dict() format) with kpoints_settings, which can also
+    give a "reciprocal_density" or "kspacing" (see doped.kpoints.get_kpoint_meshes()) to use a
+    Gamma-centred mesh of that density for the structure.
+    """
+    kpoints_settings = dict(kpoints_settings) if kpoints_settings else {}  # don't modify
+    reciprocal_density = kpoints_settings.pop("reciprocal_density", None)
+    kspacing = kpoints_settings.pop("kspacing", None)
+    if reciprocal_density is not None or kspacing is not None:
+        mesh = get_kpoint_meshes(
+            [structure], reciprocal_density=reciprocal_density, kspacing=kspacing
+        )["meshes"][0]
+        kpoints_dict["kpoints"] = [mesh.tolist()]
+    kpoints_dict.update(kpoints_settings)
+    return kpoints_dict
+
+
 # Input files for vasp_std
 
 
@@ -827,7 +1318,9 @@ def vasp_std_chempot(
         kpoints_settings (dict):
             Dictionary of user KPOINTS settings (in pymatgen Kpoints.from_dict() format). Common
             options would be "generation_style": "Monkhorst" (rather than "Gamma"),
-            and/or "kpoints": [[3, 3, 1]] etc.
+            and/or "kpoints": [[3, 3, 1]] etc. A "reciprocal_density" (kpoints per inverse
+            Å^3) or "kspacing" (Å^-1) can be given instead of "kpoints", to generate a
+            Gamma-centred mesh of that density (see doped.kpoints.get_kpoint_meshes()).
             Default KPOINTS is Gamma-centred 2 x 2 x 2 mesh.
             (default: None)
         potcar_settings (dict):
@@ -878,14 +1371,9 @@ def vasp_std_chempot(
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
 
     # POTCAR
-    potcar_dict = default_potcar_dict
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
+    potcar_dict = _get_potcar_dict(potcar_settings)
     vaspstdinput = DictSet(structure, config_dict=potcar_dict)
-    vaspstdinput.potcar.write_file(vaspstdinputdir + "POTCAR")
+    _write_potcar(vaspstdinput, vaspstdinputdir + "POTCAR")
 
     if all(is_metal(element) for element in structure.composition.elements):
         vaspstdincardict["ISMEAR"] = "2 # Metal, use Methfessel-Paxton smearing scheme"
@@ -918,8 +1406,7 @@ def vasp_std_chempot(
         "generation_style": "Gamma",  # Set to Monkhorst for Monkhorst-Pack generation
         "kpoints": [[2, 2, 2]],
     }
-    if kpoints_settings:
-        vaspstdkpointsdict.update(kpoints_settings)
+    _update_kpoints_dict(vaspstdkpointsdict, structure, kpoints_settings)
     vaspstdkpts = Kpoints.from_dict(vaspstdkpointsdict)
     vaspstdkpts.write_file(vaspstdinputdir + "KPOINTS")
 
@@ -941,7 +1428,9 @@ def vasp_ncl_chempot(
 ) -> None:
     """
     Generates INCAR, POTCAR and KPOINTS for vasp_ncl chemical potentials relaxation.
-    Take CONTCAR from vasp_std for POSCAR.:
+    Take CONTCAR from vasp_std for POSCAR. As vasp_ncl calculations are run without symmetry,
+    NKRED = 2 is set if the kpoint mesh is even (and at least 4) along each direction (unless
+    NKRED is given in incar_settings).:
     Args:
         structure (Structure object):
             Structure to create input files for.
@@ -958,7 +1447,9 @@ def vasp_ncl_chempot(
         kpoints_settings (dict):
             Dictionary of user KPOINTS settings (in pymatgen Kpoints.from_dict() format). Common
             options would be "generation_style": "Monkhorst" (rather than "Gamma"),
-            and/or "kpoints": [[3, 3, 1]] etc.
+            and/or "kpoints": [[3, 3, 1]] etc. A "reciprocal_density" (kpoints per inverse
+            Å^3) or "kspacing" (Å^-1) can be given instead of "kpoints", to generate a
+            Gamma-centred mesh of that density (see doped.kpoints.get_kpoint_meshes()).
             Default KPOINTS is Gamma-centred 2 x 2 x 2 mesh.
             (default: None)
         potcar_settings (dict):
@@ -1007,14 +1498,9 @@ def vasp_ncl_chempot(
     )  # Ignore POTCAR warnings because Pymatgen incorrectly detecting POTCAR types
 
     # POTCAR
-    potcar_dict = default_potcar_dict
-    if potcar_settings:
-        if "POTCAR_FUNCTIONAL" in potcar_settings.keys():
-            potcar_dict["POTCAR_FUNCTIONAL"] = potcar_settings["POTCAR_FUNCTIONAL"]
-        if "POTCAR" in potcar_settings.keys():
-            potcar_dict["POTCAR"].update(potcar_settings.pop("POTCAR"))
+    potcar_dict = _get_potcar_dict(potcar_settings)
     vaspnclinput = DictSet(structure, config_dict=potcar_dict)
-    vaspnclinput.potcar.write_file(vaspnclinputdir + "POTCAR")
+    _write_potcar(vaspnclinput, vaspnclinputdir + "POTCAR")
 
     if all(is_metal(element) for element in structure.composition.elements):
         vaspnclincardict["ISMEAR"] = "2 # Metal, use Methfessel-Paxton smearing scheme"
@@ -1043,10 +1529,12 @@ def vasp_ncl_chempot(
         "generation_style": "Gamma",  # Set to Monkhorst for Monkhorst-Pack generation
         "kpoints": [[2, 2, 2]],
     }
-    if kpoints_settings:
-        vaspnclkpointsdict.update(kpoints_settings)
+    _update_kpoints_dict(vaspnclkpointsdict, structure, kpoints_settings)
     vaspnclkpts = Kpoints.from_dict(vaspnclkpointsdict)
     vaspnclkpts.write_file(vaspnclinputdir + "KPOINTS")
+    # no symmetry for vasp_ncl, so NKRED can be used if the mesh is even (and >= 4)
+    if is_nkred_eligible(vaspnclkpts.kpts[0]) and "NKRED" not in vaspnclincardict:
+        vaspnclincardict["NKRED"] = "2 # Even kpoint mesh, so can reduce HF kpoints"
 
     # INCAR
     vaspnclincar = Incar.from_dict(vaspnclincardict)
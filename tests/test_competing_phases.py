@@ -0,0 +1,410 @@
+import os
+import shutil
+import unittest
+import warnings
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from monty.serialization import dumpfn, loadfn
+from monty.tempfile import ScratchDir
+from pymatgen.core.composition import Composition
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import Structure
+from pymatgen.entries.computed_entries import ComputedStructureEntry
+from pymatgen.io.vasp.inputs import Kpoints
+from pymatgen.io.vasp.outputs import Vasprun
+from pymatgen.io.vasp.sets import DictSet
+
+from doped import competing_phases
+from doped.competing_phases import (
+    CompetingPhases,
+    CompetingPhasesAnalyzer,
+    KpointConvergencePlanner,
+    _get_file_hash,
+    _get_kpoint_ladder,
+    _parse_vasprun_energies,
+    _parse_vaspruns,
+    _write_vasp_inputs,
+    make_molecule_in_a_box,
+)
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples")
+
+EXPLICIT_KPOINTS_VASPRUN = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<modeling>
+ <kpoints>
+  <varray name="kpointlist" >
+   <v>       0.00000000       0.00000000       0.00000000 </v>
+   <v>       0.50000000       0.00000000       0.00000000 </v>
+  </varray>
+ </kpoints>
+ <atominfo>
+  <array name="atoms" >
+   <set>
+    <rc><c>Mg</c><c>   1</c></rc>
+    <rc><c>O </c><c>   2</c></rc>
+   </set>
+  </array>
+ </atominfo>
+ <calculation>
+  <energy>
+   <i name="e_fr_energy">    -10.00000000 </i>
+   <i name="e_wo_entrp">    -10.00000000 </i>
+   <i name="e_0_energy">    -10.00000000 </i>
+  </energy>
+ </calculation>
+</modeling>
+"""
+
+
+class ListEntryProvider:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get_entries_in_chemsys(self, elements, inc_structure=None, property_data=None):
+        return self.entries
+
+
+class CompetingPhasesTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        mg = Structure(Lattice.cubic(3.2), ["Mg"], [[0, 0, 0]])
+        mgo = Structure(Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+        o2 = Structure(Lattice.cubic(10), ["O", "O"], [[0, 0, 0], [0, 0, 0.12]])
+        # same as mgo, with a different origin and site order
+        shifted_mgo = Structure(Lattice.cubic(4.2), ["O", "Mg"], [[0.6, 0.1, 0.5], [0.1, 0.6, 0]])
+        self.entries = []
+        for i, (structure, formula) in enumerate(
+            [(mg, "Mg"), (mg, "Mg"), (mg * (2, 1, 1), "Mg"), (mgo, "MgO"), (o2, "O2"),
+             (o2 * (1, 1, 2), "O2"), (shifted_mgo, "MgO")]
+        ):
+            self.entries.append(
+                ComputedStructureEntry(
+                    structure,
+                    -1.0 * len(structure),
+                    entry_id=f"mp-{i}",
+                    data={
+                        "pretty_formula": formula,
+                        "e_above_hull": 0.0,
+                        "band_gap": 0.0,
+                        "nsites": 1,
+                        "formation_energy_per_atom": 0.0,
+                        "total_magnetization": 0.0,
+                    },
+                )
+            )
+
+    def test_unique_competing_phases(self):
+        # duplicate entries are skipped before symmetrisation
+        with mock.patch.object(
+            competing_phases,
+            "_get_primitive_standard_structure",
+            wraps=competing_phases._get_primitive_standard_structure,
+        ) as get_primitive_standard_structure:
+            CompetingPhases(["Mg", "O"], entry_provider=ListEntryProvider(self.entries))
+        self.assertEqual(get_primitive_standard_structure.call_count, 3)  # Mg, Mg supercell, MgO
+
+        for processes in [1, 2]:
+            cp = CompetingPhases(
+                ["Mg", "O"], entry_provider=ListEntryProvider(self.entries), processes=processes
+            )
+            self.assertEqual(
+                [phase["formula"] for phase in cp.competing_phases], ["Mg", "MgO", "O2"]
+            )
+            self.assertEqual(len(cp.competing_phases[0]["structure"]), 1)
+            self.assertTrue(cp.competing_phases[2]["molecule"])
+
+    def test_molecules_in_a_box(self):
+        structure, formula, magnetisation = make_molecule_in_a_box("O2")
+        self.assertEqual((formula, magnetisation), ("O2", 2))
+        self.assertAlmostEqual(structure.lattice.a, 30)
+        self.assertAlmostEqual(structure.get_distance(0, 1), 1.22)
+        structure.translate_sites([0], [0.1, 0, 0])  # cached structure is not modified
+        self.assertAlmostEqual(make_molecule_in_a_box("O2")[0].get_distance(0, 1), 1.22)
+        with self.assertRaises(ValueError):
+            make_molecule_in_a_box("Mg")
+
+        cp = CompetingPhases(
+            ["Mg", "O"], entry_provider=ListEntryProvider(self.entries), processes=1,
+            molecule_box_size=20, molecule_bond_lengths={"O2": 1.21},
+        )
+        o2 = cp.competing_phases[2]["structure"]
+        self.assertAlmostEqual(o2.lattice.a, 20)
+        self.assertAlmostEqual(o2.get_distance(0, 1), 1.21)
+
+
+class WriteVaspInputsTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.structure = Structure(
+            Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        )
+
+    def test_write_vasp_inputs(self):
+        config = competing_phases._load_config("HSE06_config_relax.json")
+        dis = DictSet(
+            self.structure, config, user_kpoints_settings={"reciprocal_density": 45},
+            user_incar_settings={"ISPIN": 2}, force_gamma=True,
+        )
+        with ScratchDir("."):
+            dis.write_input("reference", potcar_spec=True)
+            manifest = _write_vasp_inputs(
+                [(dis, {"MgO/k1": None, "MgO/k2": Kpoints.gamma_automatic((2, 2, 2))})],
+                threads=2,
+                manifest_file="manifest.json",
+                potcar_spec=True,
+            )
+            for filename in ["INCAR", "POSCAR", "KPOINTS", "POTCAR.spec"]:
+                with open(f"reference/{filename}") as f, open(f"MgO/k1/{filename}") as f1:
+                    self.assertEqual(f.read(), f1.read())
+            self.assertEqual(Kpoints.from_file("MgO/k2/KPOINTS").kpts, [[2, 2, 2]])
+            self.assertEqual(manifest["MgO/k2"]["kpoints"], [[2, 2, 2]])
+            self.assertEqual(manifest["MgO/k1"]["potcar_symbols"], ["Mg_pv", "O"])
+
+            _write_vasp_inputs([(dis, {"MgO/k3": None})], manifest_file="manifest.json",
+                               potcar_spec=True)
+            self.assertEqual(sorted(loadfn("manifest.json")), ["MgO/k1", "MgO/k2", "MgO/k3"])
+
+
+class KpointConvergencePlannerTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.structure = Structure(
+            Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        )
+        self.vasprun_path = os.path.join(EXAMPLE_DIR, "YTOS/Bulk/vasprun.xml.gz")
+        competing_phases._vasprun_energies_cache.clear()
+
+    def test_kpoint_ladder(self):
+        rungs = _get_kpoint_ladder(self.structure, range(5, 60, 5))
+        knames = [rung["kname"] for rung in rungs]
+        self.assertEqual(len(knames), len(set(knames)))
+        self.assertLess(len(knames), len(range(5, 60, 5)))
+        self.assertEqual(rungs[0]["reciprocal_density"], 5)
+
+    def test_update(self):
+        with ScratchDir("."):
+            rungs = _get_kpoint_ladder(self.structure, range(5, 60, 5))
+            for rung in rungs[:3]:
+                rung["written"] = True
+            planner = KpointConvergencePlanner(
+                {"MgO/kpoint_converge": {
+                    "formula": "MgO", "structure": self.structure, "user_incar_settings": {},
+                    "rungs": rungs, "converged_kpoints": None}},
+                batch_size=3,
+                state_file="kpoint_convergence.json",
+            )
+            for rung in rungs[1:3]:
+                os.makedirs(f"MgO/kpoint_converge/{rung['kname']}")
+                shutil.copy(self.vasprun_path, f"MgO/kpoint_converge/{rung['kname']}")
+            os.makedirs(f"MgO/kpoint_converge/{rungs[0]['kname']}")
+            with open(f"MgO/kpoint_converge/{rungs[0]['kname']}/vasprun.xml", "w") as f:
+                f.write("<?xml version='1.0'?>\n<modeling>\n")  # unfinished calculation
+
+            self.assertEqual(planner.update(), [])  # first rung still running
+            self.assertIsNone(rungs[0]["energy_per_atom"])
+            self.assertEqual(planner.unconverged_phases, ["MgO/kpoint_converge"])
+            resumed = KpointConvergencePlanner.from_file("kpoint_convergence.json")
+            self.assertEqual(resumed.batch_size, 3)
+            self.assertEqual(resumed.phases["MgO/kpoint_converge"]["rungs"], rungs)
+
+            # converged once consecutive rungs have the same energy
+            shutil.copy(self.vasprun_path, f"MgO/kpoint_converge/{rungs[0]['kname']}")
+            os.remove(f"MgO/kpoint_converge/{rungs[0]['kname']}/vasprun.xml")
+            self.assertEqual(resumed.update(), [])
+            self.assertEqual(resumed.converged_kpoints, {"MgO/kpoint_converge": rungs[0]["kname"]})
+            self.assertFalse(any(rung["written"] for rung in resumed.phases[
+                "MgO/kpoint_converge"]["rungs"][3:]))
+
+    def test_skip_rung(self):
+        with ScratchDir("."):
+            rungs = _get_kpoint_ladder(self.structure, range(5, 60, 5))
+            for rung in rungs[:3]:
+                rung["written"] = True
+            planner = KpointConvergencePlanner(
+                {"MgO/kpoint_converge": {
+                    "formula": "MgO", "structure": self.structure, "user_incar_settings": {},
+                    "rungs": rungs, "converged_kpoints": None}},
+                batch_size=3,
+                state_file="kpoint_convergence.json",
+            )
+            for rung in rungs[1:3]:
+                os.makedirs(f"MgO/kpoint_converge/{rung['kname']}")
+                shutil.copy(self.vasprun_path, f"MgO/kpoint_converge/{rung['kname']}")
+            os.makedirs(f"MgO/kpoint_converge/{rungs[0]['kname']}")
+            with open(f"MgO/kpoint_converge/{rungs[0]['kname']}/vasprun.xml", "w") as f:
+                f.write(EXPLICIT_KPOINTS_VASPRUN.split(" <calculation>")[0] + "</modeling>\n")
+
+            self.assertEqual(planner.update(), [])  # crashed before the first ionic step
+            self.assertEqual(planner.unconverged_phases, ["MgO/kpoint_converge"])
+            with self.assertRaises(ValueError):
+                planner.skip_rung("MgO/kpoint_converge", "k_missing")
+
+            # skipped rung is saved, and ignored for convergence
+            planner.skip_rung("MgO/kpoint_converge", rungs[0]["kname"])
+            self.assertEqual(planner.update(), [])
+            self.assertEqual(planner.converged_kpoints, {"MgO/kpoint_converge": rungs[1]["kname"]})
+            resumed = KpointConvergencePlanner.from_file("kpoint_convergence.json")
+            self.assertTrue(resumed.phases["MgO/kpoint_converge"]["rungs"][0]["skipped"])
+
+    def test_write_next_rungs_ismear(self):
+        rungs = _get_kpoint_ladder(self.structure, range(1, 60, 5))  # k1,1,1 first
+        planner = KpointConvergencePlanner(
+            {"MgO/kpoint_converge": {
+                "formula": "MgO", "structure": self.structure,
+                "user_incar_settings": {"ISMEAR": -5, "SIGMA": 0.2},
+                "rungs": rungs, "converged_kpoints": None}},
+            batch_size=3,
+        )
+        with mock.patch.object(
+            competing_phases, "_write_vasp_inputs", return_value={}
+        ) as mock_write:
+            planner.write_next_rungs()
+        input_sets = mock_write.call_args[0][0]
+        self.assertEqual(
+            [list(output_dirs) for _dis, output_dirs in input_sets],
+            [[f"MgO/kpoint_converge/{rung['kname']}"] for rung in rungs[:3]],
+        )
+        for dis, _output_dirs in input_sets:  # tetrahedron method only with >= 4 kpoints
+            n_kpoints = np.prod(dis.kpoints.kpts[0])
+            self.assertEqual(dis.incar["ISMEAR"], -5 if n_kpoints >= 4 else 0)
+        self.assertEqual(np.prod(input_sets[0][0].kpoints.kpts[0]), 1)
+        self.assertEqual(input_sets[-1][0].incar["ISMEAR"], -5)
+
+
+class CompetingPhasesAnalyzerTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.vasprun_path = os.path.join(EXAMPLE_DIR, "YTOS/Bulk/vasprun.xml.gz")
+        competing_phases._vasprun_energies_cache.clear()
+
+    def _get_analyzer(self, extrinsic_species):
+        elemental_energies = {"Mg": -1.5, "O": -4.9, "Al": -3.7, "Li": -1.9}
+        formation_energies = {"Mg": 0, "O2": 0, "MgO": -6.0, "MgO2": -5.5, "Al": 0,
+                              "Al2O3": -17.0, "MgAl2O4": -24.0, "Li": 0, "Li2O": -6.2,
+                              "LiAlO2": -12.5}
+        cpa = CompetingPhasesAnalyzer("MgO", extrinsic_species)
+        cpa.elemental_energies = {el: elemental_energies[el] for el in cpa.elemental}
+        cpa.data = []
+        for formula, formation_energy in formation_energies.items():
+            comp = Composition(formula)
+            if {str(el) for el in comp.elements}.issubset(cpa.elemental):
+                energy = formation_energy + sum(
+                    n * elemental_energies[str(el)] for el, n in comp.items()
+                )
+                cpa.data.append({"formula": formula, "energy_per_fu": energy, "energy": energy,
+                                 "formation_energy": formation_energy})
+        return cpa
+
+    def test_calculate_chempots_dopants(self):
+        with ScratchDir("."):
+            cpa = self._get_analyzer("Al")
+            cpa.calculate_chempots()
+            df = pd.read_csv("chempot_limits.csv")
+            self.assertEqual(list(df["Al"]), [0.0, -9.0])
+            self.assertEqual(list(df["Al_limiting_phase"]), ["Al", "MgAl2O4"])
+            self.assertEqual(list(cpa.chem_limits["facets"]), ["MgO-Mg-Al", "MgO-O2-MgAl2O4"])
+
+            cpa = self._get_analyzer(["Al", "Li"])
+            cpa.calculate_chempots()
+            df = pd.read_csv("chempot_limits.csv")
+            self.assertEqual(list(df["Al"]), [0.0, -9.0])
+            np.testing.assert_allclose(df["Li"], [-0.1, -3.1])
+            self.assertEqual(
+                list(cpa.chem_limits["facets"]), ["MgO-Mg-Al-Li2O", "MgO-O2-MgAl2O4-Li2O"]
+            )
+
+            # coupled through LiAlO2:
+            cpa = self._get_analyzer(["Al", "Li"])
+            cpa.calculate_chempots(full_sub_approach=True)
+            df = pd.read_csv("chempot_limits.csv")
+            np.testing.assert_allclose(df["Al"], [-0.4, -9.4])
+            np.testing.assert_allclose(df["Li"], [-0.1, -3.1])
+            self.assertEqual(list(df["Al_limiting_phase"]), ["LiAlO2", "LiAlO2"])
+
+    def test_calculate_chempots_stability_region(self):
+        with ScratchDir("."):
+            cpa = self._get_analyzer(["Al", "Li"])
+            cpa.calculate_chempots(csv_fname="pd.csv", use_stability_region=False)
+            region_cpa = self._get_analyzer(["Al", "Li"])
+            region_cpa.calculate_chempots(csv_fname="region.csv")
+            pd.testing.assert_frame_equal(pd.read_csv("pd.csv"), pd.read_csv("region.csv"))
+            self.assertEqual(cpa.chem_limits, region_cpa.chem_limits)
+
+            region = region_cpa.get_stability_region()
+            self.assertEqual(region.elements, ["Mg", "O", "Al", "Li"])
+
+    def test_parse_vasprun_energies(self):
+        vasprun_dict = Vasprun(self.vasprun_path).as_dict()
+        parsed = _parse_vasprun_energies(self.vasprun_path)
+        for key in ["unit_cell_formula", "reduced_cell_formula", "pretty_formula", "elements"]:
+            self.assertEqual(parsed[key], vasprun_dict[key])
+        self.assertEqual(parsed["input"]["kpoints"]["kpoints"],
+                         vasprun_dict["input"]["kpoints"]["kpoints"])
+        for key in ["final_energy", "final_energy_per_atom"]:
+            self.assertAlmostEqual(parsed["output"][key], vasprun_dict["output"][key])
+
+    def test_parse_vasprun_energies_explicit_kpoints(self):
+        with ScratchDir("."):
+            with open("vasprun.xml", "w") as f:
+                f.write(EXPLICIT_KPOINTS_VASPRUN)
+            parsed = _parse_vasprun_energies("vasprun.xml")
+            self.assertEqual(parsed["input"]["kpoints"]["kpoints"], [[0, 0, 0], [0.5, 0, 0]])
+            self.assertEqual(parsed["unit_cell_formula"], {"Mg": 1.0, "O": 1.0})
+            self.assertAlmostEqual(parsed["output"]["final_energy_per_atom"], -5.0)
+
+            with open("vasprun.xml", "w") as f:  # no ionic steps
+                f.write(EXPLICIT_KPOINTS_VASPRUN.split(" <calculation>")[0] + "</modeling>\n")
+            with self.assertRaises(ValueError):
+                _parse_vasprun_energies("vasprun.xml")
+
+    def test_from_vaspruns_cached(self):
+        cpa = CompetingPhasesAnalyzer("Y2Ti2S2O5")
+        with ScratchDir("."):
+            cpa.from_vaspruns(
+                [self.vasprun_path], csv_fname="energies.csv", processes=1, cache_file="cache.json"
+            )
+            df = pd.read_csv("energies.csv")
+            self.assertEqual(df["formula"][0], "Y2Ti2S2O5")
+            self.assertEqual(df["kpoints"][0], "1x1x1")
+            cache = loadfn("cache.json")
+            self.assertEqual(len(cache), 1)
+
+            # second parse uses the on-disk cache
+            competing_phases._vasprun_energies_cache.clear()
+            cache[list(cache)[0]]["output"]["final_energy"] = 0.0
+            dumpfn(cache, "cache.json")
+            cpa.from_vaspruns([self.vasprun_path], csv_fname="energies.csv", cache_file="cache.json")
+            self.assertEqual(pd.read_csv("energies.csv")["energy"][0], 0.0)
+
+    def test_parse_vaspruns_cache_files(self):
+        with ScratchDir("."):
+            vasprun_paths = [f"vasprun_{i}.xml" for i in range(3)]
+            for i, vasprun_path in enumerate(vasprun_paths):
+                with open(vasprun_path, "w") as f:
+                    f.write(EXPLICIT_KPOINTS_VASPRUN + f"<!-- {i} -->\n")
+            hashes = [_get_file_hash(vasprun_path) for vasprun_path in vasprun_paths]
+
+            # each cache file only stores the calculations parsed with it
+            _parse_vaspruns(vasprun_paths[:1], cache_file="cache_0.json")
+            _parse_vaspruns(vasprun_paths[1:], cache_file="cache_1.json")
+            self.assertEqual(set(loadfn("cache_0.json")), set(hashes[:1]))
+            self.assertEqual(set(loadfn("cache_1.json")), set(hashes[1:]))
+
+            # in-memory results are written to a new cache file
+            with mock.patch.object(competing_phases, "_parse_vasprun_energies") as parse:
+                _parse_vaspruns(vasprun_paths[:2], cache_file="cache_2.json")
+                parse.assert_not_called()
+            self.assertEqual(set(loadfn("cache_2.json")), set(hashes[:2]))
+
+            # the in-memory cache keeps only the most recent results
+            competing_phases._vasprun_energies_cache.clear()
+            with mock.patch.object(competing_phases, "_VASPRUN_ENERGIES_CACHE_SIZE", 2):
+                parsed = _parse_vaspruns(vasprun_paths)
+            self.assertEqual(len(parsed), 3)
+            self.assertEqual(list(competing_phases._vasprun_energies_cache), hashes[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
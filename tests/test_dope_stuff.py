@@ -0,0 +1,252 @@
+import os
+import shutil
+import unittest
+import warnings
+
+import numpy as np
+from scipy.optimize import bisect
+from pymatgen.analysis.defects.core import DefectEntry, Substitution, Vacancy
+from pymatgen.analysis.defects.thermodynamics import DefectPhaseDiagram
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.sites import PeriodicSite
+from pymatgen.core.structure import Structure
+from pymatgen.core.periodic_table import Element
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import Dos, FermiDos
+from monty.tempfile import ScratchDir
+
+from doped.dope_stuff import DefectTable, IncrementalDefectPhaseDiagram
+
+
+class DefectEntriesTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.bulk = Structure(
+            Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        ) * (2, 2, 2)
+        params = {"vbm": 1.0, "gap": 4.0}
+        self.parsed_defect_dict = {}
+        for q, e in [(2, -1.0), (1, 1.0), (0, 3.5)]:
+            self.parsed_defect_dict[f"vac_1_O_{q}"] = DefectEntry(
+                Vacancy(self.bulk, self.bulk[8], charge=q), e, parameters=dict(params)
+            )
+        for q, e in [(-2, 6.0), (-1, 4.5), (0, 3.2)]:
+            self.parsed_defect_dict[f"vac_2_Mg_{q}"] = DefectEntry(
+                Vacancy(self.bulk, self.bulk[0], charge=q), e, parameters=dict(params)
+            )
+        al_site = PeriodicSite("Al", self.bulk[0].frac_coords, self.bulk.lattice)
+        for q, e in [(1, 0.5), (0, 2.8)]:
+            self.parsed_defect_dict[f"sub_1_Al_on_Mg_{q}"] = DefectEntry(
+                Substitution(self.bulk, al_site, charge=q), e, parameters=dict(params)
+            )
+
+
+class IncrementalDefectPhaseDiagramTestCase(DefectEntriesTestCase):
+    def _check_matches_dpd(self, inc_dpd, entries):
+        # track names are fixed when each defect group is created, so only the defect names
+        # (before the "@") match those of a DefectPhaseDiagram built from the final entries
+        dpd = DefectPhaseDiagram(entries, 1.0, 4.0, filter_compatible=False)
+        self.assertEqual(
+            [track_name.split("@")[0] for track_name in inc_dpd.transition_level_map],
+            [track_name.split("@")[0] for track_name in dpd.transition_level_map],
+        )
+        for inc_track_name, track_name in zip(inc_dpd.transition_level_map,
+                                              dpd.transition_level_map):
+            np.testing.assert_allclose(
+                sorted(inc_dpd.transition_level_map[inc_track_name]),
+                sorted(dpd.transition_level_map[track_name]),
+            )
+            self.assertEqual(
+                sorted(inc_dpd.stable_charges[inc_track_name]),
+                sorted(dpd.stable_charges[track_name]),
+            )
+
+    def test_add_entries(self):
+        keys = list(self.parsed_defect_dict)
+        inc_dpd = IncrementalDefectPhaseDiagram(
+            {key: self.parsed_defect_dict[key] for key in keys[:-1]}, 1.0, 4.0
+        )
+        events = inc_dpd.add_entry(keys[-1], self.parsed_defect_dict[keys[-1]])
+        self.assertEqual(
+            [event["event"] for event in events], ["new_transition_level", "new_stable_charge"]
+        )
+        self.assertEqual(events[0]["charges"], (1, 0))
+        self.assertAlmostEqual(events[0]["level"], 1.3)
+        self._check_matches_dpd(inc_dpd, list(self.parsed_defect_dict.values()))
+
+    def test_from_parsed_defect_dict(self):
+        inc_dpd = IncrementalDefectPhaseDiagram.from_parsed_defect_dict(self.parsed_defect_dict)
+        self._check_matches_dpd(inc_dpd, list(self.parsed_defect_dict.values()))
+
+    def test_remove_and_replace_entries(self):
+        inc_dpd = IncrementalDefectPhaseDiagram.from_parsed_defect_dict(self.parsed_defect_dict)
+        new_entry = DefectEntry(
+            Vacancy(self.bulk, self.bulk[0], charge=-1), 9.0, parameters={"vbm": 1.0, "gap": 4.0}
+        )
+        events = inc_dpd.replace_entry("vac_2_Mg_-1", new_entry)
+        self.assertIn(
+            {"event": "removed_stable_charge", "defect": new_entry.name,
+             "track_name": "Vac_Mg_mult8@3-4-5", "charges": -1},
+            events,
+        )
+        self.assertEqual(inc_dpd.stable_charges["Vac_Mg_mult8@3-4-5"], [-2, 0])
+
+        inc_dpd.remove_entry("sub_1_Al_on_Mg_1")
+        events = inc_dpd.remove_entry("sub_1_Al_on_Mg_0")
+        self.assertEqual(events[0]["event"], "removed_stable_charge")
+        self.assertEqual(len(inc_dpd.defect_types), 2)
+
+        self._check_matches_dpd(inc_dpd, list(inc_dpd.entries))
+
+    def test_stable_track_names(self):
+        inc_dpd = IncrementalDefectPhaseDiagram.from_parsed_defect_dict(self.parsed_defect_dict)
+        track_names = list(inc_dpd.transition_level_map)
+        self.assertEqual(track_names[1], "Vac_Mg_mult8@3-4-5")
+
+        # removing an entry does not rename the other defects
+        events = inc_dpd.remove_entry("vac_1_O_2")
+        self.assertTrue(events)
+        self.assertEqual({event["track_name"] for event in events}, {track_names[0]})
+        self.assertEqual(list(inc_dpd.transition_level_map), track_names)
+        inc_dpd.add_entry("vac_1_O_2", self.parsed_defect_dict["vac_1_O_2"])
+        self.assertEqual(list(inc_dpd.transition_level_map), track_names)
+
+        # a new defect group gets a new track name
+        inc_dpd.remove_entry("sub_1_Al_on_Mg_1")
+        inc_dpd.remove_entry("sub_1_Al_on_Mg_0")
+        inc_dpd.add_entry("sub_1_Al_on_Mg_0", self.parsed_defect_dict["sub_1_Al_on_Mg_0"])
+        new_track_names = list(inc_dpd.transition_level_map)
+        self.assertEqual(new_track_names[:2], track_names[:2])
+        self.assertNotIn(new_track_names[2], track_names)
+
+        new_inc_dpd = IncrementalDefectPhaseDiagram.from_dict(inc_dpd.as_dict())
+        self.assertEqual(list(new_inc_dpd.transition_level_map), new_track_names)
+
+    def test_as_from_dict(self):
+        inc_dpd = IncrementalDefectPhaseDiagram.from_parsed_defect_dict(self.parsed_defect_dict)
+        new_inc_dpd = IncrementalDefectPhaseDiagram.from_dict(inc_dpd.as_dict())
+        self.assertEqual(new_inc_dpd._keys, list(self.parsed_defect_dict))
+        self.assertEqual(new_inc_dpd.stable_charges, inc_dpd.stable_charges)
+
+
+class DefectTableTestCase(DefectEntriesTestCase):
+    def setUp(self):
+        super().setUp()
+        for entry in self.parsed_defect_dict.values():
+            entry.corrections["charge_correction"] = 0.1 * entry.charge**2
+        self.chempots = {Element("Mg"): -3.0, Element("O"): -5.0, Element("Al"): -4.0}
+
+    def _check_matches_entries(self, table):
+        entries = list(self.parsed_defect_dict.values())
+        np.testing.assert_allclose(
+            table.formation_energies(self.chempots, fermi_level=0.7),
+            [entry.formation_energy(self.chempots, fermi_level=0.7) for entry in entries],
+        )
+        np.testing.assert_allclose(
+            table.defect_concentrations(self.chempots, temperature=1000, fermi_level=2.0),
+            [entry.defect_concentration(self.chempots, temperature=1000, fermi_level=2.0)
+             for entry in entries],
+        )
+
+    def test_from_parsed_defect_dict(self):
+        table = DefectTable.from_parsed_defect_dict(self.parsed_defect_dict)
+        self.assertEqual(len(table), 8)
+        self.assertEqual(table.elements, ["Al", "Mg", "O"])
+        self._check_matches_entries(table)
+        self.assertEqual(
+            table.formation_energies(self.chempots, fermi_level=[0.0, 1.0, 2.0]).shape, (3, 8)
+        )
+        self.assertIs(table.get_entry("vac_1_O_2"), self.parsed_defect_dict["vac_1_O_2"])
+
+    def test_chempot_arrays(self):
+        table = DefectTable.from_parsed_defect_dict(self.parsed_defect_dict)
+        chempot_arrays = {
+            Element("Mg"): np.array([-3.0, -2.0]), Element("O"): np.array([-5.0, -6.0]),
+            Element("Al"): -4.0,
+        }
+        formation_energies = table.formation_energies(chempot_arrays, fermi_level=[0.7, 1.2])
+        self.assertEqual(formation_energies.shape, (2, 8))
+        np.testing.assert_allclose(
+            formation_energies[0], table.formation_energies(self.chempots, fermi_level=0.7)
+        )
+
+    def test_solve_for_fermi_energies(self):
+        table = DefectTable.from_parsed_defect_dict(self.parsed_defect_dict)
+        energies = np.linspace(-6, 10, 3201)
+        densities = 2 * np.sqrt(np.clip(-energies, 0, None)) + np.sqrt(
+            np.clip(energies - 2, 0, None)
+        )
+        bulk_dos = Dos(0.0, energies, {Spin.up: densities})
+        bulk_dos.structure = Structure(
+            Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        )
+        fermi_dos = FermiDos(bulk_dos, bandgap=4.0)
+        fermi_dos_vbm = fermi_dos.get_cbm_vbm()[1]
+
+        chempot_arrays = {
+            Element("Mg"): np.array([-3.0, -5.0]), Element("O"): np.array([-5.0, -3.0]),
+            Element("Al"): -4.0,
+        }
+        fermi_levels = table.solve_for_fermi_energies(1000, chempot_arrays, bulk_dos)
+        self.assertEqual(fermi_levels.shape, (2,))
+        for i, fermi_level in enumerate(fermi_levels):
+            chempots = {el: mu if np.isscalar(mu) else mu[i] for el, mu in chempot_arrays.items()}
+
+            def _get_total_q(ef):
+                return np.sum(
+                    table.charges * table.defect_concentrations(chempots, 1000, ef)
+                ) + fermi_dos.get_doping(ef + fermi_dos_vbm, 1000)
+
+            self.assertAlmostEqual(fermi_level, bisect(_get_total_q, -1.0, 5.0), places=5)
+            self.assertAlmostEqual(
+                table.solve_for_fermi_energies(1000, chempots, bulk_dos), fermi_level
+            )
+
+    def test_to_from_file(self):
+        table = DefectTable.from_parsed_defect_dict(self.parsed_defect_dict)
+        with ScratchDir("."):
+            table.to_file("defects.npz", blob_dir="entries")
+            self.assertTrue(os.path.exists("entries/vac_1_O_2.json.gz"))
+            loaded_table = DefectTable.from_file("defects.npz")
+            self.assertEqual(loaded_table.keys, table.keys)
+            self.assertEqual(list(loaded_table.corrections), ["charge_correction"])
+            self._check_matches_entries(loaded_table)
+            self.assertEqual(loaded_table._entry_refs[0], os.path.abspath("entries/vac_1_O_2.json.gz"))
+            # in-memory entries are not replaced by the saved paths
+            self.assertIs(table._entry_refs[0], self.parsed_defect_dict["vac_1_O_2"])
+            # loaded entries are cached, and still referenced by path
+            parsed_defect_dict = loaded_table.to_parsed_defect_dict()
+            self.assertIs(loaded_table.get_entry("vac_1_O_2"), parsed_defect_dict["vac_1_O_2"])
+            self.assertEqual(
+                list(loaded_table.to_dataframe()["entry_ref"]), loaded_table._entry_refs
+            )
+            self.assertTrue(all(loaded_table._entry_refs))
+
+            # paths are stored relative to the table file, so the folder can be moved
+            loaded_table.to_file("campaign/defects.npz")
+            table.to_file("campaign/defects_2.npz", blob_dir="campaign/entries")
+            shutil.move("campaign", "moved_campaign")
+            for table_file in ["defects.npz", "defects_2.npz"]:
+                moved_table = DefectTable.from_file(f"moved_campaign/{table_file}")
+                entry = moved_table.get_entry("vac_1_O_2")
+                self.assertAlmostEqual(
+                    entry.formation_energy(self.chempots),
+                    self.parsed_defect_dict["vac_1_O_2"].formation_energy(self.chempots),
+                )
+
+            with self.assertRaises(ValueError):
+                table.to_file("defects.pkl")
+
+    def test_blob_filenames(self):
+        entry = self.parsed_defect_dict["vac_1_O_2"]
+        table = DefectTable.from_parsed_defect_dict({"../vac_1_O_2": entry, "vac/1": entry})
+        with ScratchDir("."):
+            table.to_file("defects.npz", blob_dir="entries")
+            self.assertEqual(sorted(os.listdir(".")), ["defects.npz", "entries"])
+            self.assertEqual(len(os.listdir("entries")), 2)  # sanitised, not written outside
+            loaded_table = DefectTable.from_file("defects.npz")
+            self.assertEqual(loaded_table.get_entry("vac/1").charge, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
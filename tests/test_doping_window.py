@@ -0,0 +1,135 @@
+import unittest
+import warnings
+
+import numpy as np
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.periodic_table import Element
+from pymatgen.core.structure import Structure
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import Dos
+
+from doped.dope_stuff import DefectTable
+from doped.doping_window import DopingWindowOptimizer
+from doped.stability_region import StabilityRegion
+
+from test_dope_stuff import DefectEntriesTestCase
+
+
+class DopingWindowOptimizerTestCase(DefectEntriesTestCase):
+    def setUp(self):
+        super().setUp()
+        formation_energies = {"Mg": 0.0, "O": 0.0, "Al": 0.0, "MgO": -6.0, "Al2O3": -17.0,
+                              "MgAl2O4": -24.5}
+        self.region = StabilityRegion("MgO", formation_energies, elements=["Al"])
+        self.elemental_refs = {"Mg": -1.5, "O": -4.9, "Al": -3.7}
+        self.chempot_limits = self.region.get_chempot_limits(self.elemental_refs)
+        self.table = DefectTable.from_parsed_defect_dict(self.parsed_defect_dict)
+        self.optimizer = DopingWindowOptimizer(self.parsed_defect_dict, self.chempot_limits)
+
+    def _formation_energy(self, defect, chempots, fermi_level):
+        return min(
+            entry.formation_energy(chempots, fermi_level=fermi_level)
+            for entry in self.parsed_defect_dict.values()
+            if entry.name == defect
+        )
+
+    def test_minimize_maximize_formation_energy(self):
+        facet_energies = {
+            facet: self._formation_energy("Sub_Al_on_Mg_mult8", chempots, 3.5)
+            for facet, chempots in self.chempot_limits["facets"].items()
+        }
+        result = self.optimizer.minimize_formation_energy("Sub_Al_on_Mg_mult8", 3.5)
+        self.assertAlmostEqual(result["objective"], min(facet_energies.values()))
+        self.assertAlmostEqual(
+            self._formation_energy("Sub_Al_on_Mg_mult8", result["chempots"], 3.5),
+            result["objective"],
+        )
+        self.assertEqual(
+            list(result["facet_weights"]), [min(facet_energies, key=facet_energies.get)]
+        )
+        self.assertIn("MgO", result["limiting_phases"])
+        # same limiting phases from the active constraints of the StabilityRegion
+        region_optimizer = DopingWindowOptimizer(
+            self.parsed_defect_dict, self.region, elemental_refs=self.elemental_refs
+        )
+        region_result = region_optimizer.minimize_formation_energy("Sub_Al_on_Mg_mult8", 3.5)
+        self.assertEqual(region_result["limiting_phases"], result["limiting_phases"])
+        self.assertAlmostEqual(region_result["objective"], result["objective"])
+        # both facets are on the MgAl2O4 face, so the facet centroid is too
+        weights = np.ones(len(self.optimizer.vertices))
+        for optimizer in [self.optimizer, region_optimizer]:
+            self.assertEqual(
+                optimizer._get_result(weights, 0.0)["limiting_phases"], ["MgAl2O4", "MgO"]
+            )
+        # interior points of the region are only limited by the host
+        delta_mu = self.region.to_full(self.region.interior_point)[0]
+        chempots = [
+            delta_mu[self.region.elements.index(el)] + self.elemental_refs[el]
+            for el in region_optimizer.elements
+        ]
+        self.assertEqual(region_optimizer._get_limiting_phases(chempots), ["MgO"])
+
+        result = self.optimizer.maximize_formation_energy("sub_1_Al_on_Mg_1", 3.5)
+        self.assertAlmostEqual(
+            result["objective"],
+            max(
+                self.parsed_defect_dict["sub_1_Al_on_Mg_1"].formation_energy(chempots, 3.5)
+                for chempots in self.chempot_limits["facets"].values()
+            ),
+        )
+        with self.assertRaises(ValueError):
+            self.optimizer.minimize_formation_energy("Int_Al", 3.5)
+
+    def test_maximize_doping_window(self):
+        compensating_defects = ["Vac_Mg_mult8", "Vac_O_mult8"]
+        result = self.optimizer.maximize_doping_window(
+            "Sub_Al_on_Mg_mult8", compensating_defects, 3.0
+        )
+
+        def _window(chempots):
+            dopant_energy = self._formation_energy("Sub_Al_on_Mg_mult8", chempots, 3.0)
+            return min(
+                self._formation_energy(defect, chempots, 3.0) - dopant_energy
+                for defect in compensating_defects
+            )
+
+        self.assertAlmostEqual(_window(result["chempots"]), result["objective"])
+        rng = np.random.default_rng(0)
+        vertices = self.optimizer.vertices
+        for weights in rng.dirichlet(np.ones(len(vertices)), size=200):
+            chempots = {Element(el): mu for el, mu in zip(self.optimizer.elements,
+                                                          weights @ vertices)}
+            self.assertLessEqual(_window(chempots), result["objective"] + 1e-8)
+
+    def test_maximize_carrier_concentration(self):
+        energies = np.linspace(-6, 10, 3201)
+        densities = 2 * np.sqrt(np.clip(-energies, 0, None)) + np.sqrt(
+            np.clip(energies - 2, 0, None)
+        )
+        bulk_dos = Dos(0.0, energies, {Spin.up: densities})
+        bulk_dos.structure = Structure(
+            Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        )
+        result = self.optimizer.maximize_carrier_concentration(
+            1000, bulk_dos, carrier_type="n", n_samples=1000, seed=0
+        )
+        self.assertAlmostEqual(
+            self.table.solve_for_fermi_energies(1000, result["chempots"], bulk_dos),
+            result["fermi_level"],
+        )
+        p_result = self.optimizer.maximize_carrier_concentration(
+            1000, bulk_dos, carrier_type="p", n_samples=1000, seed=0
+        )
+        self.assertLess(p_result["fermi_level"], result["fermi_level"])
+        with self.assertRaises(ValueError):
+            self.optimizer.maximize_carrier_concentration(1000, bulk_dos, band_gap=np.nan)
+
+        # sampled uniformly over the stability region (here a line segment between 2 facets)
+        weights = self.optimizer._sample_vertex_weights(4096, seed=0)
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+        np.testing.assert_allclose(weights.mean(axis=0), 0.5, atol=0.01)
+        self.assertGreater(np.mean(weights[:, 0] > 0.9), 0.05)  # not clustered at the centre
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import unittest
+import warnings
+
+from monty.serialization import dumpfn
+from monty.tempfile import ScratchDir
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import Structure
+from pymatgen.entries.computed_entries import ComputedStructureEntry
+
+from doped.competing_phases import CompetingPhases
+from doped.entry_providers import CachedEntryProvider, LocalEntryStore
+
+
+def _entry(structure, energy_per_atom, entry_id, e_above_hull=0.0):
+    formula = structure.composition.reduced_formula
+    return ComputedStructureEntry(
+        structure,
+        energy_per_atom * len(structure),
+        entry_id=entry_id,
+        data={
+            "pretty_formula": formula,
+            "e_above_hull": e_above_hull,
+            "band_gap": 0.0,
+            "nsites": len(structure),
+            "volume": structure.volume,
+            "icsd_id": None,
+            "formation_energy_per_atom": 0.0,
+            "energy_per_atom": energy_per_atom,
+            "energy": energy_per_atom * len(structure),
+            "total_magnetization": 0.0,
+            "nelements": len(structure.composition.elements),
+            "elements": [str(el) for el in structure.composition.elements],
+        },
+    )
+
+
+class CountingProvider:
+    def __init__(self, entries):
+        self.entries = entries
+        self.n_queries = 0
+
+    def get_entries_in_chemsys(self, elements, inc_structure=None, property_data=None):
+        self.n_queries += 1
+        return [
+            entry
+            for entry in self.entries
+            if {str(el) for el in entry.composition.elements} <= set(elements)
+        ]
+
+
+class EntryProvidersTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.entries = [
+            _entry(Structure(Lattice.cubic(3.2), ["Mg"], [[0, 0, 0]]), -1.5, "mp-1"),
+            _entry(Structure(Lattice.cubic(3.0), ["Zn"], [[0, 0, 0]]), -1.2, "mp-2"),
+            _entry(Structure(Lattice.cubic(2.9), ["Mg", "Zn"], [[0, 0, 0], [0.5, 0.5, 0.5]]),
+                   -1.4, "mp-3"),
+            _entry(Structure(Lattice.cubic(2.9), ["Mg", "Zn"], [[0, 0, 0], [0.5, 0, 0]]),
+                   -1.0, "mp-4", e_above_hull=0.4),
+        ]
+
+    def test_local_entry_store(self):
+        with ScratchDir("."):
+            store = LocalEntryStore("entry_store")
+            store.populate(CountingProvider(self.entries), ["Mg", "Zn"])
+            self.assertTrue(os.path.exists("entry_store/Mg-Zn.json.gz"))
+            self.assertEqual(
+                [entry.entry_id for entry in store.get_entries_in_chemsys(["Mg"])], ["mp-1"]
+            )
+            self.assertEqual(
+                sorted(entry.entry_id for entry in store.get_entries_in_chemsys(["Zn", "Mg"])),
+                ["mp-1", "mp-2", "mp-3", "mp-4"],
+            )
+
+            # re-adding entries replaces them, and the index persists
+            store.add_entries(self.entries[:1])
+            store = LocalEntryStore("entry_store")
+            self.assertEqual(len(store.get_entries_in_chemsys(["Mg"])), 1)
+            self.assertEqual(
+                store.get_structure_by_material_id("mp-3"), self.entries[2].structure
+            )
+            with self.assertRaises(KeyError):
+                store.get_entry_by_material_id("mp-5")
+            with self.assertRaises(ValueError):
+                store.get_bandstructure_by_material_id("mp-3")
+
+            # indexed, but missing from its chemsys file
+            dumpfn(self.entries[3:], "entry_store/Mg-Zn.json.gz")
+            with self.assertRaisesRegex(KeyError, "Mg-Zn.json.gz"):
+                store.get_entry_by_material_id("mp-3")
+
+            dumpfn(self.entries, "entries.json.gz")
+            new_store = LocalEntryStore("new_entry_store")
+            new_store.add_dump("entries.json.gz")
+            self.assertEqual(len(new_store.get_entries_in_chemsys(["Mg", "Zn"])), 4)
+
+    def test_cached_entry_provider(self):
+        provider = CountingProvider(self.entries)
+        cached_provider = CachedEntryProvider(provider, maxsize=1)
+        entries = cached_provider.get_entries_in_chemsys(["Mg", "Zn"])
+        entries.pop()
+        self.assertEqual(len(cached_provider.get_entries_in_chemsys(["Zn", "Mg"])), 4)
+        self.assertEqual(provider.n_queries, 1)
+
+        cached_provider.get_entries_in_chemsys(["Mg"])  # evicts Mg-Zn
+        cached_provider.get_entries_in_chemsys(["Mg", "Zn"])
+        self.assertEqual(provider.n_queries, 3)
+
+    def test_competing_phases_offline(self):
+        with ScratchDir("."):
+            store = LocalEntryStore("entry_store")
+            store.add_entries(self.entries)
+            cp = CompetingPhases(["Mg", "Zn"], e_above_hull=0.1, entry_provider=store)
+            self.assertEqual(len(cp.entries), 3)
+            self.assertEqual(
+                sorted(phase["formula"] for phase in cp.competing_phases), ["Mg", "MgZn", "Zn"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
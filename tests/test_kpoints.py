@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import Structure
+from pymatgen.io.vasp.inputs import Kpoints
+
+from doped import kpoints
+
+
+class KpointMeshesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.structures = [
+            Structure(Lattice.cubic(4.2), ["Mg", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]]),
+            Structure(Lattice.hexagonal(3.2, 5.2), ["Zn", "O"], [[0, 0, 0], [1 / 3, 2 / 3, 0.4]]),
+            Structure(
+                Lattice.from_parameters(5.1, 6.3, 7.9, 80, 95, 110),
+                ["Li", "Co", "O", "O"],
+                [[0, 0, 0], [0.5, 0.5, 0.5], [0.25, 0.25, 0.25], [0.75, 0.7, 0.8]],
+            ),
+        ]
+
+    def test_reciprocal_density_matches_pymatgen(self):
+        for density in [5, 45, 64, 95]:
+            meshes = kpoints.get_kpoint_meshes(self.structures, reciprocal_density=density)
+            for structure, mesh in zip(self.structures, meshes["meshes"]):
+                expected = Kpoints.automatic_density_by_vol(structure, density, True).kpts[0]
+                self.assertEqual(list(mesh), list(expected))
+
+        # per-structure densities
+        meshes = kpoints.get_kpoint_meshes(
+            [self.structures[0]] * 3, reciprocal_density=[5, 45, 95]
+        )["meshes"]
+        self.assertEqual(len(meshes), 3)
+        self.assertTrue(np.all(np.diff(meshes[:, 0]) >= 0))
+
+    def test_kspacing(self):
+        meshes = kpoints.get_kpoint_meshes([Lattice.cubic(5.0)], kspacing=0.3)["meshes"]
+        self.assertEqual(list(meshes[0]), [5, 5, 5])  # ceil(2 pi / (5 * 0.3))
+        with self.assertRaises(ValueError):
+            kpoints.get_kpoint_meshes(self.structures, reciprocal_density=5, kspacing=0.3)
+
+    def test_nkred_eligible_and_cache(self):
+        self.assertTrue(kpoints.is_nkred_eligible([4, 4, 6]))
+        self.assertFalse(kpoints.is_nkred_eligible([4, 4, 3]))
+        self.assertFalse(kpoints.is_nkred_eligible([2, 2, 2]))
+        meshes = kpoints.get_kpoint_meshes([np.eye(3) * 5.0], kspacing=0.3)
+        self.assertTrue(meshes["nkred_eligible"][0] == kpoints.is_nkred_eligible([5, 5, 5]))
+        self.assertIn(
+            ("kspacing", np.round(np.eye(3) * 5.0, 6).tobytes(), 1, 0.3),
+            kpoints._kpoint_mesh_cache,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
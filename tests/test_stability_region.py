@@ -0,0 +1,102 @@
+import unittest
+import warnings
+
+import numpy as np
+from pymatgen.analysis.phase_diagram import PDEntry, PhaseDiagram
+from pymatgen.core.composition import Composition
+from pymatgen.core.periodic_table import Element
+
+from doped.stability_region import StabilityRegion, _get_simplices
+
+
+class StabilityRegionTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.formation_energies = {
+            "Mg": 0.0, "Al": 0.0, "O": 0.0, "Li": 0.0, "MgO": -6.0, "Mg2O2": -11.0,
+            "MgO2": -5.5, "Al2O3": -17.0, "MgAl2O4": -24.5, "LiAlO2": -12.5, "Li2O": -6.2,
+            "Li2O2": -6.5, "LiAl": -0.6, "Mg2Al3": -1.0,
+        }
+
+    def _check_matches_phase_diagram(self, region, host):
+        elements = set(region.elements)
+        entries = [
+            PDEntry(Composition(formula), energy)
+            for formula, energy in self.formation_energies.items()
+            if {str(el) for el in Composition(formula).elements}.issubset(elements)
+        ]
+        chempots = PhaseDiagram(entries).get_all_chempots(Composition(host))
+        expected = np.unique(
+            np.round([[c[Element(el)] for el in region.elements] for c in chempots.values()], 6),
+            axis=0,
+        )
+        np.testing.assert_allclose(
+            np.unique(np.round(region.vertices, 6), axis=0), expected, atol=1e-6
+        )
+
+    def test_host_region(self):
+        region = StabilityRegion("MgAl2O4", self.formation_energies)
+        self.assertEqual(region.elements, ["Mg", "Al", "O"])
+        self._check_matches_phase_diagram(region, "MgAl2O4")
+        self.assertTrue(all(region.contains(region.vertices)))
+        self.assertFalse(region.contains([[0.0, 0.0, -24.5 / 4]])[0])
+
+        self.assertEqual(region.get_limiting_phases(region.vertices), region.limiting_phases)
+        self.assertEqual(region.get_limiting_phases(region.to_full(region.interior_point)), [()])
+
+        facets = region.get_facets()
+        self.assertIn("MgAl2O4-Al-Mg2Al3", facets)
+        chempot_limits = region.get_chempot_limits({"Mg": -1.5, "Al": -3.7, "O": -4.9})
+        self.assertAlmostEqual(
+            chempot_limits["facets"]["MgAl2O4-Al-Mg2Al3"][Element("Al")], -3.7
+        )
+
+    def test_add_species(self):
+        host_region = StabilityRegion("MgO", self.formation_energies)
+        self._check_matches_phase_diagram(host_region, "MgO")
+        region = host_region.add_species("Al").add_species("Li")
+        self.assertEqual(host_region.elements, ["Mg", "O"])  # unchanged
+        self.assertEqual(region.elements, ["Mg", "O", "Al", "Li"])
+        self._check_matches_phase_diagram(region, "MgO")
+
+        region = StabilityRegion("MgO", self.formation_energies, elements=["Li"])
+        self._check_matches_phase_diagram(region, "MgO")
+
+    def test_sample(self):
+        region = StabilityRegion("MgO", self.formation_energies, elements=["Al"])
+        for method in ["sobol", "uniform"]:
+            points = region.sample(1000, method=method, seed=0)
+            self.assertEqual(points.shape, (1000, 3))
+            self.assertTrue(all(region.contains(points)))
+            np.testing.assert_allclose(points[:, :2].sum(axis=1), -6.0)  # on the MgO plane
+        np.testing.assert_allclose(region.sample(10, seed=1), region.sample(10, seed=1))
+
+        face_points = region.sample(100, on_faces=True, seed=0)
+        self.assertEqual(face_points.shape, (100, 3))
+        self.assertTrue(all(region.contains(face_points)))
+        self.assertFalse(any(region.contains(face_points, tol=-1e-6)))
+
+        chempots = region.get_chempots(points, {"Mg": -1.5, "O": -4.9, "Al": -3.7})
+        np.testing.assert_allclose(chempots[Element("Al")], points[:, 2] - 3.7)
+
+        # uniform over the region: mean of the points is its centroid (not the vertex mean)
+        region = StabilityRegion("MgAl2O4", self.formation_energies)
+        points = region.to_reduced(region.sample(20000, seed=0))
+        vertices = region._reduced_polytope_vertices
+        simplices, volumes = _get_simplices(vertices)
+        centroid = (vertices[simplices].mean(axis=1) * volumes[:, None]).sum(axis=0) / (
+            volumes.sum()
+        )
+        np.testing.assert_allclose(points.mean(axis=0), centroid, atol=0.02)
+
+        region._reduced_polytope_vertices = np.array([[0.0, 0.0], [-1.0, -1.0], [-2.0, -2.0]])
+        with self.assertRaises(ValueError):  # zero volume
+            region.sample(10)
+
+    def test_unstable_host(self):
+        with self.assertRaises(ValueError):
+            StabilityRegion("MgO2", self.formation_energies)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,330 @@
+import os
+import unittest
+import warnings
+
+from monty.serialization import loadfn
+from monty.tempfile import ScratchDir
+from pymatgen.core import SETTINGS
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import PeriodicSite, Structure
+from pymatgen.io.vasp.inputs import Incar, Kpoints
+
+from doped import vasp_input
+from doped.pycdt.utils import vasp
+from doped.pycdt.utils.parse_calculations import get_defect_transformation
+from doped.pycdt.utils.vasp import (
+    DefectRelaxSet,
+    load_transformation_manifest,
+    write_transformation_manifest,
+)
+
+# minimal (fake) POTCAR, with only the header data parsed by pymatgen
+FAKE_POTCAR = """  PAW_PBE {symbol} 06Sep2000
+ {zval}
+ parameters from PSCTR are:
+   VRHFIN ={element}: s p
+   LEXCH  = PE
+   EATOM  =   100.0000 eV,   10.0000 Ry
+
+   TITEL  = PAW_PBE {symbol} 06Sep2000
+   LULTRA =        F    use ultrasoft PP ?
+   IUNSCR =        1    unscreen: 0-lin 1-nonlin 2-no
+   RPACOR =    1.000    partial core radius
+   POMASS =   22.990; ZVAL   =    {zval}    mass and valenz
+   RCORE  =    2.200    outmost cutoff radius
+   ENMAX  =  250.000; ENMIN  =  200.000 eV
+ END of PSCTR-controll parameters
+ End of Dataset
+"""
+
+
+class VaspInputTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings("ignore")
+        self.structure = Structure(
+            Lattice.cubic(5.6), ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        ) * (2, 2, 2)
+        self.structure.remove_sites([0])
+
+    def test_get_potcar_dict(self):
+        potcar_settings = {"POTCAR_FUNCTIONAL": "PBE_54", "POTCAR": {"Na": "Na_sv"}}
+        potcar_dict = vasp_input._get_potcar_dict(potcar_settings)
+        self.assertEqual(potcar_dict["POTCAR_FUNCTIONAL"], "PBE_54")
+        self.assertEqual(potcar_dict["POTCAR"]["Na"], "Na_sv")
+        self.assertEqual(potcar_dict["POTCAR"]["Cl"], "Cl")
+        # neither the user settings nor the defaults are modified
+        self.assertEqual(potcar_settings["POTCAR"], {"Na": "Na_sv"})
+        self.assertEqual(vasp_input.default_potcar_dict["POTCAR"]["Na"], "Na_pv")
+
+    def _set_up_fake_psp_dir(self):
+        for symbol, element, zval in [("Na_pv", "Na", "7.000"), ("Cl", "Cl", "7.000")]:
+            os.makedirs(f"psp/POT_GGA_PAW_PBE/{symbol}")
+            with open(f"psp/POT_GGA_PAW_PBE/{symbol}/POTCAR", "w") as f:
+                f.write(FAKE_POTCAR.format(symbol=symbol, element=element, zval=zval))
+        psp_dir = SETTINGS.get("PMG_VASP_PSP_DIR")
+        SETTINGS["PMG_VASP_PSP_DIR"] = os.path.abspath("psp")
+        vasp_input._get_potcar.cache_clear()
+
+        def _reset_psp_dir():
+            vasp_input._get_potcar.cache_clear()
+            if psp_dir is None:
+                SETTINGS.pop("PMG_VASP_PSP_DIR")
+            else:
+                SETTINGS["PMG_VASP_PSP_DIR"] = psp_dir
+
+        self.addCleanup(_reset_psp_dir)
+
+    def test_cached_potcar_and_nelect(self):
+        with ScratchDir("."):
+            self._set_up_fake_psp_dir()
+            potcar_dict = vasp_input._get_potcar_dict()
+            for charge in [0, -1, 2]:
+                defect_relax_set = DefectRelaxSet(
+                    self.structure,
+                    charge=charge,
+                    user_potcar_settings=potcar_dict["POTCAR"],
+                    user_potcar_functional=potcar_dict["POTCAR_FUNCTIONAL"],
+                )
+                nelect = vasp_input._write_potcar(defect_relax_set, "POTCAR")
+                self.assertEqual(nelect, defect_relax_set.nelect)
+                with open("POTCAR") as f:
+                    self.assertEqual(f.read(), str(defect_relax_set.potcar))
+            self.assertEqual(vasp_input._get_potcar.cache_info().misses, 1)
+
+            single_defect_dict = {
+                "Defect Structure": self.structure,
+                "Transformation Dict": {"charge": -1},
+            }
+            vasp_input.vasp_gam_files(single_defect_dict, input_dir="v_Na_-1")
+            incar = Incar.from_file("v_Na_-1/vasp_gam/INCAR")
+            self.assertEqual(incar["NELECT"], 106)
+
+    def test_write_defect_campaign(self):
+        defect_input_dict = {
+            f"vac_1_Na_{charge}": {
+                "Defect Structure": self.structure,
+                "POSCAR Comment": f"vac_1_Na_{charge}",
+                "Transformation Dict": {"charge": charge},
+            }
+            for charge in [-1, 0]
+        }
+        kpoints_settings = {"kpoints": [[3, 3, 3]]}
+        with ScratchDir("."):
+            self._set_up_fake_psp_dir()
+            report = vasp_input.write_defect_campaign(
+                defect_input_dict, output_path="campaign", kpoints_settings=kpoints_settings
+            )
+            self.assertEqual(len(report["created"]), 2 * (4 + 3 + 3))
+            self.assertEqual(report["changed"], [])
+            self.assertEqual(kpoints_settings, {"kpoints": [[3, 3, 3]]})  # not modified
+
+            # same files as from the single-defect functions
+            for defect_folder, single_defect_dict in defect_input_dict.items():
+                vasp_input.vasp_gam_files(single_defect_dict, input_dir=defect_folder)
+                for vasp_files in [vasp_input.vasp_std_files, vasp_input.vasp_ncl_files]:
+                    vasp_files(
+                        single_defect_dict,
+                        input_dir=defect_folder,
+                        kpoints_settings=kpoints_settings,
+                    )
+            for path in report["created"]:
+                with open(os.path.join("campaign", path)) as f1, open(path) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+            manifest = loadfn("campaign/defect_campaign_manifest.json")
+            self.assertEqual(sorted(manifest), sorted(report["created"]))
+
+            # only the vasp_std INCARs change, and a dry run doesn't write them
+            potcar_mtime = os.path.getmtime("campaign/vac_1_Na_0/vasp_std/POTCAR")
+            incar_settings = {"vasp_std": {"KPAR": 4}}
+            dry_run_report = vasp_input.write_defect_campaign(
+                defect_input_dict,
+                output_path="campaign",
+                kpoints_settings=kpoints_settings,
+                incar_settings=incar_settings,
+                dry_run=True,
+            )
+            self.assertEqual(
+                dry_run_report["changed"],
+                ["vac_1_Na_-1/vasp_std/INCAR", "vac_1_Na_0/vasp_std/INCAR"],
+            )
+            self.assertEqual(dry_run_report["created"], [])
+            self.assertEqual(Incar.from_file("campaign/vac_1_Na_0/vasp_std/INCAR")["KPAR"], 2)
+
+            report = vasp_input.write_defect_campaign(
+                defect_input_dict,
+                output_path="campaign",
+                kpoints_settings=kpoints_settings,
+                incar_settings=incar_settings,
+            )
+            self.assertEqual(report, dry_run_report)
+            self.assertEqual(Incar.from_file("campaign/vac_1_Na_0/vasp_std/INCAR")["KPAR"], 4)
+            self.assertEqual(Incar.from_file("campaign/vac_1_Na_0/vasp_gam/INCAR")["NCORE"], 12)
+            self.assertEqual(
+                os.path.getmtime("campaign/vac_1_Na_0/vasp_std/POTCAR"), potcar_mtime
+            )
+
+            # hand edits which keep the file size are still regenerated
+            with open("campaign/vac_1_Na_0/vasp_gam/INCAR") as f:
+                incar_string = f.read()
+            with open("campaign/vac_1_Na_0/vasp_gam/INCAR", "w") as f:
+                f.write(incar_string.replace("NCORE = 12", "NCORE = 16"))
+            report = vasp_input.write_defect_campaign(
+                defect_input_dict,
+                output_path="campaign",
+                kpoints_settings=kpoints_settings,
+                incar_settings=incar_settings,
+            )
+            self.assertEqual(report["changed"], ["vac_1_Na_0/vasp_gam/INCAR"])
+            self.assertEqual(Incar.from_file("campaign/vac_1_Na_0/vasp_gam/INCAR")["NCORE"], 12)
+
+            with self.assertRaises(ValueError):
+                vasp_input.write_defect_campaign(defect_input_dict, stages=["vasp_tst"])
+
+    def test_transformation_manifest(self):
+        vac_site = self.structure[0]
+        transformations = {
+            f"vac_1_Na_{charge}": {
+                "defect_type": "vac_1_Na",
+                "defect_site": PeriodicSite("Na", [0, 0, 0], Lattice.cubic(5.6)),
+                "defect_supercell_site": vac_site,
+                "defect_multiplicity": 1,
+                "charge": charge,
+                "supercell": [2, 2, 2],
+            }
+            for charge in [-1, 0]
+        }
+        transformations["bulk"] = {"defect_type": "bulk", "supercell": [2, 2, 2]}
+        with ScratchDir("."):
+            write_transformation_manifest(transformations, "transformation_manifest.json")
+            manifest = loadfn("transformation_manifest.json")
+            self.assertEqual(len(manifest["lattices"]), 2)  # unique lattices only
+            loaded = load_transformation_manifest("transformation_manifest.json")
+            self.assertIs(loaded, load_transformation_manifest("transformation_manifest.json"))
+            self.assertEqual(loaded.keys(), transformations.keys())
+            self.assertEqual(loaded["bulk"], transformations["bulk"])
+            self.assertEqual(loaded["vac_1_Na_-1"]["charge"], -1)
+            self.assertEqual(loaded["vac_1_Na_0"]["defect_supercell_site"], vac_site)
+
+            # looked up from the defect folder, or a sub-folder of it
+            tf, path = get_defect_transformation("vac_1_Na_0/vasp_std")
+            self.assertEqual(tf["charge"], 0)
+            self.assertEqual(path, os.path.abspath("transformation_manifest.json"))
+            self.assertEqual(get_defect_transformation("vac_2_Na_0"), (None, None))
+
+            # returned dicts are copies, so the cached manifest is not modified
+            tf["charge"] = 1
+            self.assertEqual(get_defect_transformation("vac_1_Na_0")[0]["charge"], 0)
+
+            # a modified manifest is re-read, and the earlier version dropped
+            transformations["vac_1_Na_0"]["defect_multiplicity"] = 2
+            write_transformation_manifest(transformations, "transformation_manifest.json")
+            mtime = os.path.getmtime("transformation_manifest.json") + 1
+            os.utime("transformation_manifest.json", (mtime, mtime))
+            reloaded = load_transformation_manifest("transformation_manifest.json")
+            self.assertEqual(reloaded["vac_1_Na_0"]["defect_multiplicity"], 2)
+            self.assertEqual(
+                [key for key in vasp._transformation_manifests
+                 if key[0] == os.path.abspath("transformation_manifest.json")],
+                [(os.path.abspath("transformation_manifest.json"), mtime)],
+            )
+
+    def test_vasp_std_to_ncl(self):
+        ibzkpt = "Automatically generated mesh\n2\nReciprocal lattice\n0 0 0 1\n0.5 0 0 7\n"
+        with ScratchDir("."):
+            for defect_folder in ["vac_1_Na_0", "vac_1_Na_-1"]:
+                os.makedirs(f"{defect_folder}/vasp_std")
+                self.structure.to(fmt="poscar", filename=f"{defect_folder}/vasp_std/CONTCAR")
+                for filename, contents in [
+                    ("IBZKPT", ibzkpt),
+                    ("CHGCAR", "chg"),
+                    ("POTCAR", "pot"),
+                ]:
+                    with open(f"{defect_folder}/vasp_std/{filename}", "w") as f:
+                        f.write(contents)
+            with open("vac_1_Na_0/vasp_std/OUTCAR", "w") as f:
+                f.write(" General timing and accounting informations for this job:\n")
+            Incar({"ISYM": 0}).write_file("vac_1_Na_0/vasp_std/INCAR")
+            os.makedirs("vac_1_Na_0/vasp_ncl")
+            Incar({"ISYM": 0, "LSORBIT": True}).write_file("vac_1_Na_0/vasp_ncl/INCAR")
+
+            report = vasp_input.vasp_std_to_ncl()
+            self.assertEqual(report["handed_off"], ["vac_1_Na_0"])
+            self.assertEqual(report["unfinished"], ["vac_1_Na_-1"])
+            self.assertFalse(os.path.exists("vac_1_Na_-1/vasp_ncl"))
+
+            kpoints = Kpoints.from_file("vac_1_Na_0/vasp_ncl/KPOINTS")
+            self.assertEqual(kpoints.num_kpts, 2)
+            self.assertEqual(kpoints.kpts_weights, [1, 7])
+            self.assertEqual(
+                Structure.from_file("vac_1_Na_0/vasp_ncl/POSCAR"), self.structure
+            )
+            self.assertFalse(  # copied, as vasp_ncl would write to CHGCAR
+                os.path.samefile("vac_1_Na_0/vasp_ncl/CHGCAR", "vac_1_Na_0/vasp_std/CHGCAR")
+            )
+            self.assertTrue(os.path.exists("vac_1_Na_0/vasp_ncl/POTCAR"))
+            self.assertFalse(os.path.exists("vac_1_Na_0/vasp_ncl/WAVECAR"))  # not in vasp_std
+
+            # resumed from the state file, and only hard linked if LWAVE and LCHARG are off
+            os.makedirs("vac_1_Na_-1/vasp_ncl")
+            Incar({"LWAVE": False, "LCHARG": False}).write_file("vac_1_Na_-1/vasp_ncl/INCAR")
+            with open("vac_1_Na_-1/vasp_std/OUTCAR", "w") as f:
+                f.write(" General timing and accounting informations for this job:\n")
+            report = vasp_input.vasp_std_to_ncl(link=True)
+            self.assertEqual(report["handed_off"], ["vac_1_Na_-1"])
+            self.assertEqual(report["unchanged"], ["vac_1_Na_0"])
+            self.assertTrue(
+                os.path.samefile("vac_1_Na_-1/vasp_ncl/CHGCAR", "vac_1_Na_-1/vasp_std/CHGCAR")
+            )
+
+            # handed-off files aren't regenerated by write_defect_campaign
+            self._set_up_fake_psp_dir()
+            defect_input_dict = {
+                "vac_1_Na_0": {
+                    "Defect Structure": self.structure,
+                    "Transformation Dict": {"charge": 0},
+                }
+            }
+            with open("vac_1_Na_0/vasp_ncl/KPOINTS") as f:
+                kpoints_string = f.read()
+            report = vasp_input.write_defect_campaign(defect_input_dict, stages=("vasp_ncl",))
+            self.assertEqual(
+                report["skipped"], ["vac_1_Na_0/vasp_ncl/KPOINTS", "vac_1_Na_0/vasp_ncl/POTCAR"]
+            )
+            with open("vac_1_Na_0/vasp_ncl/KPOINTS") as f:
+                self.assertEqual(f.read(), kpoints_string)
+
+    def test_vasp_std_to_ncl_symmetry(self):
+        ibzkpt = "Automatically generated mesh\n2\nReciprocal lattice\n0 0 0 1\n0.5 0 0 7\n"
+        std_incar = {"LHFCALC": True}  # ISYM = 3 by default
+        ncl_incars = {
+            "Na_EaH_0": {"LHFCALC": True, "ISYM": 0},  # as from vasp_ncl_chempot()
+            "Na2O_EaH_0": {"LHFCALC": True, "MAGMOM": [0, 0, 1] * 3},
+            "NaO2_EaH_0": {"LHFCALC": True},
+        }
+        with ScratchDir("."):
+            for folder, ncl_incar in ncl_incars.items():
+                os.makedirs(f"{folder}/vasp_std")
+                os.makedirs(f"{folder}/vasp_ncl")
+                self.structure.to(fmt="poscar", filename=f"{folder}/vasp_std/CONTCAR")
+                with open(f"{folder}/vasp_std/IBZKPT", "w") as f:
+                    f.write(ibzkpt)
+                with open(f"{folder}/vasp_std/OUTCAR", "w") as f:
+                    f.write(" General timing and accounting informations for this job:\n")
+                Incar(std_incar).write_file(f"{folder}/vasp_std/INCAR")
+                Incar(ncl_incar).write_file(f"{folder}/vasp_ncl/INCAR")
+
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                report = vasp_input.vasp_std_to_ncl()
+            self.assertEqual(report["handed_off"], sorted(ncl_incars))
+            self.assertEqual(len([x for x in w if "IBZKPT" in str(x.message)]), 2)
+            self.assertFalse(os.path.exists("Na_EaH_0/vasp_ncl/KPOINTS"))
+            self.assertFalse(os.path.exists("Na2O_EaH_0/vasp_ncl/KPOINTS"))
+            self.assertEqual(Kpoints.from_file("NaO2_EaH_0/vasp_ncl/KPOINTS").num_kpts, 2)
+            state = loadfn(vasp_input.VASP_STD_TO_NCL_STATE)
+            self.assertEqual(state["Na_EaH_0"]["files"], ["POSCAR"])
+            self.assertIn("KPOINTS", state["NaO2_EaH_0"]["files"])
+
+
+if __name__ == "__main__":
+    unittest.main()